@@ -1,20 +1,49 @@
 #----------------------------------------------------------------------------#
 # Imports
 #----------------------------------------------------------------------------#
+import hashlib
 import json
+import click
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, g, session, jsonify, \
+  stream_with_context
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.sql import func, and_
+from sqlalchemy import event, DDL
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.sql import func, and_, or_, literal_column
+from sqlalchemy.sql.expression import FunctionElement
+from sqlalchemy.ext.compiler import compiles
 from flask_migrate import Migrate
+from functools import wraps
 import logging
+import os
 import sys
+import threading
 import time
+from datetime import timedelta
+from itertools import groupby
 from logging import Formatter, FileHandler
 from flask_wtf import FlaskForm
 from forms import *
+from search import SearchIndex, document_fields, to_tsquery_text, tokenize
+from pagination import keyset_page
+from cache import make_cache
+from formatting import DateFormatter
+from instrumentation import SQLInstrumentation, query_budget
+from compression import Compression, matching_etag
+from importer import read_rows, run_import, Checkpoint, ImportReport
+from export import FORMATS as EXPORT_FORMATS, merge_genres, csv_chunks, jsonl_chunks, encoded
+from routing import RoutingSQLAlchemy, read_only, primary
+from rollover import RolloverMetrics, RolloverWorker
+from booking import BookingIndex, validate_schedule
+from geo import Geocoder, SEARCH_STEPS, encode, distance_km, search_radii, search_ranges
+from readmodels import VenueDetail, ArtistDetail, VenueFormData, ArtistFormData, \
+  VENUE_COLUMNS, ARTIST_COLUMNS, model_columns, read_model
+from werkzeug.datastructures import MultiDict
+from collections import Counter
 
 #----------------------------------------------------------------------------#
 # App Config.
@@ -22,8 +51,10 @@ from forms import *
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+db = RoutingSQLAlchemy(app)
 migrate = Migrate(app, db)
+instrumentation = SQLInstrumentation(app)
+compression = Compression(app)
 
 
 #----------------------------------------------------------------------------#
@@ -31,6 +62,11 @@ migrate = Migrate(app, db)
 #----------------------------------------------------------------------------#
 class Venue(db.Model):
     __tablename__ = 'venue'
+    __table_args__ = (
+        db.Index('ix_venue_city_state', 'city', 'state'),
+        # covers the distance search, see venues_near()
+        db.Index('ix_venue_geohash', 'geohash', 'latitude', 'longitude', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -38,50 +74,991 @@ class Venue(db.Model):
     state = db.Column(db.String(120))
     address = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean)
     seeking_description = db.Column(db.String)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    # see geo.py
+    geohash = db.Column(db.BigInteger)
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     shows = db.relationship('Show', backref='venue', lazy=True, cascade='all, delete-orphan')
+    genre_rows = db.relationship('VenueGenre', lazy='selectin', cascade='all, delete-orphan')
+    genres = association_proxy('genre_rows', 'genre', creator=lambda genre: VenueGenre(genre=genre))
 
 class Artist(db.Model):
     __tablename__ = 'artist'
-
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean)
     seeking_description = db.Column(db.String)
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     shows = db.relationship('Show', backref='artist', lazy=True, cascade='all, delete-orphan')
+    genre_rows = db.relationship('ArtistGenre', lazy='selectin', cascade='all, delete-orphan')
+    genres = association_proxy('genre_rows', 'genre', creator=lambda genre: ArtistGenre(genre=genre))
 
 class Show(db.Model):
     __tablename__ = 'show'
+    __table_args__ = (
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_show_start_time_id', 'start_time', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'), nullable=False)
     artist_id = db.Column(db.Integer, db.ForeignKey('artist.id'), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+    # start_time after the rollover watermark, see rollover.py
+    is_upcoming = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+
+# the listings' sort keys, NULLs as '' like pagination.sort_key
+db.Index('ix_venue_area_key', func.coalesce(Venue.city, ''), func.coalesce(Venue.state, ''),
+    func.coalesce(Venue.name, ''), Venue.id)
+db.Index('ix_artist_name_key', func.coalesce(Artist.name, ''), Artist.id)
+
+# PostgreSQL's search columns and indexes, see search.py and the search migrations
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(city, '') || ' ' || coalesce(state, '')), 'B')")
+for searchable in (Venue, Artist):
+    event.listen(searchable.__table__, 'before_create',
+        DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+    for statement in (
+            'ALTER TABLE {0} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({1}) STORED',
+            'CREATE INDEX ix_{0}_search_vector ON {0} USING gin (search_vector)',
+            'CREATE INDEX ix_{0}_name_trgm ON {0} USING gin (name gin_trgm_ops)'):
+        event.listen(searchable.__table__, 'after_create', DDL(
+            statement.format(searchable.__tablename__, SEARCH_VECTOR)
+            ).execute_if(dialect='postgresql'))
+
+# one show at a time per venue and per artist, see booking.py
+event.listen(Show.__table__, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS btree_gist').execute_if(dialect='postgresql'))
+for booked_fk in ('venue_id', 'artist_id'):
+    event.listen(Show.__table__, 'after_create', DDL(
+        'ALTER TABLE show ADD CONSTRAINT ex_show_{0}_booking '
+        'EXCLUDE USING gist ({0} WITH =, tsrange(start_time, end_time) WITH &&)'.format(booked_fk)
+        ).execute_if(dialect='postgresql'))
+
+class VenueGenre(db.Model):
+    __tablename__ = 'venue_genre'
+    venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'), primary_key=True)
+    genre = db.Column(db.String(120), primary_key=True, index=True)
+
+class ArtistGenre(db.Model):
+    __tablename__ = 'artist_genre'
+    artist_id = db.Column(db.Integer, db.ForeignKey('artist.id'), primary_key=True)
+    genre = db.Column(db.String(120), primary_key=True, index=True)
+
+class ShowRollover(db.Model):
+    # single row: the upcoming show counters count shows after `rolled_until`
+    __tablename__ = 'show_rollover'
+    id = db.Column(db.Integer, primary_key=True)
+    rolled_until = db.Column(db.DateTime, nullable=False)
+
+class DataVersion(db.Model):
+    # single row: bumped by writes that bypass the mapper events, see sync_data_version
+    __tablename__ = 'data_version'
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
 
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
+date_formatter = DateFormatter()
+
 def format_datetime(value, format='medium'):
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(value, format)
+  return date_formatter.format(value, format)
 app.jinja_env.filters['datetime'] = format_datetime
 
 
+#----------------------------------------------------------------------------#
+# Response cache.
+#----------------------------------------------------------------------------#
+response_cache = make_cache(app.config)
+
+def cached(view):
+  # caches the rendered page of a GET view under its path and query string;
+  # views name the rows they read with cache_tag()
+  @wraps(view)
+  def wrapper(*args, **kwargs):
+    # pages rendered with pending flash messages are one-offs
+    if request.method != 'GET' or session.get('_flashes'):
+      return view(*args, **kwargs)
+
+    key = 'page:' + request.full_path
+    entry = response_cache.get(key)
+    if entry is None:
+      g.cache_tags = set()
+      page = view(*args, **kwargs)
+      if not isinstance(page, str):
+        return page
+      entry = { 'page': page, 'etag': hashlib.sha1(page.encode()).hexdigest() }
+      # a replica read right after a write may be stale, it is not kept
+      if not db.replica_may_lag():
+        response_cache.set(key, entry, g.cache_tags)
+    return page_response(entry)
+  return wrapper
+
+def page_response(entry):
+  # a cached page stays cached until a write to one of its rows invalidates
+  # it, so its ETag changes exactly when the data does; clients that have
+  # it get a 304 without rendering anything
+  etag = matching_etag(entry['etag'])
+  compression.stats.page(etag is not None)
+  if etag is not None:
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+  response = Response(entry['page'], mimetype='text/html')
+  response.set_etag(entry['etag'])
+  return response
+
+def cache_tag(*tags):
+  if 'cache_tags' in g:
+    g.cache_tags.update(tags)
+
+def written_tags(session, *tags):
+  session.info.setdefault('cache_tags', set()).update(tags)
+
+@event.listens_for(Venue, 'after_insert')
+@event.listens_for(Venue, 'after_update')
+@event.listens_for(Venue, 'after_delete')
+def venue_written(mapper, connection, target):
+  written_tags(object_session(target), 'venues', 'venue:{}'.format(target.id))
+
+@event.listens_for(Artist, 'after_insert')
+@event.listens_for(Artist, 'after_update')
+@event.listens_for(Artist, 'after_delete')
+def artist_written(mapper, connection, target):
+  written_tags(object_session(target), 'artists', 'artist:{}'.format(target.id))
+
+@event.listens_for(Show, 'after_insert')
+@event.listens_for(Show, 'after_update')
+@event.listens_for(Show, 'after_delete')
+def show_written(mapper, connection, target):
+  written_tags(object_session(target), 'shows',
+    'venue:{}'.format(target.venue_id), 'artist:{}'.format(target.artist_id))
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_written(session):
+  tags = session.info.pop('cache_tags', None)
+  if tags:
+    response_cache.invalidate(*tags)
+
+@event.listens_for(Session, 'after_rollback')
+def forget_written(session):
+  session.info.pop('cache_tags', None)
+
+
+#----------------------------------------------------------------------------#
+# Upcoming show counters.
+#----------------------------------------------------------------------------#
+COUNTED = ((Venue, Show.venue_id), (Artist, Show.artist_id))
+
+def rolled_until(connection, for_update=False):
+  query = db.select([ShowRollover.rolled_until])
+  if for_update:
+    query = query.with_for_update()
+  watermark = connection.execute(query).scalar()
+  if watermark is None:
+    watermark = datetime.now()
+    connection.execute(ShowRollover.__table__.insert().values(id=1, rolled_until=watermark))
+  return watermark
+
+def adjust_upcoming(connection, show, delta):
+  for model, show_fk in COUNTED:
+    connection.execute(model.__table__.update().where(
+      model.id == getattr(show, show_fk.key)
+      ).values(num_upcoming_shows=model.num_upcoming_shows + delta))
+
+@event.listens_for(Show, 'before_insert')
+def flag_upcoming_show(mapper, connection, target):
+  target.is_upcoming = target.start_time > rolled_until(connection)
+
+@event.listens_for(Show, 'after_insert')
+def count_upcoming_show(mapper, connection, target):
+  if target.is_upcoming:
+    adjust_upcoming(connection, target, 1)
+
+@event.listens_for(Show, 'after_delete')
+def uncount_upcoming_show(mapper, connection, target):
+  if target.is_upcoming:
+    adjust_upcoming(connection, target, -1)
+
+def shows_between(show_fk, model, start, end):
+  # correlated count of `model`'s shows starting in (start, end], open ended without `end`
+  conditions = [show_fk == model.id, Show.start_time > start]
+  if end is not None:
+    conditions.append(Show.start_time <= end)
+  return db.select([func.count(Show.id)]).where(and_(*conditions)).as_scalar()
+
+rollover_metrics = RolloverMetrics()
+
+def roll_forward_upcoming(now=None, batch_size=None, dry_run=False):
+  '''
+  Moves shows that started since the last roll from upcoming to past, about
+  `batch_size` shows per transaction, and returns how many moved. A dry run
+  counts them and changes nothing.
+  '''
+  now = now or datetime.now()
+  batch_size = batch_size or app.config['ROLLOVER_BATCH_SIZE']
+  started = time.perf_counter()
+  watermark = rolled_until(db.session.connection())
+  # the watermark only moves when shows roll, the lag counts from the first
+  # show waiting to roll
+  waiting_since = db.session.query(func.min(Show.start_time)).filter(
+    Show.start_time > watermark,
+    Show.start_time <= now
+    ).scalar()
+  lag = max((now - waiting_since).total_seconds(), 0) if waiting_since else 0
+
+  rolled = 0
+  batches = 0
+  while watermark < now:
+    if not dry_run:
+      # every process runs a worker: they take turns on the watermark row,
+      # and a batch another one rolled meanwhile is not rolled again
+      watermark = rolled_until(db.session.connection(), for_update=True)
+      if watermark >= now:
+        break
+    # a batch ends at its last show's start time, shows starting at the same
+    # time always roll together
+    batch_end = db.session.query(Show.start_time).filter(
+      Show.start_time > watermark,
+      Show.start_time <= now
+      ).order_by(Show.start_time).offset(batch_size - 1).limit(1).scalar() or now
+    passed = and_(Show.start_time > watermark, Show.start_time <= batch_end)
+    shows = db.session.query(Show.venue_id, Show.artist_id).filter(passed).all()
+    if not shows:
+      # nothing started: no write, no invalidated pages
+      break
+
+    if not dry_run:
+      connection = db.session.connection()
+      for model, show_fk in COUNTED:
+        connection.execute(model.__table__.update().where(
+          model.id.in_(db.select([show_fk]).where(passed))
+          ).values(num_upcoming_shows=model.num_upcoming_shows - shows_between(show_fk, model, watermark, batch_end)))
+      connection.execute(Show.__table__.update().where(passed).values(is_upcoming=False))
+      connection.execute(ShowRollover.__table__.update().values(rolled_until=batch_end))
+      written_tags(db.session, 'venues', 'artists',
+        *{'venue:{}'.format(show.venue_id) for show in shows},
+        *{'artist:{}'.format(show.artist_id) for show in shows})
+      db.session.commit()
+
+    rolled += len(shows)
+    batches += 1
+    watermark = batch_end
+
+  # ends the reads, and the lock of a watermark found rolled already; only
+  # the batches above wrote anything
+  db.session.commit()
+  if not dry_run:
+    rollover_metrics.record(rolled, batches, time.perf_counter() - started, lag)
+  return rolled
+
+def check_upcoming_counters(rebuild=False):
+  '''
+  Returns (model name, id, stored, actual) for every counter and every
+  show's is_upcoming flag that does not match the show table. With `rebuild`
+  all of them are recomputed from scratch, counting from now.
+  '''
+  connection = db.session.connection()
+  if rebuild:
+    connection.execute(ShowRollover.__table__.delete())
+  watermark = rolled_until(connection)
+
+  mismatches = []
+  for model, show_fk in COUNTED:
+    actual = shows_between(show_fk, model, watermark, None)
+    rows = db.session.query(model.id, model.num_upcoming_shows, actual.label('actual')).filter(
+      model.num_upcoming_shows != actual
+      ).order_by(model.id).all()
+    mismatches.extend((model.__name__, row.id, row.num_upcoming_shows, row.actual) for row in rows)
+    if rebuild:
+      connection.execute(model.__table__.update().values(num_upcoming_shows=actual))
+
+  upcoming = Show.start_time > watermark
+  rows = db.session.query(Show.id, Show.is_upcoming).filter(Show.is_upcoming != upcoming).order_by(Show.id).all()
+  mismatches.extend(('Show', row.id, row.is_upcoming, not row.is_upcoming) for row in rows)
+  if rebuild:
+    connection.execute(Show.__table__.update().values(is_upcoming=upcoming))
+  db.session.commit()
+  if rebuild:
+    bump_data_version()
+    response_cache.clear()
+  return mismatches
+
+@app.cli.group()
+def counters():
+  """Maintain the upcoming show counters."""
+
+@counters.command('roll')
+@click.option('--batch-size', type=int, help='Shows per transaction, defaults to ROLLOVER_BATCH_SIZE.')
+@click.option('--dry-run', is_flag=True, help='Count the shows to roll without changing anything.')
+@click.option('--every', type=float, help='Keep rolling every this many seconds.')
+def roll_counters_command(batch_size, dry_run, every):
+  """Move shows that started since the last roll to past."""
+  while True:
+    rolled = roll_forward_upcoming(batch_size=batch_size, dry_run=dry_run)
+    if dry_run:
+      click.echo('{} shows would roll to past.'.format(rolled))
+    else:
+      click.echo('{} shows rolled to past. {}'.format(rolled, json.dumps(rollover_metrics.as_dict())))
+    if not every:
+      break
+    db.session.remove()
+    time.sleep(every)
+
+def rollover_tick():
+  # the worker runs in every serving process, it also picks up the other
+  # processes' out-of-band writes for the response cache
+  sync_data_version()
+  roll_forward_upcoming()
+
+def start_rollover_worker():
+  worker = RolloverWorker(app, rollover_tick, app.config['ROLLOVER_INTERVAL'], rollover_metrics)
+  worker.start()
+  return worker
+
+rollover_worker = None
+rollover_worker_lock = threading.Lock()
+
+@app.before_request
+def ensure_rollover_worker():
+  # the counters are only right while shows roll to past as they start, so
+  # every process serving requests runs the worker; tests roll by hand
+  global rollover_worker
+  if rollover_worker is not None or not app.config['ROLLOVER_INTERVAL'] or app.testing:
+    return
+  with rollover_worker_lock:
+    if rollover_worker is None:
+      rollover_worker = start_rollover_worker()
+
+@counters.command('check')
+@click.option('--rebuild', is_flag=True, help='Recompute every counter from the show table.')
+def check_counters_command(rebuild):
+  """Compare the counters with the show table."""
+  mismatches = check_upcoming_counters(rebuild)
+  for name, id, stored, actual in mismatches:
+    click.echo('{} {}: counted {}, actual {}'.format(name, id, stored, actual))
+  click.echo('{} mismatched counters{}.'.format(len(mismatches), ', rebuilt' if rebuild else ''))
+  if mismatches and not rebuild:
+    sys.exit(1)
+
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+venue_index = SearchIndex()
+artist_index = SearchIndex()
+
+def written_indexes(session, *indexes):
+  # indexes holding the session's pending writes, see invalidate_written_indexes
+  session.info.setdefault('written_indexes', set()).update(indexes)
+
+@event.listens_for(Session, 'after_commit')
+def forget_written_indexes(session):
+  session.info.pop('written_indexes', None)
+
+@event.listens_for(Session, 'after_rollback')
+def invalidate_written_indexes(session):
+  # rolled back writes may already be indexed, rebuild on the next use;
+  # rollbacks that wrote nothing indexed leave the indexes alone
+  for index in session.info.pop('written_indexes', ()):
+    index.invalidate()
+
+def index_entity(index):
+  def listener(mapper, connection, target):
+    if index.ready:
+      index.add(target.id, document_fields(target.name, target.city, target.state, target.genres))
+      written_indexes(object_session(target), index)
+  return listener
+
+def unindex_entity(index):
+  def listener(mapper, connection, target):
+    if index.ready:
+      index.remove(target.id)
+      written_indexes(object_session(target), index)
+  return listener
+
+for searchable, search_index in ((Venue, venue_index), (Artist, artist_index)):
+  event.listen(searchable, 'after_insert', index_entity(search_index))
+  event.listen(searchable, 'after_update', index_entity(search_index))
+  event.listen(searchable, 'after_delete', unindex_entity(search_index))
+
+def search_entities(model, index, term):
+  # (id, name, num_upcoming_shows) rows matching `term`, best match first
+  query = db.session.query(
+    model.id,
+    model.name,
+    model.num_upcoming_shows
+    )
+
+  if db.engine.dialect.name == 'postgresql':
+    # name, city and state are in the tsvector, genres in the genre table;
+    # every token has to match one of them
+    vector = literal_column(model.__tablename__ + '.search_vector')
+    genre_model = model.genre_rows.property.mapper.class_
+    token_matches = [
+      or_(
+        vector.op('@@')(func.to_tsquery('simple', to_tsquery_text(token))),
+        model.genre_rows.any(genre_model.genre.ilike(token + '%'))
+        ) for token in tokenize(term)]
+    matches = model.name.ilike('%' + term + '%')
+    if token_matches:
+      matches = or_(and_(*token_matches), matches)
+    return query.filter(matches).order_by(
+      func.ts_rank(vector, func.to_tsquery('simple', to_tsquery_text(term, '|'))).desc(),
+      model.name
+      ).all()
+
+  sync_data_version()
+  if not index.ready:
+    # the index outlives the request, a lagging replica would leave holes in it
+    with primary():
+      index.build(db.session.query(model))
+  ids = index.search(term)
+  if len(ids) == 0:
+    return []
+  rank = { id: position for position, id in enumerate(ids) }
+  rows = query.filter(model.id.in_(ids)).all()
+  return sorted(rows, key=lambda row: rank[row.id])
+
+
+#----------------------------------------------------------------------------#
+# Bookings.
+#----------------------------------------------------------------------------#
+venue_bookings = BookingIndex()
+artist_bookings = BookingIndex()
+BOOKED = (('venue_id', venue_bookings), ('artist_id', artist_bookings))
+# held from checking a booking against the indexes until it is in them, so
+# two requests of this process cannot both find the same time free
+booking_lock = threading.Lock()
+
+def show_end(start_time):
+  return start_time + timedelta(minutes=app.config['SHOW_DURATION_MINUTES'])
+
+@event.listens_for(Show, 'before_insert')
+def schedule_show(mapper, connection, target):
+  if target.end_time is None:
+    target.end_time = show_end(target.start_time)
+
+@event.listens_for(Show, 'after_insert')
+def book_show(mapper, connection, target):
+  for field, index in BOOKED:
+    if index.ready:
+      index.add(getattr(target, field), target.id, target.start_time, target.end_time)
+      written_indexes(object_session(target), index)
+
+@event.listens_for(Show, 'after_delete')
+def unbook_show(mapper, connection, target):
+  for field, index in BOOKED:
+    if index.ready:
+      index.remove(getattr(target, field), target.id, target.start_time)
+      written_indexes(object_session(target), index)
+
+def booking_indexes():
+  # BOOKED, building the indexes from the show table when they are not ready
+  sync_data_version()
+  for field, index in BOOKED:
+    if not index.ready:
+      with primary():
+        index.build(db.session.query(getattr(Show, field), Show.id, Show.start_time, Show.end_time))
+  return BOOKED
+
+def is_booking_conflict(error):
+  # the exclusion constraints' error on PostgreSQL
+  return isinstance(error, IntegrityError) and getattr(error.orig, 'pgcode', None) == '23P01'
+
+@app.cli.group()
+def bookings():
+  """Check show bookings for overlaps."""
+
+@bookings.command('check')
+@click.argument('path', required=False, type=click.Path(exists=True, dir_okay=False))
+def check_bookings_command(path):
+  """Report overlapping shows, in the show table or in the schedule at PATH."""
+  conflicts = 0
+  if path is None:
+    for field, index in booking_indexes():
+      for key, show_ids in index.overlaps():
+        click.echo('{} {}: shows {} overlap'.format(field, key, ', '.join(map(str, show_ids))))
+        conflicts += 1
+  else:
+    lines, bookings = [], []
+    for line_number, row in read_rows(path):
+      try:
+        start_time = dateutil.parser.parse(str(row['start_time']))
+        end_time = dateutil.parser.parse(str(row['end_time'])) if row.get('end_time') else show_end(start_time)
+        bookings.append({ 'venue_id': int(row['venue_id']), 'artist_id': int(row['artist_id']),
+          'start_time': start_time, 'end_time': end_time })
+      except (TypeError, KeyError, ValueError, OverflowError) as e:
+        click.echo('line {}: unreadable booking ({})'.format(line_number, e))
+        conflicts += 1
+        continue
+      lines.append(line_number)
+    for position, errors in sorted(validate_schedule(bookings, booking_indexes()).items()):
+      click.echo('line {}: {}'.format(lines[position], json.dumps(errors)))
+      conflicts += 1
+  click.echo('{} conflicts.'.format(conflicts))
+  if conflicts:
+    sys.exit(1)
+
+
+#----------------------------------------------------------------------------#
+# Locations.
+#----------------------------------------------------------------------------#
+geocoder = Geocoder(app.config['GEOCODING_TABLE'])
+
+def locate(city, state, latitude=None, longitude=None):
+  # the location columns of a venue, geocoded from its city unless given
+  if latitude is None or longitude is None:
+    latitude, longitude = geocoder.locate(city, state) or (None, None)
+  return {
+    'latitude': latitude,
+    'longitude': longitude,
+    'geohash': encode(latitude, longitude) if latitude is not None else None
+  }
+
+@event.listens_for(Venue, 'before_insert')
+@event.listens_for(Venue, 'before_update')
+def locate_venue(mapper, connection, target):
+  attrs = db.inspect(target).attrs
+  moved = attrs.city.history.has_changes() or attrs.state.history.has_changes()
+  placed = attrs.latitude.history.has_changes() or attrs.longitude.history.has_changes()
+  if moved and not placed:
+    location = locate(target.city, target.state)
+  elif placed:
+    location = locate(target.city, target.state, target.latitude, target.longitude)
+  else:
+    return
+  for key, value in location.items():
+    setattr(target, key, value)
+
+def venues_near(latitude, longitude, radius, limit):
+  # (distance, row) of the closest venues within `radius` km, closest first;
+  # once `limit` venues are within a smaller radius nothing further matters
+  for step in search_radii(radius):
+    cells = [and_(Venue.geohash >= low, Venue.geohash < high)
+      for low, high in search_ranges(latitude, longitude, step)]
+    # answered from the index alone
+    points = db.session.query(Venue.id, Venue.latitude, Venue.longitude).filter(or_(*cells)).all()
+    nearby = []
+    for id, venue_latitude, venue_longitude in points:
+      distance = distance_km(latitude, longitude, venue_latitude, venue_longitude)
+      if distance <= step:
+        nearby.append((distance, id))
+    if len(nearby) >= limit:
+      break
+  nearby = sorted(nearby)[:limit]
+  if not nearby:
+    return []
+  rows = db.session.query(
+    Venue.id,
+    Venue.name,
+    Venue.city,
+    Venue.state,
+    Venue.num_upcoming_shows
+    ).filter(Venue.id.in_([id for distance, id in nearby])).all()
+  rows = { row.id: row for row in rows }
+  return [(distance, rows[id]) for distance, id in nearby]
+
+@app.cli.group()
+def geo():
+  """Venue locations."""
+
+@geo.command('backfill')
+@click.option('--all', 'everything', is_flag=True, help='Geocode located venues again too.')
+@click.option('--batch-size', default=1000, show_default=True, help='Venues per transaction.')
+def geo_backfill_command(everything, batch_size):
+  """Geocode venues from the geocoding table."""
+  located = missing = 0
+  last_id = 0
+  while True:
+    query = db.session.query(Venue.id, Venue.city, Venue.state).filter(Venue.id > last_id)
+    if not everything:
+      query = query.filter(Venue.latitude.is_(None))
+    batch = query.order_by(Venue.id).limit(batch_size).all()
+    if not batch:
+      break
+    last_id = batch[-1].id
+    updates = []
+    for row in batch:
+      location = locate(row.city, row.state)
+      if location['latitude'] is None:
+        missing += 1
+        continue
+      location['venue_id'] = row.id
+      updates.append(location)
+    if updates:
+      table = Venue.__table__
+      # the other keys of `updates` are the columns to set
+      db.session.execute(table.update().where(table.c.id == db.bindparam('venue_id')), updates)
+      written_tags(db.session, 'venues', *('venue:{}'.format(update['venue_id']) for update in updates))
+    db.session.commit()
+    located += len(updates)
+  click.echo('{} venues located, {} in cities missing from {}.'.format(located, missing, geocoder.path))
+
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+IMPORTED = {
+  'venues': (Venue, VenueForm, VenueGenre, VenueGenre.venue_id),
+  'artists': (Artist, ArtistForm, ArtistGenre, ArtistGenre.artist_id),
+}
+ENTITY_FIELDS = {
+  Venue: ('name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link',
+    'website', 'seeking_talent', 'seeking_description'),
+  Artist: ('name', 'city', 'state', 'phone', 'image_link', 'facebook_link',
+    'website', 'seeking_venue', 'seeking_description'),
+}
+
+def import_formdata(row):
+  # CSV cells are strings ("Jazz,Reggae"), JSON Lines values may be lists
+  formdata = MultiDict()
+  for key, value in row.items():
+    if value is None:
+      continue
+    if key == 'genres' and isinstance(value, str):
+      value = [genre.strip() for genre in value.split(',') if genre.strip()]
+    if isinstance(value, list):
+      for item in value:
+        formdata.add(key, str(item))
+    elif isinstance(value, bool):
+      formdata.add(key, 'y' if value else '')
+    else:
+      formdata.add(key, str(value))
+  return formdata
+
+def validate_import_row(form_class, row):
+  # the same rules as the create forms, without CSRF
+  form = form_class(formdata=import_formdata(row), meta={'csrf': False})
+  if not form.validate():
+    return None, form.errors
+  return form, None
+
+def allocate_ids(model, count):
+  if db.engine.dialect.name == 'postgresql':
+    return [id for id, in db.session.execute(
+      "SELECT nextval('{}_id_seq') FROM generate_series(1, :count)".format(model.__tablename__),
+      {'count': count})]
+  # other backends have a single writer during an import
+  start = (db.session.query(func.max(model.id)).scalar() or 0) + 1
+  return list(range(start, start + count))
+
+def import_entities(kind, path, batch_size, checkpoint, report):
+  model, form_class, genre_model, genre_fk = IMPORTED[kind]
+  fields = ENTITY_FIELDS[model]
+
+  def validate(row):
+    form, errors = validate_import_row(form_class, row)
+    if errors:
+      return None, errors
+    record = { field: form[field].data for field in fields }
+    record['genres'] = form.genres.data
+    try:
+      record['id'] = int(row['id']) if row.get('id') else None
+    except ValueError:
+      return None, { 'id': ['ID must be an integer.'] }
+    if model is Venue:
+      # core inserts skip the model events
+      record.update(locate(record['city'], record['state']))
+    return record, None
+
+  def write(records):
+    new_ids = iter(allocate_ids(model, sum(1 for record in records if record['id'] is None)))
+    for record in records:
+      if record['id'] is None:
+        record['id'] = next(new_ids)
+    db.session.execute(model.__table__.insert(),
+      [{ key: value for key, value in record.items() if key != 'genres' } for record in records])
+    genres = [{ genre_fk.key: record['id'], 'genre': genre }
+      for record in records for genre in set(record['genres'])]
+    if genres:
+      db.session.execute(genre_model.__table__.insert(), genres)
+
+  summary = run_import(read_rows(path), validate, write, db.session, batch_size, checkpoint, report)
+  if db.engine.dialect.name == 'postgresql':
+    # ids given in the file bypass the sequence
+    db.session.execute("SELECT setval('{0}_id_seq', (SELECT coalesce(max(id), 1) FROM {0}))".format(model.__tablename__))
+    db.session.commit()
+  return summary
+
+def import_shows(path, batch_size, checkpoint, report):
+  def validate(row):
+    row = dict(row)
+    if row.get('start_time'):
+      # accept ISO timestamps besides the form's own format
+      try:
+        row['start_time'] = dateutil.parser.parse(str(row['start_time'])).strftime('%Y-%m-%d %I:%M%p')
+      except (ValueError, OverflowError):
+        pass
+    form, errors = validate_import_row(ShowForm, row)
+    if errors:
+      return None, errors
+    try:
+      record = {
+        'venue_id': int(form.venue_id.data),
+        'artist_id': int(form.artist_id.data),
+        'start_time': form.start_time.data,
+        'end_time': show_end(form.start_time.data)
+      }
+    except ValueError:
+      return None, { 'venue_id': ['Artist and Venue IDs must be integers.'] }
+    return record, None
+
+  def write(records):
+    # shows of unknown venues/artists would fail the whole batch on the
+    # foreign keys, skip just those rows
+    skipped = {}
+    for model, key in ((Venue, 'venue_id'), (Artist, 'artist_id')):
+      wanted = { record[key] for record in records }
+      found = { id for id, in db.session.query(model.id).filter(model.id.in_(wanted)) }
+      for index, record in enumerate(records):
+        if record[key] not in found:
+          skipped.setdefault(index, {})[key] = ['No {} with this ID.'.format(model.__name__)]
+    # overlapping bookings, with the shows booked so far and within the batch
+    positions = [index for index in range(len(records)) if index not in skipped]
+    with booking_lock:
+      conflicts = validate_schedule([records[index] for index in positions], booking_indexes())
+      for position, errors in conflicts.items():
+        skipped[positions[position]] = errors
+      records = [record for index, record in enumerate(records) if index not in skipped]
+      if not records:
+        return skipped
+
+      # the insert bypasses the mapper events, flag, count and book the shows here
+      watermark = rolled_until(db.session.connection())
+      for record, id in zip(records, allocate_ids(Show, len(records))):
+        record['id'] = id
+        record['is_upcoming'] = record['start_time'] > watermark
+      db.session.execute(Show.__table__.insert(), records)
+      for record in records:
+        for field, index in BOOKED:
+          index.add(record[field], record['id'], record['start_time'], record['end_time'])
+      written_indexes(db.session, *(index for field, index in BOOKED))
+    for model, show_fk in COUNTED:
+      deltas = Counter(record[show_fk.key] for record in records if record['is_upcoming'])
+      if deltas:
+        db.session.execute(model.__table__.update().where(
+          model.id == db.bindparam('counted_id')
+          ).values(num_upcoming_shows=model.num_upcoming_shows + db.bindparam('delta')),
+          [{ 'counted_id': id, 'delta': delta } for id, delta in deltas.items()])
+    return skipped
+
+  return run_import(read_rows(path), validate, write, db.session, batch_size, checkpoint, report)
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=1000, show_default=True, help='Rows per transaction.')
+@click.option('--checkpoint', help='Checkpoint file, defaults to PATH.checkpoint.')
+@click.option('--report', help='JSON Lines error report, defaults to PATH.errors.jsonl.')
+def import_command(kind, path, batch_size, checkpoint, report):
+  """Bulk import venues, artists or shows from a CSV or JSON Lines file."""
+  checkpoint = Checkpoint(checkpoint or path + '.checkpoint')
+  if checkpoint.rows_done:
+    click.echo('Resuming after {} rows.'.format(checkpoint.rows_done))
+  report = ImportReport(report or path + '.errors.jsonl')
+
+  if kind == 'shows':
+    summary = import_shows(path, batch_size, checkpoint, report)
+  else:
+    summary = import_entities(kind, path, batch_size, checkpoint, report)
+
+  # the inserts bypass the mapper events
+  bump_data_version()
+  drop_derived_data()
+
+  click.echo('{rows} rows: {inserted} inserted, {rejected} rejected in {seconds}s ({rows_per_sec} rows/sec).'.format(**summary))
+
+
+#----------------------------------------------------------------------------#
+# Out-of-band writes.
+#
+# The response cache and the search and booking indexes of every process
+# follow the writes that go through the mapper events. Writes that bypass
+# them (imports, counter rebuilds) bump the data version row instead, and
+# every process drops what it derived from the old rows once it sees the
+# bump: bookings and searches check before every use, cached pages on the
+# rollover worker's tick.
+#----------------------------------------------------------------------------#
+seen_data_version = None
+
+def bump_data_version():
+  table = DataVersion.__table__
+  if db.session.execute(table.update().values(version=table.c.version + 1)).rowcount == 0:
+    db.session.execute(table.insert().values(id=1, version=1))
+  db.session.commit()
+
+def drop_derived_data():
+  for index in (venue_index, artist_index, venue_bookings, artist_bookings):
+    index.invalidate()
+  response_cache.clear()
+
+def sync_data_version():
+  # drops this process's derived data when the version moved since it last
+  # looked, or when it never looked
+  global seen_data_version
+  with primary():
+    version = db.session.query(DataVersion.version).scalar() or 0
+  if version != seen_data_version:
+    drop_derived_data()
+    seen_data_version = version
+
+
+#----------------------------------------------------------------------------#
+# Helpers.
+#----------------------------------------------------------------------------#
+def split_shows(rows, now=None):
+  # partitions show rows into (past, upcoming) on their is_upcoming flag,
+  # skipping the empty row an outer join yields for an entity without shows;
+  # the flag lags the clock until the next rollover, the start time does not
+  now = now or datetime.now()
+  past_shows = []
+  upcoming_shows = []
+  for row in rows:
+    if row.start_time is None:
+      continue
+    if row.is_upcoming and row.start_time > now:
+      upcoming_shows.append(row)
+    else:
+      past_shows.append(row)
+  return past_shows, upcoming_shows
+
+def entity_row(model, names, genre_fk, entity_id):
+  # (row of the named columns, genres) in one query, or (None, []); the
+  # columns repeat once per genre, which stays cheaper than once per show
+  genre_model = genre_fk.class_
+  rows = db.session.query(
+    *model_columns(model, names),
+    genre_model.genre
+    ).outerjoin(genre_model, genre_fk == model.id
+    ).filter(
+      model.id == entity_id
+      ).all()
+  if len(rows) == 0:
+    return None, []
+  return rows[0], [row.genre for row in rows if row.genre is not None]
+
+class comma_joined(FunctionElement):
+  # the values of an aggregated column joined with commas, like genres are
+  # written in imports and exports (which is why genres have no commas)
+  type = db.String()
+  name = 'comma_joined'
+
+@compiles(comma_joined)
+def compile_comma_joined(element, compiler, **kw):
+  return "group_concat({}, ',')".format(compiler.process(element.clauses, **kw))
+
+@compiles(comma_joined, 'postgresql')
+def compile_comma_joined_postgresql(element, compiler, **kw):
+  return "string_agg({}, ',')".format(compiler.process(element.clauses, **kw))
+
+def entity_genres(model, genre_fk):
+  # correlated column of the comma joined genres of `model`'s row
+  genre_model = genre_fk.class_
+  return db.select([comma_joined(genre_model.genre)]).where(genre_fk == model.id).as_scalar().label('genres')
+
+def split_genres(joined):
+  return sorted(joined.split(',')) if joined else []
+
+def entity_detail(cls, model, names, genre_fk, show_fk, other, other_fk, other_columns, entity_id):
+  # `cls` with the entity's genres and shows, or None, in one query: a row
+  # per show, each with the entity's columns and genres
+  rows = db.session.query(
+    *model_columns(model, names),
+    entity_genres(model, genre_fk),
+    other_fk,
+    *other_columns,
+    Show.start_time,
+    Show.is_upcoming
+    ).outerjoin(Show, show_fk == model.id
+    ).outerjoin(other, other.id == other_fk
+    ).filter(
+      model.id == entity_id
+      ).order_by(
+        Show.start_time
+        ).all()
+  if len(rows) == 0:
+    return None
+
+  past_shows, upcoming_shows = split_shows(rows)
+  return read_model(cls, rows[0],
+    genres=split_genres(rows[0].genres),
+    past_shows=past_shows,
+    upcoming_shows=upcoming_shows,
+    past_shows_count=len(past_shows),
+    upcoming_shows_count=len(upcoming_shows))
+
+def venue_detail(venue_id):
+  # VenueDetail with the venue's shows, or None; one query
+  return entity_detail(VenueDetail, Venue, VENUE_COLUMNS, VenueGenre.venue_id, Show.venue_id, Artist, Show.artist_id, (
+    Artist.name.label("artist_name"),
+    Artist.image_link.label("artist_image_link")
+    ), venue_id)
+
+def artist_detail(artist_id):
+  # ArtistDetail with the artist's shows, or None; one query
+  return entity_detail(ArtistDetail, Artist, ARTIST_COLUMNS, ArtistGenre.artist_id, Show.artist_id, Venue, Show.venue_id, (
+    Venue.name.label("venue_name"),
+    Venue.image_link.label("venue_image_link")
+    ), artist_id)
+
+def entity_form_data(model, genre_fk, form_data, entity_id):
+  # what an edit form shows, in one query and without loading the model
+  names = [name for name in form_data._fields if name != 'genres']
+  row, genres = entity_row(model, names, genre_fk, entity_id)
+  if row is None:
+    return None
+  return read_model(form_data, row, genres=genres)
+
+def show_date_conditions(from_date, to_date):
+  # shows starting from `from_date` through the whole `to_date` day
+  conditions = []
+  try:
+    if from_date:
+      conditions.append(Show.start_time >= dateutil.parser.parse(from_date))
+    if to_date:
+      end = dateutil.parser.parse(to_date).replace(hour=0, minute=0, second=0, microsecond=0)
+      conditions.append(Show.start_time < end + timedelta(days=1))
+  except (ValueError, OverflowError):
+    abort(400)
+  return conditions
+
+def paginate(query, columns, **args):
+  # keyset page of `query` for the current request's after/before cursor
+  page_size = request.args.get('page_size', app.config['PAGE_SIZE'], type=int)
+  page_size = min(max(page_size, 1), app.config['MAX_PAGE_SIZE'])
+
+  # query string arguments the next/prev links have to keep
+  args = { key: value for key, value in args.items() if value }
+  if 'page_size' in request.args:
+    args['page_size'] = page_size
+
+  try:
+    return keyset_page(query, columns, page_size,
+      after=request.args.get('after'),
+      before=request.args.get('before'),
+      args=args)
+  except ValueError:
+    abort(400)
+
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -93,40 +1070,37 @@ def index():
 #  Venues
 #  ----------------------------------------------------------------
 @app.route('/venues')
+@cached
+@read_only
+@query_budget(1)
 def venues():
-  groups = db.session.query(
-    Venue.city, 
-    Venue.state
-    ).group_by(
-      Venue.city, 
-      Venue.state
-      ).all()
+  # one round trip: a page of venues with their upcoming show counters, ordered by area
+  query = db.session.query(
+    Venue.city,
+    Venue.state,
+    Venue.id,
+    Venue.name,
+    Venue.num_upcoming_shows
+    )
+  genre = request.args.get('genre', '')
+  if genre:
+    query = query.filter(Venue.genre_rows.any(VenueGenre.genre == genre))
+  page = paginate(query, (Venue.city, Venue.state, Venue.name, Venue.id), genre=genre)
+  cache_tag('venues', *('venue:{}'.format(venue.id) for venue in page))
 
+  # fold the ordered rows into city/state areas
   data = []
-  for group in groups:
-    r_group = {}
-    r_group['city'] = group.city
-    r_group['state'] = group.state
-    r_group['venues'] = db.session.query(
-      Venue.id,
-      Venue.name,
-      func.count(Show.id).label('num_upcoming_shows')
-    ).filter_by(
-      city = group.city, 
-      state = group.state
-      ).join(Show, 
-        and_(Show.start_time > datetime.now(), Venue.id == Show.venue_id),
-        isouter=True
-      ).group_by(
-        Venue.id, 
-        Venue.name
-        ).all()
-
-    data.append(r_group)
+  for (city, state), area_venues in groupby(page, key=lambda row: (row.city, row.state)):
+    data.append({
+      'city': city,
+      'state': state,
+      'venues': list(area_venues)
+    })
   
-  return render_template('pages/venues.html', areas=data)
+  return render_template('pages/venues.html', areas=data, page=page)
 
 @app.route('/venues/search', methods=['POST', 'GET'])
+@read_only
 def search_venues():
   response = {}
   term = request.form.get('search_term', '')
@@ -136,56 +1110,51 @@ def search_venues():
     return redirect(url_for('venues'))
 
   else:
-    data = db.session.query(
-      Venue.id,
-      Venue.name,
-      func.count(Show.id).label('num_upcoming_shows')
-      ).filter(Venue.name.ilike("%"+term+"%")
-      ).join(Show,
-        and_(Show.start_time > datetime.now(), Venue.id == Show.venue_id),
-        isouter=True
-      ).group_by(
-        Venue.id,
-        Venue.name
-        ).all()
+    data = search_entities(Venue, venue_index, term)
 
   response['count'] = len(data)
   response['data'] = data
   return render_template('pages/search_venues.html', results=response, search_term=term)
 
+@app.route('/venues/nearby')
+@read_only
+@query_budget(SEARCH_STEPS + 1)
+def nearby_venues():
+  try:
+    latitude = float(request.args['lat'])
+    longitude = float(request.args['lng'])
+    radius = float(request.args.get('radius', app.config['NEARBY_RADIUS_KM']))
+  except (KeyError, ValueError):
+    abort(400)
+  # comparisons with nan are false too
+  if not (-90 <= latitude <= 90 and -180 <= longitude <= 180
+      and 0 < radius <= app.config['NEARBY_MAX_RADIUS_KM']):
+    abort(400)
+
+  data = []
+  for distance, row in venues_near(latitude, longitude, radius, app.config['NEARBY_LIMIT']):
+    data.append({
+      'id': row.id,
+      'name': row.name,
+      'city': row.city,
+      'state': row.state,
+      'num_upcoming_shows': row.num_upcoming_shows,
+      'distance': distance
+    })
+  return render_template('pages/nearby_venues.html', venues=data, latitude=latitude,
+    longitude=longitude, radius=radius)
+
 @app.route('/venues/<int:venue_id>')
+@cached
+@read_only
+@query_budget(1)
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
-  data = db.session.query(Venue).get(venue_id)
+  data = venue_detail(venue_id)
   if data is None: abort(404)
 
-  if data.genres is None:
-    data.genres = []
-  else:
-    data.genres = data.genres.split(',')
-
-  data.past_shows = db.session.query(
-    Show.artist_id,
-    Artist.name.label("artist_name"),
-    Artist.image_link.label("artist_image_link"),
-    Show.start_time
-    ).join(Artist
-    ).filter(
-      Show.venue_id == data.id,
-      Show.start_time <= datetime.now()
-      ).all()
-  data.upcoming_shows = db.session.query(
-    Show.artist_id,
-    Artist.name.label("artist_name"),
-    Artist.image_link.label("artist_image_link"),
-    Show.start_time
-    ).join(Artist
-    ).filter(
-      Show.venue_id == data.id,
-      Show.start_time > datetime.now()
-      ).all()
-  data.past_shows_count = len(data.past_shows)
-  data.upcoming_shows_count = len(data.upcoming_shows)
+  cache_tag('venue:{}'.format(data.id))
+  cache_tag(*('artist:{}'.format(show.artist_id) for show in data.past_shows + data.upcoming_shows))
 
   return render_template('pages/show_venue.html', venue=data)
 
@@ -211,7 +1180,7 @@ def create_venue_submission():
       state = request.form.get('state'),
       address = request.form.get('address'),
       phone = request.form.get('phone'),
-      genres = ','.join(request.form.getlist('genres')),
+      genres = request.form.getlist('genres'),
       image_link = request.form.get('image_link'),
       facebook_link = request.form.get('facebook_link'),
       website = request.form.get('website'),
@@ -261,15 +1230,10 @@ def delete_venue(venue_id):
 #  ----------------------------------------------------------------
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
-  venue = db.session.query(Venue).get(venue_id)
+  venue = entity_form_data(Venue, VenueGenre.venue_id, VenueFormData, venue_id)
   if venue is None:
     abort(400)
 
-  if venue.genres is None:
-    venue.genres = []
-  else:
-    venue.genres = venue.genres.split(',')
-    
   form = VenueForm(obj=venue)
 
   return render_template('forms/edit_venue.html', form=form, venue=venue)
@@ -293,7 +1257,7 @@ def edit_venue_submission(venue_id):
     venue.state = request.form.get('state')
     venue.address = request.form.get('address')
     venue.phone = request.form.get('phone')
-    venue.genres = ','.join(request.form.getlist('genres'))
+    venue.genres = request.form.getlist('genres')
     venue.image_link = request.form.get('image_link')
     venue.facebook_link = request.form.get('facebook_link')
     venue.website = request.form.get('website')
@@ -319,22 +1283,25 @@ def edit_venue_submission(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@cached
+@read_only
+@query_budget(1)
 def artists():
-  data = db.session.query(
+  query = db.session.query(
       Artist.id,
       Artist.name,
-      func.count(Show.id).label('num_upcoming_shows')
-      ).join(Show, 
-        and_(Show.start_time > datetime.now(), Artist.id == Show.artist_id),
-        isouter=True
-      ).group_by(
-        Artist.id, 
-        Artist.name
-        ).all()
+      Artist.num_upcoming_shows
+      )
+  genre = request.args.get('genre', '')
+  if genre:
+    query = query.filter(Artist.genre_rows.any(ArtistGenre.genre == genre))
+  page = paginate(query, (Artist.name, Artist.id), genre=genre)
+  cache_tag('artists', *('artist:{}'.format(artist.id) for artist in page))
   
-  return render_template('pages/artists.html', artists=data)
+  return render_template('pages/artists.html', artists=page, page=page)
 
 @app.route('/artists/search', methods=['POST', 'GET'])
+@read_only
 def search_artists():
   response = {}
   term = request.form.get('search_term', '')
@@ -344,56 +1311,23 @@ def search_artists():
     return redirect(url_for('artists'))
     
   else:
-    data = db.session.query(
-      Artist.id,
-      Artist.name,
-      func.count(Show.id).label('num_upcoming_shows')
-      ).filter(Artist.name.ilike("%"+term+"%")
-      ).join(Show,
-        and_(Show.start_time > datetime.now(), Artist.id == Show.artist_id),
-        isouter=True
-      ).group_by(
-        Artist.id, 
-        Artist.name
-        ).all()
+    data = search_entities(Artist, artist_index, term)
 
   response['count'] = len(data)
   response['data'] = data
   return render_template('pages/search_artists.html', results=response, search_term=term)
 
 @app.route('/artists/<int:artist_id>')
+@cached
+@read_only
+@query_budget(1)
 def show_artist(artist_id):
   # shows the artist page with the given artist_id
-  data = db.session.query(Artist).get(artist_id)
+  data = artist_detail(artist_id)
   if data is None: abort(404)
 
-  if data.genres is None:
-    data.genres = []
-  else:
-    data.genres = data.genres.split(',')
-
-  data.past_shows = db.session.query(
-    Show.venue_id,
-    Venue.name.label("venue_name"),
-    Venue.image_link.label("venue_image_link"),
-    Show.start_time
-    ).join(Venue
-    ).filter(
-      Show.artist_id == data.id,
-      Show.start_time <= datetime.now()
-      ).all()
-  data.upcoming_shows = db.session.query(
-    Show.venue_id,
-    Venue.name.label("venue_name"),
-    Venue.image_link.label("venue_image_link"),
-    Show.start_time
-    ).join(Venue
-    ).filter(
-      Show.artist_id == data.id,
-      Show.start_time > datetime.now()
-      ).all()
-  data.past_shows_count = len(data.past_shows)
-  data.upcoming_shows_count = len(data.upcoming_shows)
+  cache_tag('artist:{}'.format(data.id))
+  cache_tag(*('venue:{}'.format(show.venue_id) for show in data.past_shows + data.upcoming_shows))
 
   return render_template('pages/show_artist.html', artist=data)
 
@@ -418,7 +1352,7 @@ def create_artist_submission():
       city = request.form.get('city'),
       state = request.form.get('state'),
       phone = request.form.get('phone'),
-      genres = ','.join(request.form.getlist('genres')),
+      genres = request.form.getlist('genres'),
       image_link = request.form.get('image_link'),
       facebook_link = request.form.get('facebook_link'),
       website = request.form.get('website'),
@@ -468,15 +1402,10 @@ def delete_artist(artist_id):
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
-  artist = db.session.query(Artist).get(artist_id)
+  artist = entity_form_data(Artist, ArtistGenre.artist_id, ArtistFormData, artist_id)
   if artist is None:
     abort(400)
 
-  if artist.genres is None:
-    artist.genres = []
-  else:
-    artist.genres = artist.genres.split(',')
-
   form = ArtistForm(obj=artist)
 
   return render_template('forms/edit_artist.html', form=form, artist=artist)
@@ -499,7 +1428,7 @@ def edit_artist_submission(artist_id):
     artist.city = request.form.get('city')
     artist.state = request.form.get('state')
     artist.phone = request.form.get('phone')
-    artist.genres = ','.join(request.form.getlist('genres'))
+    artist.genres = request.form.getlist('genres')
     artist.image_link = request.form.get('image_link')
     artist.facebook_link = request.form.get('facebook_link')
     artist.website = request.form.get('website')
@@ -525,19 +1454,31 @@ def edit_artist_submission(artist_id):
 #  Shows
 #  ----------------------------------------------------------------
 @app.route('/shows')
+@cached
+@read_only
+@query_budget(1)
 def shows():
-  # displays list of shows at /shows
+  # displays list of shows at /shows, optionally limited to a date range
+  from_date = request.args.get('from_date', '')
+  to_date = request.args.get('to_date', '')
 
-  data = db.session.query(
+  query = db.session.query(
+    Show.id,
     Show.venue_id,
     Venue.name.label("venue_name"),
     Show.artist_id,
     Artist.name.label("artist_name"),
     Artist.image_link.label("artist_image_link"),
     Show.start_time
-  ).join(Venue).join(Artist).all()
+  ).join(Venue).join(Artist)
 
-  return render_template('pages/shows.html', shows=data)
+  query = query.filter(*show_date_conditions(from_date, to_date))
+  page = paginate(query, (Show.start_time, Show.id), from_date=from_date, to_date=to_date)
+  cache_tag('shows')
+  cache_tag(*('venue:{}'.format(show.venue_id) for show in page))
+  cache_tag(*('artist:{}'.format(show.artist_id) for show in page))
+
+  return render_template('pages/shows.html', shows=page, page=page, from_date=from_date, to_date=to_date)
 
 @app.route('/shows/create')
 def create_shows():
@@ -553,39 +1494,143 @@ def create_show_submission():
     flash('Validation error. Show could not be listed.', 'danger')
     return render_template('forms/new_show.html', form=form)
 
-  artist = db.session.query(Artist).get(request.form.get('artist_id'))
-  venue = db.session.query(Venue).get(request.form.get('venue_id'))
-
-  if artist is None or venue is None:
+  try:
+    venue_id = int(form.venue_id.data)
+    artist_id = int(form.artist_id.data)
+  except ValueError:
+    venue_id = artist_id = None
+  # both ids checked in one round trip
+  found = venue_id is not None and db.session.query(
+    db.session.query(Venue.id).filter(Venue.id == venue_id).exists(),
+    db.session.query(Artist.id).filter(Artist.id == artist_id).exists()
+    ).one()
+  if not found or not all(found):
     flash('You entered a wrong Artist or Venue ID.', 'danger')
     return render_template('forms/new_show.html', form=form)
 
-  try:
-    data = Show(
-      start_time = request.form.get('start_time')
-    )
-
-    data.artist = artist
-    data.venue = venue
-
-    db.session.add(data)
-    db.session.commit()
-    # on successful db insert, flash success
-    flash('Show was successfully listed!', 'success')
-  except:
-    db.session.rollback()
-    flash('An error occurred. Show could not be listed.', 'danger')
-    print(sys.exc_info())
-    error = True
-  finally:
-    db.session.close()
-  
+  booking = {
+    'venue_id': venue_id,
+    'artist_id': artist_id,
+    'start_time': form.start_time.data,
+    'end_time': show_end(form.start_time.data)
+  }
+  conflicts = None
+  with booking_lock:
+    if db.engine.dialect.name != 'postgresql':
+      # PostgreSQL's exclusion constraints reject the insert instead; the
+      # show joins the indexes on insert, still under the lock
+      conflicts = validate_schedule([booking], booking_indexes())
+    if not conflicts:
+      try:
+        data = Show(**booking)
+
+        db.session.add(data)
+        db.session.commit()
+        # on successful db insert, flash success
+        flash('Show was successfully listed!', 'success')
+      except:
+        db.session.rollback()
+        if is_booking_conflict(sys.exc_info()[1]):
+          flash('The venue or the artist is already booked at that time.', 'danger')
+        else:
+          flash('An error occurred. Show could not be listed.', 'danger')
+        print(sys.exc_info())
+        error = True
+      finally:
+        db.session.close()
+
+  if conflicts:
+    field = next(iter(conflicts[0]))
+    flash('The {} is already booked at that time.'.format(field.replace('_id', '')), 'danger')
+    return render_template('forms/new_show.html', form=form)
   if error:
     return render_template('forms/new_show.html', form=form)
   else:
     return redirect(url_for('shows'))
 
 
+#  Export
+#  ----------------------------------------------------------------
+EXPORTED_COLUMNS = {
+  'venues': VENUE_COLUMNS + ('latitude', 'longitude', 'num_upcoming_shows'),
+  'artists': ARTIST_COLUMNS + ('num_upcoming_shows',),
+}
+
+def streamed(query):
+  # rows fetched from a server-side cursor as the response is sent
+  return query.yield_per(app.config['EXPORT_FETCH_SIZE'])
+
+def export_response(name, columns, rows):
+  format = request.args.get('format', 'csv')
+  if format not in EXPORT_FORMATS:
+    abort(400)
+  write = csv_chunks if format == 'csv' else jsonl_chunks
+  level = app.config['EXPORT_GZIP_LEVEL'] if request.accept_encodings['gzip'] else None
+  body = encoded(write(columns, rows, app.config['EXPORT_CHUNK_ROWS']), level)
+  response = Response(stream_with_context(body), mimetype=EXPORT_FORMATS[format])
+  response.headers['Content-Disposition'] = 'attachment; filename={}.{}'.format(name, format)
+  response.vary.add('Accept-Encoding')
+  if level is not None:
+    response.headers['Content-Encoding'] = 'gzip'
+  return response
+
+def export_entities(name, model, genre_fk):
+  # the entities with a show in the requested dates, or all of them
+  conditions = show_date_conditions(request.args.get('from_date', ''), request.args.get('to_date', ''))
+  columns = EXPORTED_COLUMNS[name]
+  query = db.session.query(*model_columns(model, columns))
+  genres = db.session.query(genre_fk, genre_fk.class_.genre)
+  if conditions:
+    played = model.shows.any(and_(*conditions))
+    query = query.filter(played)
+    genres = genres.join(model, model.id == genre_fk).filter(played)
+  rows = merge_genres(
+    streamed(query.order_by(model.id)),
+    streamed(genres.order_by(genre_fk, genre_fk.class_.genre)))
+  return export_response(name, columns + ('genres',), rows)
+
+@app.route('/export/venues')
+@read_only
+def export_venues():
+  return export_entities('venues', Venue, VenueGenre.venue_id)
+
+@app.route('/export/artists')
+@read_only
+def export_artists():
+  return export_entities('artists', Artist, ArtistGenre.artist_id)
+
+@app.route('/export/shows')
+@read_only
+def export_shows():
+  columns = ('id', 'venue_id', 'venue_name', 'artist_id', 'artist_name', 'start_time', 'end_time')
+  query = db.session.query(
+    Show.id,
+    Show.venue_id,
+    Venue.name.label('venue_name'),
+    Show.artist_id,
+    Artist.name.label('artist_name'),
+    Show.start_time,
+    Show.end_time
+    ).join(Venue).join(Artist).filter(
+    *show_date_conditions(request.args.get('from_date', ''), request.args.get('to_date', ''))
+    ).order_by(Show.start_time, Show.id)
+  return export_response('shows', columns, streamed(query))
+
+#  Cache
+#  ----------------------------------------------------------------
+@app.route('/cache/stats')
+def cache_stats():
+  return jsonify(response_cache.stats.as_dict())
+
+@app.route('/responses/stats')
+def response_stats():
+  return jsonify(compression.stats.as_dict())
+
+@app.route('/rollover/stats')
+def rollover_stats():
+  return jsonify(rollover_metrics.as_dict())
+
+
 #  Error Handling
 #  ----------------------------------------------------------------
 @app.errorhandler(404)
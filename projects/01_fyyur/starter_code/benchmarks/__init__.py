@@ -0,0 +1,8 @@
+# Fyyur benchmarks, run from the starter_code directory:
+#   python -m benchmarks.format_datetime
+#   python -m benchmarks.seed --database sqlite:///fyyur_bench.db
+#   python -m benchmarks.routes --output baseline.json
+#   python -m benchmarks.routes --baseline baseline.json
+#   python -m benchmarks.read_models
+#   python -m benchmarks.nearby --venues 1000000
+#   python -m benchmarks.export
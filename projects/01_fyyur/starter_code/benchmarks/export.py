@@ -0,0 +1,77 @@
+import argparse
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from benchmarks.seed import SyntheticCatalog, batches, seed
+
+#----------------------------------------------------------------------------#
+# Memory of /export/shows as the show table grows: the table is filled up to
+# each size in turn and exported with the response body read and dropped a
+# chunk at a time, like a client saving it to disk. The peak should not move.
+#----------------------------------------------------------------------------#
+
+
+def synthetic_shows(first, last, venues, artists):
+    # shows first..last, never two at a time for a venue or an artist as long
+    # as there are at least as many artists as venues
+    start = datetime(2030, 1, 1)
+    for i in range(first, last):
+        slot = start + timedelta(hours=4 * (i // venues))
+        yield {'id': i + 1, 'venue_id': i % venues + 1, 'artist_id': i % artists + 1,
+            'start_time': slot, 'end_time': slot + timedelta(hours=3), 'is_upcoming': True}
+
+
+def export(client, url, headers, trace):
+    # (bytes, seconds, peak traced bytes or None)
+    response = client.get(url, headers=headers, buffered=False)
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    size = 0
+    for chunk in response.response:
+        size += len(chunk)
+    response.close()
+    seconds = time.perf_counter() - started
+    peak = None
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return size, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export memory against the size of the show table.')
+    parser.add_argument('--database', default='sqlite:///fyyur_export.db')
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='show counts to export at')
+    parser.add_argument('--venues', type=int, default=1000)
+    parser.add_argument('--format', default='csv', choices=['csv', 'jsonl'])
+    parser.add_argument('--gzip', action='store_true')
+    parser.add_argument('--no-trace', action='store_true', help='skip tracemalloc, it slows the export down')
+    args = parser.parse_args()
+
+    from app import app, db, Show
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database
+    app.config['ROLLOVER_INTERVAL'] = None
+    headers = {'Accept-Encoding': 'gzip' if args.gzip else 'identity'}
+    url = '/export/shows?format=' + args.format
+    with app.app_context():
+        seed(SyntheticCatalog(args.venues, args.venues, 0))
+        client = app.test_client()
+        # the first export compiles the queries
+        export(client, url, headers, trace=False)
+
+        print('{:>10} {:>10} {:>10} {:>12} {:>12}'.format('shows', 'MiB', 'seconds', 'rows/s', 'peak KiB'))
+        exported = 0
+        for size in [int(size) for size in args.sizes.split(',')]:
+            for batch in batches(synthetic_shows(exported, size, args.venues, args.venues)):
+                db.session.execute(Show.__table__.insert(), batch)
+            db.session.commit()
+            exported = size
+            body, seconds, peak = export(client, url, headers, trace=not args.no_trace)
+            print('{:>10} {:>10.1f} {:>10.2f} {:>12.0f} {:>12}'.format(size, body / 1024.0 / 1024.0, seconds,
+                size / seconds, '-' if peak is None else '{:.1f}'.format(peak / 1024.0)))
+
+
+if __name__ == '__main__':
+    main()
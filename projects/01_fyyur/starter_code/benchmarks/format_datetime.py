@@ -0,0 +1,59 @@
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+import babel.dates
+
+from formatting import DateFormatter, FORMATS
+
+#----------------------------------------------------------------------------#
+# Compares the `datetime` Jinja filter's old babel call with DateFormatter.
+#----------------------------------------------------------------------------#
+
+def babel_filter(value, format='medium'):
+    # the filter as it was: one babel.dates.format_datetime() call per row
+    return babel.dates.format_datetime(value, FORMATS.get(format, format))
+
+
+def show_times(rows, distinct):
+    # shows cluster on a limited set of start times, like real listings
+    start = datetime(2020, 1, 1, 20, 0)
+    times = [start + timedelta(hours=random.randrange(24 * 365 * 2)) for _ in range(distinct)]
+    return [random.choice(times) for _ in range(rows)]
+
+
+def timed(function, values):
+    started = time.perf_counter()
+    function(values)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the datetime Jinja filter.')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--distinct', type=int, default=5000, help='distinct show times')
+    parser.add_argument('--format', default='medium')
+    args = parser.parse_args()
+
+    random.seed(0)
+    values = show_times(args.rows, args.distinct)
+    formatter = DateFormatter()
+
+    assert [babel_filter(value, args.format) for value in values[:1000]] == \
+        formatter.format_many(values[:1000], args.format)
+    formatter = DateFormatter()
+
+    results = [
+        ('babel.dates.format_datetime', timed(lambda values: [babel_filter(value, args.format) for value in values], values)),
+        ('DateFormatter.format', timed(lambda values: [formatter.format(value, args.format) for value in values], values)),
+        ('DateFormatter.format_many', timed(lambda values: DateFormatter().format_many(values, args.format), values)),
+    ]
+
+    baseline = results[0][1]
+    print('{} rows, {} distinct times, format {!r}'.format(args.rows, args.distinct, args.format))
+    for name, seconds in results:
+        print('{:<30} {:>8.3f}s {:>12.0f} rows/s {:>7.1f}x'.format(name, seconds, args.rows / seconds, baseline / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+import argparse
+import random
+import time
+
+from benchmarks.seed import CITIES, SyntheticCatalog, geocoder, seed
+from benchmarks.routes import percentile
+
+#----------------------------------------------------------------------------#
+# Latency of /venues/nearby: searches around random points of the seeded
+# cities, through the geohash ranges the view uses and, on a sample of them,
+# through a scan of every located venue to check they find the same venues.
+#----------------------------------------------------------------------------#
+
+
+def scan(latitude, longitude, radius, limit):
+    # what the geohash ranges should find, the slow way
+    from app import db, Venue
+    from geo import distance_km
+    nearby = []
+    for row in db.session.query(Venue.id, Venue.latitude, Venue.longitude).filter(Venue.latitude.isnot(None)):
+        distance = distance_km(latitude, longitude, row.latitude, row.longitude)
+        if distance <= radius:
+            nearby.append((distance, row.id))
+    return [id for distance, id in sorted(nearby)[:limit]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time venue searches by distance.')
+    parser.add_argument('--database', default='sqlite:///fyyur_nearby.db')
+    parser.add_argument('--no-seed', action='store_true', help='reuse an already seeded database')
+    parser.add_argument('--venues', type=int, default=100000)
+    parser.add_argument('--searches', type=int, default=500)
+    parser.add_argument('--radius', type=float, default=10.0, help='km')
+    parser.add_argument('--check', type=int, default=5, help='searches compared with a full scan')
+    args = parser.parse_args()
+
+    from app import app, db, venues_near
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database
+    app.config['ROLLOVER_INTERVAL'] = None
+    limit = app.config['NEARBY_LIMIT']
+    with app.app_context():
+        if not args.no_seed:
+            started = time.perf_counter()
+            seed(SyntheticCatalog(args.venues, 0, 0))
+            print('Seeded {} venues in {:.1f}s.'.format(args.venues, time.perf_counter() - started))
+
+        rng = random.Random(0)
+        points = []
+        for _ in range(args.searches):
+            latitude, longitude = geocoder.locate(*rng.choice(CITIES))
+            points.append((latitude + rng.gauss(0, 0.1), longitude + rng.gauss(0, 0.1)))
+
+        client = app.test_client()
+        timings = []
+        for latitude, longitude in points:
+            started = time.perf_counter()
+            response = client.get('/venues/nearby?lat={}&lng={}&radius={}'.format(latitude, longitude, args.radius))
+            timings.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.status_code
+        timings.sort()
+        print('{} searches within {:g} km'.format(len(points), args.radius))
+        print('ms p50 {:.2f}  p95 {:.2f}  p99 {:.2f}  max {:.2f}'.format(*(
+            percentile(timings, p) * 1000 for p in (50, 95, 99, 100))))
+
+        for latitude, longitude in points[:args.check]:
+            started = time.perf_counter()
+            expected = scan(latitude, longitude, args.radius, limit)
+            seconds = time.perf_counter() - started
+            actual = [row.id for distance, row in venues_near(latitude, longitude, args.radius, limit)]
+            db.session.remove()
+            print('full scan {:.1f} ms, {} venues, {}'.format(
+                seconds * 1000, len(expected), 'same' if actual == expected else 'DIFFERENT'))
+            if actual != expected:
+                raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import random
+import time
+import tracemalloc
+
+from flask import render_template
+
+from benchmarks.seed import SyntheticCatalog, seed
+
+#----------------------------------------------------------------------------#
+# Time and memory per detail and edit page: the read models the views use
+# now against the ORM instances they used to load and decorate.
+#----------------------------------------------------------------------------#
+
+
+def orm_detail(model, other, show_fk, other_fk, prefix, entity_id):
+    # the views as they were: the full entity, genres through the relationship,
+    # show lists set on the mapped instance
+    from app import db, Show, split_shows
+    rows = db.session.query(
+        model,
+        show_fk,
+        other.name.label(prefix + '_name'),
+        other.image_link.label(prefix + '_image_link'),
+        Show.start_time,
+        Show.is_upcoming
+        ).outerjoin(Show, other_fk == model.id
+        ).outerjoin(other, other.id == show_fk
+        ).filter(model.id == entity_id).order_by(Show.start_time).all()
+    data = rows[0][0]
+    data.past_shows, data.upcoming_shows = split_shows(rows)
+    data.past_shows_count = len(data.past_shows)
+    data.upcoming_shows_count = len(data.upcoming_shows)
+    return data
+
+
+def pages():
+    # (page, template, context name, old loader, new loader)
+    import app as fyyur
+    from app import db, Venue, Artist, Show, VenueGenre, ArtistGenre, VenueForm, ArtistForm
+    from readmodels import VenueFormData, ArtistFormData
+    return [
+        ('show_venue', 'pages/show_venue.html', 'venue',
+            lambda id: orm_detail(Venue, Artist, Show.artist_id, Show.venue_id, 'artist', id),
+            fyyur.venue_detail, None),
+        ('show_artist', 'pages/show_artist.html', 'artist',
+            lambda id: orm_detail(Artist, Venue, Show.venue_id, Show.artist_id, 'venue', id),
+            fyyur.artist_detail, None),
+        ('edit_venue', 'forms/edit_venue.html', 'venue',
+            lambda id: db.session.query(Venue).get(id),
+            lambda id: fyyur.entity_form_data(Venue, VenueGenre.venue_id, VenueFormData, id), VenueForm),
+        ('edit_artist', 'forms/edit_artist.html', 'artist',
+            lambda id: db.session.query(Artist).get(id),
+            lambda id: fyyur.entity_form_data(Artist, ArtistGenre.artist_id, ArtistFormData, id), ArtistForm),
+    ]
+
+
+def measure(app, template, name, load, form, ids):
+    # (seconds per page, peak bytes per page) loading and rendering every id
+    from app import db
+    seconds = 0.0
+    peak = 0
+    for entity_id in ids:
+        with app.test_request_context():
+            tracemalloc.start()
+            started = time.perf_counter()
+            data = load(entity_id)
+            context = {name: data}
+            if form is not None:
+                context['form'] = form(obj=data)
+            render_template(template, **context)
+            seconds += time.perf_counter() - started
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            db.session.remove()
+    return seconds / len(ids), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare ORM instances and read models on the detail pages.')
+    parser.add_argument('--database', default='sqlite:///fyyur_bench.db')
+    parser.add_argument('--no-seed', action='store_true', help='reuse an already seeded database')
+    parser.add_argument('--venues', type=int, default=200)
+    parser.add_argument('--artists', type=int, default=200)
+    parser.add_argument('--shows', type=int, default=20000)
+    parser.add_argument('--pages', type=int, default=200, help='pages rendered per route and loader')
+    args = parser.parse_args()
+
+    from app import app
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database
+    catalog = SyntheticCatalog(args.venues, args.artists, args.shows)
+    with app.app_context():
+        if not args.no_seed:
+            seed(catalog)
+
+        rng = random.Random(0)
+        print('{:<12} {:<12} {:>10} {:>12}'.format('page', 'loader', 'ms/page', 'peak KiB'))
+        for page, template, name, old, new, form in pages():
+            kind = 'venues' if 'venue' in page else 'artists'
+            ids = [rng.randint(1, catalog.counts[kind]) for _ in range(args.pages)]
+            results = [('orm', measure(app, template, name, old, form, ids)),
+                ('read model', measure(app, template, name, new, form, ids))]
+            for loader, (seconds, peak) in results:
+                print('{:<12} {:<12} {:>10.3f} {:>12.1f}'.format(page, loader, seconds * 1000, peak / 1024.0))
+
+
+if __name__ == '__main__':
+    main()
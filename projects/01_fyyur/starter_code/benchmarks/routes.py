@@ -0,0 +1,332 @@
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta
+
+from benchmarks.seed import CITIES, SPREAD, SyntheticCatalog, geocoder, seed
+
+# bytes read at a time from a server response
+CHUNK_SIZE = 64 * 1024
+
+#----------------------------------------------------------------------------#
+# Drives every Fyyur route against a seeded database and reports latency
+# percentiles, time to first byte, requests/sec and body MB/sec per route.
+# Requests go through the Flask test client, or with --server over HTTP to a
+# local WSGI server. Results are saved as JSON; with --baseline they are
+# compared to an earlier run.
+#----------------------------------------------------------------------------#
+
+
+class Scenario(object):
+    def __init__(self, name, method, path, data=None):
+        self.name = name
+        self.method = method
+        # path and data are callables taking the run's Context
+        self.path = path
+        self.data = data
+
+
+class Context(object):
+    def __init__(self, catalog, seed=0):
+        self.catalog = catalog
+        self.random = random.Random(seed)
+        # ids of the venues and artists created during the run, deleted later
+        self.created = {'venues': [], 'artists': []}
+
+    def some(self, kind):
+        # popular rows are requested more often, like their pages would be
+        return self.random.choices(range(1, self.catalog.counts[kind] + 1),
+            [1.0 / rank for rank in range(1, self.catalog.counts[kind] + 1)])[0]
+
+    def city(self):
+        return self.random.choice(CITIES)
+
+    def point(self):
+        # somewhere among a city's seeded venues
+        latitude, longitude = geocoder.locate(*self.city())
+        return latitude + self.random.gauss(0, SPREAD), longitude + self.random.gauss(0, SPREAD)
+
+    def genres(self):
+        return sorted(self.catalog.pick_genres())
+
+    def entity_form(self, kind):
+        city, state = self.city()
+        form = {
+            'name': 'Benchmark {}'.format(self.random.randrange(10 ** 6)),
+            'city': city,
+            'state': state,
+            'phone': '555-000-0000',
+            'image_link': 'https://example.com/benchmark.png',
+            'genres': self.genres(),
+        }
+        if kind == 'venues':
+            form['address'] = '1 Benchmark Street'
+        return form
+
+    def show_form(self):
+        start_time = datetime.now() + timedelta(days=self.random.randint(1, 365))
+        return {
+            'venue_id': str(self.some('venues')),
+            'artist_id': str(self.some('artists')),
+            'start_time': start_time.strftime('%Y-%m-%d %I:%M%p'),
+        }
+
+    def take_created(self, kind):
+        return self.created[kind].pop() if self.created[kind] else self.some(kind)
+
+
+SCENARIOS = [
+    Scenario('index', 'GET', lambda ctx: '/'),
+    Scenario('venues', 'GET', lambda ctx: '/venues'),
+    Scenario('venues?genre', 'GET', lambda ctx: '/venues?' + urllib.parse.urlencode({'genre': ctx.genres()[0]})),
+    Scenario('search_venues', 'POST', lambda ctx: '/venues/search',
+        lambda ctx: {'search_term': ctx.city()[0].split()[0][:4]}),
+    Scenario('nearby_venues', 'GET', lambda ctx: '/venues/nearby?' + urllib.parse.urlencode(
+        dict(zip(('lat', 'lng'), ctx.point())))),
+    Scenario('show_venue', 'GET', lambda ctx: '/venues/{}'.format(ctx.some('venues'))),
+    Scenario('create_venue_form', 'GET', lambda ctx: '/venues/create'),
+    Scenario('create_venue_submission', 'POST', lambda ctx: '/venues/create', lambda ctx: ctx.entity_form('venues')),
+    Scenario('edit_venue', 'GET', lambda ctx: '/venues/{}/edit'.format(ctx.some('venues'))),
+    Scenario('edit_venue_submission', 'POST', lambda ctx: '/venues/{}/edit'.format(ctx.some('venues')),
+        lambda ctx: ctx.entity_form('venues')),
+    Scenario('delete_venue', 'POST', lambda ctx: '/venues/{}'.format(ctx.take_created('venues'))),
+    Scenario('artists', 'GET', lambda ctx: '/artists'),
+    Scenario('artists?genre', 'GET', lambda ctx: '/artists?' + urllib.parse.urlencode({'genre': ctx.genres()[0]})),
+    Scenario('search_artists', 'POST', lambda ctx: '/artists/search',
+        lambda ctx: {'search_term': ctx.random.choice(['Blue', 'Hop', 'Band', 'Echo', 'Sax'])}),
+    Scenario('show_artist', 'GET', lambda ctx: '/artists/{}'.format(ctx.some('artists'))),
+    Scenario('create_artist_form', 'GET', lambda ctx: '/artists/create'),
+    Scenario('create_artist_submission', 'POST', lambda ctx: '/artists/create', lambda ctx: ctx.entity_form('artists')),
+    Scenario('edit_artist', 'GET', lambda ctx: '/artists/{}/edit'.format(ctx.some('artists'))),
+    Scenario('edit_artist_submission', 'POST', lambda ctx: '/artists/{}/edit'.format(ctx.some('artists')),
+        lambda ctx: ctx.entity_form('artists')),
+    Scenario('delete_artist', 'POST', lambda ctx: '/artists/{}'.format(ctx.take_created('artists'))),
+    Scenario('shows', 'GET', lambda ctx: '/shows'),
+    Scenario('shows?from_date', 'GET', lambda ctx: '/shows?from_date=' + datetime.now().strftime('%Y-%m-%d')),
+    Scenario('create_shows', 'GET', lambda ctx: '/shows/create'),
+    Scenario('create_show_submission', 'POST', lambda ctx: '/shows/create', lambda ctx: ctx.show_form()),
+    Scenario('export_venues.csv', 'GET', lambda ctx: '/export/venues?format=csv'),
+    Scenario('export_venues.jsonl', 'GET', lambda ctx: '/export/venues?format=jsonl'),
+    Scenario('export_artists.csv', 'GET', lambda ctx: '/export/artists?format=csv'),
+    Scenario('export_artists.jsonl', 'GET', lambda ctx: '/export/artists?format=jsonl'),
+    Scenario('export_shows.csv', 'GET', lambda ctx: '/export/shows?format=csv'),
+    Scenario('export_shows.jsonl', 'GET', lambda ctx: '/export/shows?format=jsonl'),
+    Scenario('cache_stats', 'GET', lambda ctx: '/cache/stats'),
+]
+
+
+class TestClient(object):
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        # (status, location, seconds to the first body chunk, body bytes)
+        started = time.perf_counter()
+        response = self.client.open(path, method=method, data=data, buffered=False)
+        first_byte, size = read_body(response.response, started)
+        response.close()
+        return response.status_code, response.headers.get('Location'), first_byte, size
+
+
+class ServerClient(object):
+    # a local werkzeug server on a free port, requests over plain HTTP
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+        # the access log would be most of the run's output
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.base = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.opener = urllib.request.build_opener(NoRedirect)
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data, doseq=True).encode() if data is not None else None
+        started = time.perf_counter()
+        try:
+            response = self.opener.open(urllib.request.Request(self.base + path, body, method=method))
+        except urllib.error.HTTPError as e:
+            response = e
+        first_byte, size = read_body(iter(lambda: response.read1(CHUNK_SIZE), b''), started)
+        return response.status, response.headers.get('Location'), first_byte, size
+
+    def close(self):
+        self.server.shutdown()
+
+
+def read_body(chunks, started):
+    # (seconds from `started` to the first chunk, bytes), reading them all;
+    # an empty body counts from when it was found empty
+    first_byte = None
+    size = 0
+    for chunk in chunks:
+        if first_byte is None and chunk:
+            first_byte = time.perf_counter() - started
+        size += len(chunk)
+    if first_byte is None:
+        first_byte = time.perf_counter() - started
+    return first_byte, size
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    # redirects are measured as their own response, like the test client does
+    def redirect_request(self, *args):
+        return None
+
+
+def percentile(sorted_values, p):
+    # nearest rank
+    if not sorted_values:
+        return None
+    rank = max(int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies, first_bytes, size, statuses):
+    latencies = sorted(latencies)
+    first_bytes = sorted(first_bytes)
+    seconds = sum(latencies)
+    return {
+        'requests': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'ttfb_p50_ms': round(percentile(first_bytes, 50) * 1000, 3),
+        'ttfb_p95_ms': round(percentile(first_bytes, 95) * 1000, 3),
+        'requests_per_sec': round(len(latencies) / seconds, 1) if seconds > 0 else None,
+        'mb_per_sec': round(size / seconds / 10 ** 6, 2) if seconds > 0 else None,
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+def run_scenario(client, scenario, ctx, requests, warmup):
+    latencies = []
+    first_bytes = []
+    size = 0
+    statuses = {}
+    for i in range(warmup + requests):
+        path = scenario.path(ctx)
+        data = scenario.data(ctx) if scenario.data else None
+        started = time.perf_counter()
+        status, location, first_byte, body_size = client.request(scenario.method, path, data)
+        elapsed = time.perf_counter() - started
+
+        if scenario.name.startswith('create_') and location and status == 302:
+            # keep the new rows around for the delete scenarios
+            kind, created_id = location.rstrip('/').split('/')[-2:]
+            if created_id.isdigit() and kind in ctx.created:
+                ctx.created[kind].append(int(created_id))
+        if i >= warmup:
+            latencies.append(elapsed)
+            first_bytes.append(first_byte)
+            size += body_size
+            statuses[status] = statuses.get(status, 0) + 1
+    return summarize(latencies, first_bytes, size, statuses)
+
+
+def run(app, catalog, requests=100, warmup=5, server=False, only=None, seed=0):
+    ctx = Context(catalog, seed)
+    client = ServerClient(app) if server else TestClient(app)
+    results = {}
+    try:
+        for scenario in SCENARIOS:
+            if only and scenario.name not in only:
+                continue
+            results[scenario.name] = run_scenario(client, scenario, ctx, requests, warmup)
+    finally:
+        if server:
+            client.close()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # (route, metric, baseline, current, change) for every metric worse than `tolerance`
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'ttfb_p50_ms', 'ttfb_p95_ms'):
+            # baselines saved before time to first byte was measured lack it
+            if previous.get(metric) and current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append((name, metric, previous[metric], current[metric], current[metric] / previous[metric] - 1))
+        if previous['requests_per_sec'] and current['requests_per_sec'] < previous['requests_per_sec'] * (1 - tolerance):
+            regressions.append((name, 'requests_per_sec', previous['requests_per_sec'], current['requests_per_sec'],
+                current['requests_per_sec'] / previous['requests_per_sec'] - 1))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test every Fyyur route.')
+    parser.add_argument('--database', default='sqlite:///fyyur_bench.db')
+    parser.add_argument('--no-seed', action='store_true', help='reuse an already seeded database')
+    parser.add_argument('--venues', type=int, default=1000)
+    parser.add_argument('--artists', type=int, default=1000)
+    parser.add_argument('--shows', type=int, default=10000)
+    parser.add_argument('--skew', type=float, default=1.1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--requests', type=int, default=100, help='measured requests per route')
+    parser.add_argument('--warmup', type=int, default=5, help='unmeasured requests per route')
+    parser.add_argument('--route', action='append', help='only run this route, can be repeated')
+    parser.add_argument('--server', action='store_true', help='go over HTTP to a local WSGI server')
+    parser.add_argument('--cache', choices=['lru', 'null'], help='override CACHE_TYPE')
+    parser.add_argument('--output', help='save the results as JSON')
+    parser.add_argument('--baseline', help='compare with the JSON results of an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed slowdown against the baseline')
+    args = parser.parse_args()
+
+    import app as fyyur
+    from cache import make_cache
+    # background rolls would land in the middle of the measured requests
+    fyyur.app.config.update(SQLALCHEMY_DATABASE_URI=args.database, WTF_CSRF_ENABLED=False, ROLLOVER_INTERVAL=None)
+    if args.cache:
+        fyyur.app.config['CACHE_TYPE'] = args.cache
+        fyyur.response_cache = make_cache(fyyur.app.config)
+
+    catalog = SyntheticCatalog(args.venues, args.artists, args.shows, args.skew, args.seed)
+    with fyyur.app.app_context():
+        if not args.no_seed:
+            seed(catalog)
+        fyyur.venue_index.invalidate()
+        fyyur.artist_index.invalidate()
+        fyyur.response_cache.clear()
+
+    results = run(fyyur.app, catalog, args.requests, args.warmup, args.server, args.route, args.seed)
+    report = {
+        'database': fyyur.app.config['SQLALCHEMY_DATABASE_URI'].split('://')[0],
+        'dataset': catalog.counts,
+        'client': 'server' if args.server else 'test_client',
+        'cache': fyyur.app.config['CACHE_TYPE'],
+        'routes': results,
+    }
+
+    print('{:<26} {:>8} {:>9} {:>9} {:>9} {:>9} {:>10} {:>8}'.format('route', 'requests', 'p50 ms', 'p95 ms', 'p99 ms',
+        'ttfb ms', 'req/s', 'MB/s'))
+    for name, result in results.items():
+        print('{:<26} {:>8} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f} {:>10.1f} {:>8.2f}'.format(name, result['requests'],
+            result['p50_ms'], result['p95_ms'], result['p99_ms'], result['ttfb_p50_ms'],
+            result['requests_per_sec'] or 0, result['mb_per_sec'] or 0))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if (baseline['database'], baseline['dataset'], baseline['client']) != (report['database'], report['dataset'], report['client']):
+            print('warning: the baseline ran with a different database, dataset or client')
+        regressions = compare(results, baseline['routes'], args.tolerance)
+        for name, metric, previous, current, change in regressions:
+            print('REGRESSION {} {}: {} -> {} ({:+.0%})'.format(name, metric, previous, current, change))
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
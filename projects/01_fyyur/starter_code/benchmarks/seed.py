@@ -0,0 +1,157 @@
+import argparse
+import random
+from datetime import datetime, timedelta
+
+import config
+from forms import Genre, State
+from geo import Geocoder, encode
+
+#----------------------------------------------------------------------------#
+# Synthetic data.
+#
+# Venues and artists are spread over cities and genres with a Zipf-like skew,
+# so a few cities and genres hold most of the catalog like in production, and
+# shows cluster on popular venues and artists.
+#----------------------------------------------------------------------------#
+
+CITIES = [
+    ('New York', 'NY'), ('Los Angeles', 'CA'), ('Chicago', 'IL'), ('Houston', 'TX'),
+    ('Phoenix', 'AZ'), ('Philadelphia', 'PA'), ('San Antonio', 'TX'), ('San Diego', 'CA'),
+    ('Dallas', 'TX'), ('San Jose', 'CA'), ('Austin', 'TX'), ('Jacksonville', 'FL'),
+    ('San Francisco', 'CA'), ('Columbus', 'OH'), ('Seattle', 'WA'), ('Denver', 'CO'),
+    ('Boston', 'MA'), ('Nashville', 'TN'), ('Portland', 'OR'), ('Las Vegas', 'NV'),
+]
+WORDS = [
+    'Blue', 'Hop', 'Sax', 'Wild', 'Park', 'Square', 'Live', 'Hall', 'Club', 'Room', 'Band',
+    'Petals', 'Pianos', 'Bar', 'Lounge', 'Echo', 'Velvet', 'Electric', 'Garden', 'River',
+]
+# venues are scattered around their city's coordinates, about this many degrees
+SPREAD = 0.1
+geocoder = Geocoder(config.GEOCODING_TABLE)
+
+
+def zipf_weights(n, skew):
+    return [1.0 / (rank ** skew) for rank in range(1, n + 1)]
+
+
+class SyntheticCatalog(object):
+    def __init__(self, venues=1000, artists=1000, shows=10000, skew=1.1, seed=0):
+        self.counts = {'venues': venues, 'artists': artists, 'shows': shows}
+        self.skew = skew
+        self.random = random.Random(seed)
+        self.city_weights = zipf_weights(len(CITIES), skew)
+        self.genres = [genre.value for genre in Genre]
+        self.genre_weights = zipf_weights(len(self.genres), skew)
+
+    def name(self, i):
+        return '{} {} {}'.format(self.random.choice(WORDS), self.random.choice(WORDS), i)
+
+    def pick_genres(self):
+        return set(self.random.choices(self.genres, self.genre_weights, k=self.random.randint(1, 3)))
+
+    def entities(self, kind):
+        for i in range(1, self.counts[kind] + 1):
+            city, state = self.random.choices(CITIES, self.city_weights)[0]
+            entity = {
+                'id': i,
+                'name': self.name(i),
+                'city': city,
+                'state': state,
+                'phone': '555-{:03d}-{:04d}'.format(i % 1000, i % 10000),
+                'image_link': 'https://example.com/{}/{}.png'.format(kind, i),
+                'genres': self.pick_genres(),
+            }
+            if kind == 'venues':
+                entity['address'] = '{} {} Street'.format(i, self.random.choice(WORDS))
+                entity['seeking_talent'] = self.random.random() < 0.3
+                latitude, longitude = geocoder.locate(city, state)
+                entity['latitude'] = latitude + self.random.gauss(0, SPREAD)
+                entity['longitude'] = longitude + self.random.gauss(0, SPREAD)
+                entity['geohash'] = encode(entity['latitude'], entity['longitude'])
+            else:
+                entity['seeking_venue'] = self.random.random() < 0.3
+            yield entity
+
+    def shows(self, duration=timedelta(hours=3), attempts=20):
+        # a third of the shows are upcoming; popular venues and artists get
+        # more. Bookings never overlap, a show that finds no free slot after
+        # `attempts` tries is left out
+        from booking import BookingIndex
+        venue_ids = range(1, self.counts['venues'] + 1)
+        artist_ids = range(1, self.counts['artists'] + 1)
+        venue_weights = zipf_weights(self.counts['venues'], self.skew)
+        artist_weights = zipf_weights(self.counts['artists'], self.skew)
+        booked = {'venue_id': BookingIndex(), 'artist_id': BookingIndex()}
+        now = datetime.now().replace(minute=0, second=0, microsecond=0)
+        show_id = 0
+        for i in range(self.counts['shows']):
+            for attempt in range(attempts):
+                show = {
+                    'venue_id': self.random.choices(venue_ids, venue_weights)[0],
+                    'artist_id': self.random.choices(artist_ids, artist_weights)[0],
+                    'start_time': now + timedelta(hours=self.random.randint(-24 * 365 * 2, 24 * 365)),
+                }
+                show['end_time'] = show['start_time'] + duration
+                if not any(index.conflicts(show[field], show['start_time'], show['end_time'])
+                        for field, index in booked.items()):
+                    break
+            else:
+                continue
+            show_id += 1
+            show['id'] = show_id
+            for field, index in booked.items():
+                index.add(show[field], show_id, show['start_time'], show['end_time'])
+            yield show
+
+
+def batches(rows, size=5000):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed(catalog):
+    # core inserts, one executemany per batch; run inside an app context
+    from app import db, Venue, Artist, Show, VenueGenre, ArtistGenre, check_upcoming_counters
+
+    db.drop_all()
+    db.create_all()
+    for kind, model, genre_model, genre_fk in (
+            ('venues', Venue, VenueGenre, 'venue_id'),
+            ('artists', Artist, ArtistGenre, 'artist_id')):
+        for batch in batches(catalog.entities(kind)):
+            db.session.execute(model.__table__.insert(),
+                [{key: value for key, value in entity.items() if key != 'genres'} for entity in batch])
+            db.session.execute(genre_model.__table__.insert(),
+                [{genre_fk: entity['id'], 'genre': genre} for entity in batch for genre in entity['genres']])
+    for batch in batches(catalog.shows()):
+        db.session.execute(Show.__table__.insert(), batch)
+    db.session.commit()
+    check_upcoming_counters(rebuild=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed a Fyyur database with synthetic data.')
+    parser.add_argument('--database', default='sqlite:///fyyur_bench.db')
+    parser.add_argument('--venues', type=int, default=1000)
+    parser.add_argument('--artists', type=int, default=1000)
+    parser.add_argument('--shows', type=int, default=10000)
+    parser.add_argument('--skew', type=float, default=1.1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from app import app
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database
+    with app.app_context():
+        seed(SyntheticCatalog(args.venues, args.artists, args.shows, args.skew, args.seed))
+    print('Seeded {} with {} venues, {} artists and {} shows.'.format(
+        args.database, args.venues, args.artists, args.shows))
+
+
+if __name__ == '__main__':
+    main()
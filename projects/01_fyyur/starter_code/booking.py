@@ -0,0 +1,208 @@
+import threading
+from bisect import bisect_left, bisect_right
+
+#----------------------------------------------------------------------------#
+# Bookings.
+#
+# A venue or an artist can only play one show at a time. PostgreSQL enforces
+# that with GiST exclusion constraints on (venue_id, tsrange) and (artist_id,
+# tsrange), see the booking migration. Other backends check against the
+# in-process index below, built lazily from the database and kept up to date
+# by the model events registered in app.py. app.py holds a lock from the check
+# to the insert, which only rules out double bookings within one process:
+# several processes on one SQLite or MySQL database can still race.
+#
+# Shows are half-open [start_time, end_time) intervals, a show may start when
+# the previous one ends.
+#----------------------------------------------------------------------------#
+
+
+class Timeline(object):
+    '''
+    The busy time of one key as sorted, disjoint blocks, [start, end,
+    {show_id: (start, end)}], held in chunks of at most 2 * LOAD blocks so
+    that booking a show moves a chunk's worth of entries rather than every
+    later block. Blocks are found by binary search over the chunks' first
+    starts and then over the starts within a chunk.
+    '''
+    LOAD = 256
+
+    def __init__(self, blocks=()):
+        blocks = list(blocks)
+        self.chunks = [blocks[i:i + self.LOAD] for i in range(0, len(blocks), self.LOAD)]
+        self.starts = [[block[0] for block in chunk] for chunk in self.chunks]
+        self.firsts = [starts[0] for starts in self.starts]
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            for block in chunk:
+                yield block
+
+    def overlapping(self, start, end):
+        # (chunk, position) of the blocks overlapping [start, end), last first
+        found = []
+        chunk = bisect_left(self.firsts, end) - 1
+        if chunk < 0:
+            return found
+        position = bisect_left(self.starts[chunk], end)
+        # blocks are disjoint and sorted, so their ends are sorted too
+        while True:
+            if position == 0:
+                if chunk == 0:
+                    break
+                chunk -= 1
+                position = len(self.chunks[chunk])
+            if self.chunks[chunk][position - 1][1] <= start:
+                break
+            position -= 1
+            found.append((chunk, position))
+        return found
+
+    def locate(self, start):
+        # (chunk, position) of the last block starting at or before `start`, or None
+        chunk = bisect_right(self.firsts, start) - 1
+        if chunk < 0:
+            return None
+        return chunk, bisect_right(self.starts[chunk], start) - 1
+
+    def delete(self, chunk, position):
+        del self.chunks[chunk][position]
+        del self.starts[chunk][position]
+        if self.chunks[chunk]:
+            self.firsts[chunk] = self.starts[chunk][0]
+        else:
+            del self.chunks[chunk], self.starts[chunk], self.firsts[chunk]
+
+    def insert(self, block):
+        # `block` must not overlap the others
+        if not self.chunks:
+            self.chunks.append([block])
+            self.starts.append([block[0]])
+            self.firsts.append(block[0])
+            return
+        chunk = max(bisect_right(self.firsts, block[0]) - 1, 0)
+        position = bisect_left(self.starts[chunk], block[0])
+        self.chunks[chunk].insert(position, block)
+        self.starts[chunk].insert(position, block[0])
+        self.firsts[chunk] = self.starts[chunk][0]
+        if len(self.chunks[chunk]) > 2 * self.LOAD:
+            self.chunks[chunk + 1:chunk + 1] = [self.chunks[chunk][self.LOAD:]]
+            self.starts[chunk + 1:chunk + 1] = [self.starts[chunk][self.LOAD:]]
+            self.firsts.insert(chunk + 1, self.starts[chunk + 1][0])
+            del self.chunks[chunk][self.LOAD:], self.starts[chunk][self.LOAD:]
+
+
+def blocks_of(shows):
+    # the blocks of (show_id, start, end) shows, merging the overlapping ones
+    blocks = []
+    for show_id, start, end in sorted(shows, key=lambda show: show[1]):
+        if blocks and blocks[-1][1] > start:
+            block = blocks[-1]
+            block[1] = max(block[1], end)
+            block[2][show_id] = (start, end)
+        else:
+            blocks.append([start, end, {show_id: (start, end)}])
+    return blocks
+
+
+class BookingIndex(object):
+    '''
+    Busy time per key (a venue or artist id) as a Timeline of blocks; shows
+    only share a block when they overlap, which only data from before the
+    constraints can do. The index is shared by the threads serving requests,
+    every method holds its lock.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timelines = {}
+        self.ready = False
+
+    def build(self, rows):
+        # rows of (key, show_id, start, end)
+        shows = {}
+        for key, show_id, start, end in rows:
+            shows.setdefault(key, []).append((show_id, start, end))
+        timelines = {key: Timeline(blocks_of(key_shows)) for key, key_shows in shows.items()}
+        with self.lock:
+            self.timelines = timelines
+            self.ready = True
+
+    def invalidate(self):
+        self.ready = False
+
+    def conflicts(self, key, start, end):
+        # ids of the shows booked for `key` during [start, end)
+        with self.lock:
+            timeline = self.timelines.get(key)
+            if timeline is None:
+                return []
+            return sorted(show_id for chunk, position in timeline.overlapping(start, end)
+                for show_id, (show_start, show_end) in timeline.chunks[chunk][position][2].items()
+                if show_start < end and show_end > start)
+
+    def add(self, key, show_id, start, end):
+        with self.lock:
+            timeline = self.timelines.setdefault(key, Timeline())
+            shows = {show_id: (start, end)}
+            for chunk, position in timeline.overlapping(start, end):
+                block = timeline.chunks[chunk][position]
+                start = min(start, block[0])
+                end = max(end, block[1])
+                shows.update(block[2])
+                timeline.delete(chunk, position)
+            timeline.insert([start, end, shows])
+
+    def overlaps(self):
+        # (key, show ids) of every group of booked shows that overlap
+        with self.lock:
+            return [(key, sorted(block[2])) for key, timeline in sorted(self.timelines.items())
+                for block in timeline if len(block[2]) > 1]
+
+    def remove(self, key, show_id, start):
+        with self.lock:
+            timeline = self.timelines.get(key)
+            place = timeline.locate(start) if timeline is not None else None
+            if place is None or show_id not in timeline.chunks[place[0]][place[1]][2]:
+                return
+            block = timeline.chunks[place[0]][place[1]]
+            del block[2][show_id]
+            timeline.delete(*place)
+            # what is left of the block may fall apart into several blocks
+            for remaining in blocks_of((other_id, other_start, other_end)
+                    for other_id, (other_start, other_end) in block[2].items()):
+                timeline.insert(remaining)
+
+
+def validate_schedule(bookings, indexes):
+    '''
+    Checks new bookings against the booked shows and against each other.
+    `bookings` are dicts with a start_time, an end_time and the key fields
+    of `indexes`, a sequence of (key field, BookingIndex). Returns
+    {position in bookings: errors} for the ones that conflict; the others
+    are compatible with each other and with the indexes.
+    '''
+    scheduled = [(field, index, BookingIndex()) for field, index in indexes]
+    rejected = {}
+    for position, booking in enumerate(bookings):
+        start, end = booking['start_time'], booking['end_time']
+        errors = {}
+        if end <= start:
+            errors['end_time'] = ['The show has to end after it starts.']
+        for field, index, batch in scheduled:
+            if errors:
+                break
+            key = booking[field]
+            booked = index.conflicts(key, start, end)
+            clashing = batch.conflicts(key, start, end)
+            if booked:
+                errors[field] = ['Already booked for show {} at that time.'.format(
+                    ', '.join(str(show_id) for show_id in booked))]
+            elif clashing:
+                errors[field] = ['Already booked at that time by booking {} of this schedule.'.format(
+                    ', '.join(str(other + 1) for other in clashing))]
+        if errors:
+            rejected[position] = errors
+            continue
+        for field, index, batch in scheduled:
+            batch.add(booking[field], position, start, end)
+    return rejected
@@ -0,0 +1,157 @@
+import pickle
+import time
+import threading
+from collections import OrderedDict
+
+#----------------------------------------------------------------------------#
+# Response cache.
+#
+# Entries are stored with a set of tags naming the rows they were built from
+# ('venue:3', or 'venues' for "any venue"). Writes invalidate the tags of the
+# rows they touch, which drops exactly the entries that depended on them.
+#----------------------------------------------------------------------------#
+
+class CacheStats(object):
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def as_dict(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+
+class NullCache(object):
+    def __init__(self):
+        self.stats = CacheStats()
+
+    def get(self, key):
+        self.stats.misses += 1
+        return None
+
+    def set(self, key, value, tags=()):
+        pass
+
+    def invalidate(self, *tags):
+        pass
+
+    def clear(self):
+        pass
+
+
+class LRUCache(object):
+    def __init__(self, maxsize=1024, ttl=300, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.stats = CacheStats()
+        # key -> (expires, value, tags), least recently used first
+        self.entries = OrderedDict()
+        # tag -> keys
+        self.tagged = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= self.clock():
+                self._discard(key)
+                self.stats.evictions += 1
+                entry = None
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats.hits += 1
+            return entry[1]
+
+    def set(self, key, value, tags=()):
+        with self.lock:
+            self._discard(key)
+            self.entries[key] = (self.clock() + self.ttl, value, frozenset(tags))
+            for tag in tags:
+                self.tagged.setdefault(tag, set()).add(key)
+            while len(self.entries) > self.maxsize:
+                self._discard(next(iter(self.entries)))
+                self.stats.evictions += 1
+
+    def invalidate(self, *tags):
+        with self.lock:
+            for tag in tags:
+                for key in list(self.tagged.get(tag, ())):
+                    self._discard(key)
+                    self.stats.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.tagged.clear()
+
+    def _discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self.tagged[tag]
+            keys.discard(key)
+            if not keys:
+                del self.tagged[tag]
+
+
+class RedisCache(object):
+    def __init__(self, url, ttl=300, prefix='fyyur:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('CACHE_TYPE "redis" needs the redis package installed')
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.stats = CacheStats()
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return pickle.loads(value)
+
+    def set(self, key, value, tags=()):
+        pipe = self.client.pipeline()
+        pipe.setex(self.prefix + key, self.ttl, pickle.dumps(value))
+        for tag in tags:
+            # tag sets outlive their entries, invalidating a stale key is a no-op
+            pipe.sadd(self.prefix + 'tag:' + tag, self.prefix + key)
+            pipe.expire(self.prefix + 'tag:' + tag, self.ttl)
+        pipe.execute()
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            tag_key = self.prefix + 'tag:' + tag
+            keys = self.client.smembers(tag_key)
+            if keys:
+                self.stats.invalidations += self.client.delete(*keys)
+            self.client.delete(tag_key)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+def make_cache(config):
+    cache_type = config.get('CACHE_TYPE', 'lru')
+    if cache_type == 'lru':
+        return LRUCache(config.get('CACHE_MAXSIZE', 1024), config.get('CACHE_TTL', 300))
+    if cache_type == 'redis':
+        return RedisCache(config['CACHE_REDIS_URL'], config.get('CACHE_TTL', 300))
+    if cache_type == 'null':
+        return NullCache()
+    raise ValueError('unknown CACHE_TYPE "{}"'.format(cache_type))
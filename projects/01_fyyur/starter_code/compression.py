@@ -0,0 +1,140 @@
+import gzip
+import threading
+from collections import OrderedDict
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+#----------------------------------------------------------------------------#
+# Response compression and conditional GETs.
+#
+# Text responses over COMPRESS_MIN_SIZE bytes are sent with brotli (when the
+# brotli package is installed) or gzip, whichever the client accepts. The
+# compressed variant of a response with a strong ETag gets its own ETag, the
+# original with an encoding suffix, and its compressed body is remembered so
+# cached pages are compressed only once.
+#
+# Config:
+#   COMPRESS_MIN_SIZE    smaller responses are sent as they are
+#   COMPRESS_LEVEL       gzip level, brotli uses its own quality 5
+#   COMPRESS_MIMETYPES   what to compress
+#   COMPRESS_CACHE_SIZE  how many compressed bodies to remember
+#----------------------------------------------------------------------------#
+
+ENCODINGS = ('br', 'gzip')
+
+
+def etag_variants(etag):
+    # the ETag of every encoding a response may have been sent with
+    return [etag] + ['{}-{}'.format(etag, encoding) for encoding in ENCODINGS]
+
+
+def matching_etag(etag):
+    # the variant of `etag` the request's If-None-Match names, or None
+    for variant in etag_variants(etag):
+        if request.if_none_match.contains(variant):
+            return variant
+    return None
+
+
+class ResponseStats(object):
+    def __init__(self):
+        self.pages = 0
+        self.not_modified = 0
+        self.compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.lock = threading.Lock()
+
+    def page(self, not_modified):
+        with self.lock:
+            self.pages += 1
+            if not_modified:
+                self.not_modified += 1
+
+    def compress(self, size, compressed_size):
+        with self.lock:
+            self.compressed += 1
+            self.bytes_in += size
+            self.bytes_out += compressed_size
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                'pages': self.pages,
+                'not_modified': self.not_modified,
+                'not_modified_ratio': round(self.not_modified / self.pages, 3) if self.pages else None,
+                'compressed': self.compressed,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'bytes_saved': self.bytes_in - self.bytes_out,
+            }
+
+
+class Compression(object):
+    def __init__(self, app=None):
+        self.stats = ResponseStats()
+        # (etag, encoding) -> compressed body, least recently used first
+        self.bodies = OrderedDict()
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+        app.config.setdefault('COMPRESS_LEVEL', 6)
+        app.config.setdefault('COMPRESS_MIMETYPES', ['text/html', 'text/css', 'application/json', 'application/javascript'])
+        app.config.setdefault('COMPRESS_CACHE_SIZE', 256)
+        self.app = app
+        app.after_request(self.after_request)
+
+    def choose_encoding(self):
+        accepted = request.accept_encodings
+        for encoding in ENCODINGS:
+            if encoding == 'br' and brotli is None:
+                continue
+            if accepted[encoding]:
+                return encoding
+        return None
+
+    def compress(self, body, encoding):
+        if encoding == 'br':
+            return brotli.compress(body, quality=5)
+        return gzip.compress(body, self.app.config['COMPRESS_LEVEL'])
+
+    def after_request(self, response):
+        config = self.app.config
+        if response.mimetype not in config['COMPRESS_MIMETYPES'] or response.direct_passthrough:
+            return response
+        response.vary.add('Accept-Encoding')
+        if (response.status_code != 200 or 'Content-Encoding' in response.headers
+                or response.content_length is None or response.content_length < config['COMPRESS_MIN_SIZE']):
+            return response
+        encoding = self.choose_encoding()
+        if encoding is None:
+            return response
+
+        body = response.get_data()
+        etag, weak = response.get_etag()
+        key = (etag, encoding) if etag and not weak else None
+        with self.lock:
+            compressed = self.bodies.get(key) if key else None
+            if compressed is not None:
+                self.bodies.move_to_end(key)
+        if compressed is None:
+            compressed = self.compress(body, encoding)
+            if key:
+                with self.lock:
+                    self.bodies[key] = compressed
+                    if len(self.bodies) > config['COMPRESS_CACHE_SIZE']:
+                        self.bodies.popitem(last=False)
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        if key:
+            response.set_etag('{}-{}'.format(etag, encoding))
+        self.stats.compress(len(body), len(compressed))
+        return response
@@ -0,0 +1,90 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+from itertools import groupby
+
+from importer import batched
+
+#----------------------------------------------------------------------------#
+# Export.
+#
+# The same formats the importer reads, CSV and JSON Lines, written a chunk of
+# rows at a time from streamed query results into a generator response:
+# nothing holds more than one chunk of rows, whatever the size of the table.
+# Genres come from a second query over the genre table in the same id order,
+# merged as both streams go.
+#
+# Config:
+#   EXPORT_FETCH_SIZE  rows per fetch from the server-side cursor
+#   EXPORT_CHUNK_ROWS  rows per chunk of the response body
+#   EXPORT_GZIP_LEVEL  compression level when the client accepts gzip
+#----------------------------------------------------------------------------#
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def export_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def merge_genres(rows, genre_rows):
+    '''
+    Appends the list of genres to every row of `rows`, given the (id, genre)
+    rows of the genre table; both ordered by id, the row id first.
+    '''
+    genres = groupby(genre_rows, key=lambda genre_row: genre_row[0])
+    pending = next(genres, None)
+    for row in rows:
+        while pending is not None and pending[0] < row[0]:
+            pending = next(genres, None)
+        if pending is not None and pending[0] == row[0]:
+            yield tuple(row) + ([genre for id, genre in pending[1]],)
+            pending = next(genres, None)
+        else:
+            yield tuple(row) + ([],)
+
+
+def csv_cell(value):
+    # as the importer reads it, genres like "Jazz,Reggae"
+    if isinstance(value, list):
+        return ','.join(value)
+    return export_value(value)
+
+
+def csv_chunks(columns, rows, chunk_rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for chunk in batched(rows, chunk_rows):
+        writer.writerows([csv_cell(value) for value in row] for row in chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def jsonl_chunks(columns, rows, chunk_rows):
+    for chunk in batched(rows, chunk_rows):
+        yield ''.join(json.dumps(dict(zip(columns, map(export_value, row)))) + '\n' for row in chunk)
+
+
+def encoded(chunks, level=None):
+    # utf-8 chunks, gzip compressed when a level is given
+    if level is None:
+        for chunk in chunks:
+            yield chunk.encode()
+        return
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode())
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,65 @@
+import threading
+from collections import OrderedDict
+import babel.dates
+from babel import Locale
+
+#----------------------------------------------------------------------------#
+# Date formatting.
+#
+# babel.dates.format_datetime() resolves the locale and the pattern on every
+# call. The formatter below does that once per (format, locale) and remembers
+# the strings it produced, since listings repeat the same show times a lot.
+#----------------------------------------------------------------------------#
+
+# the filter's own short names for Fyyur's patterns
+FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+class DateFormatter(object):
+    def __init__(self, locale=None, maxsize=65536):
+        self.locale = locale or babel.dates.LC_TIME
+        self.maxsize = maxsize
+        # (format, locale) -> (DateTimePattern, Locale)
+        self.compiled = {}
+        # (value, format, locale) -> formatted string, least recently used first
+        self.formatted = OrderedDict()
+        self.lock = threading.Lock()
+
+    def compile(self, format, locale=None):
+        key = (format, locale or self.locale)
+        compiled = self.compiled.get(key)
+        if compiled is None:
+            pattern = babel.dates.parse_pattern(FORMATS.get(format, format))
+            compiled = self.compiled[key] = (pattern, Locale.parse(key[1]))
+        return compiled
+
+    def format(self, value, format='medium', locale=None):
+        if format not in FORMATS and format in ('long', 'short'):
+            # babel's own named formats combine a date and a time pattern
+            return babel.dates.format_datetime(value, format, locale=locale or self.locale)
+
+        key = (value, format, locale)
+        with self.lock:
+            formatted = self.formatted.get(key)
+            if formatted is not None:
+                self.formatted.move_to_end(key)
+                return formatted
+
+        pattern, parsed_locale = self.compile(format, locale)
+        if value.tzinfo is None:
+            # like babel, naive datetimes are shown as they are
+            value = value.replace(tzinfo=babel.dates.UTC)
+        formatted = pattern.apply(value, parsed_locale)
+        with self.lock:
+            self.formatted[key] = formatted
+            if len(self.formatted) > self.maxsize:
+                self.formatted.popitem(last=False)
+        return formatted
+
+    def format_many(self, values, format='medium', locale=None):
+        # formats a whole column at once, compiling the pattern a single time
+        self.compile(format, locale)
+        return [self.format(value, format, locale) for value in values]
@@ -0,0 +1,143 @@
+import csv
+import math
+import os
+
+#----------------------------------------------------------------------------#
+# Venue locations.
+#
+# Venues get a latitude and longitude from an offline table of city
+# coordinates (geocoding.csv, city,state,latitude,longitude) unless they are
+# given their own. Each venue also stores the geohash of its coordinates as an
+# integer: longitude and latitude bits interleaved, most significant first.
+# A geohash cell is then a range of integers, and the venues near a point are
+# found by a few range scans of a plain btree index on any backend, over the
+# cells covering the search circle, then filtered by their exact distance.
+#
+# Config:
+#   GEOCODING_TABLE   the city coordinates, geocoding.csv by default
+#   NEARBY_RADIUS_KM  the search radius when none is given
+#   NEARBY_LIMIT      the most venues a search returns
+#----------------------------------------------------------------------------#
+
+# bits per coordinate, 26 are well under a metre
+GEOHASH_PRECISION = 26
+GEOHASH_BITS = 2 * GEOHASH_PRECISION
+
+# a search starts at an eighth of its radius and doubles it until it finds
+# enough venues, dense cities rarely need the whole radius
+SEARCH_STEPS = 4
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def cell(latitude, longitude, precision):
+    # (x, y) of the cell holding the point, `precision` bits each
+    cells = 1 << precision
+    x = int((longitude + 180) / 360 * cells)
+    y = int((latitude + 90) / 180 * cells)
+    return min(x, cells - 1), min(y, cells - 1)
+
+
+def interleave(x, y, precision):
+    geohash = 0
+    for bit in range(precision - 1, -1, -1):
+        geohash = (geohash << 2) | ((x >> bit) & 1) << 1 | ((y >> bit) & 1)
+    return geohash
+
+
+def encode(latitude, longitude):
+    return interleave(*cell(latitude, longitude, GEOHASH_PRECISION), GEOHASH_PRECISION)
+
+
+def distance_km(latitude, longitude, other_latitude, other_longitude):
+    # haversine
+    lat1, lat2 = math.radians(latitude), math.radians(other_latitude)
+    dlat = lat2 - lat1
+    dlng = math.radians(other_longitude - longitude)
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def longitude_span(latitude, radius_km):
+    '''
+    How many degrees of longitude a circle of `radius_km` around a point at
+    `latitude` spans either way, or None when it goes around the pole.
+    '''
+    angle = radius_km / EARTH_RADIUS_KM
+    circle = math.cos(math.radians(latitude))
+    if angle >= math.pi / 2 or math.sin(angle) >= circle:
+        return None
+    return math.degrees(math.asin(math.sin(angle) / circle))
+
+
+def search_cells(latitude, longitude, radius_km, precision):
+    # (x ranges, y range) of the cells covering the bounding box of the circle
+    cells = 1 << precision
+    degrees = radius_km / KM_PER_DEGREE
+    south, north = max(-90.0, latitude - degrees), min(90.0, latitude + degrees)
+    ys = range(cell(south, 0, precision)[1], cell(north, 0, precision)[1] + 1)
+    span = longitude_span(latitude, radius_km)
+    if span is None or span >= 180:
+        return [range(cells)], ys
+    # longitude wraps around at the antimeridian
+    west = cell(0, (longitude - span + 180) % 360 - 180, precision)[0]
+    east = cell(0, (longitude + span + 180) % 360 - 180, precision)[0]
+    if west <= east:
+        return [range(west, east + 1)], ys
+    return [range(west, cells), range(0, east + 1)], ys
+
+
+def search_ranges(latitude, longitude, radius_km, max_cells=16):
+    '''
+    Sorted, merged [low, high) geohash ranges covering every point within
+    `radius_km` of the given one, plus some more around it: the cells over
+    the circle's bounding box, at the finest precision that takes at most
+    `max_cells` of them.
+    '''
+    for precision in range(GEOHASH_PRECISION, -1, -1):
+        xs, ys = search_cells(latitude, longitude, radius_km, precision)
+        if sum(map(len, xs)) * len(ys) <= max_cells:
+            break
+    span = 1 << (GEOHASH_BITS - 2 * precision)
+    ranges = []
+    for prefix in sorted(interleave(x, y, precision) for row in xs for x in row for y in ys):
+        low = prefix * span
+        if ranges and ranges[-1][1] == low:
+            ranges[-1][1] = low + span
+        else:
+            ranges.append([low, low + span])
+    return [tuple(bounds) for bounds in ranges]
+
+
+def search_radii(radius_km):
+    # the radii a search widens through, SEARCH_STEPS of them up to `radius_km`
+    return [radius_km / (1 << step) for step in range(SEARCH_STEPS - 1, -1, -1)]
+
+
+class Geocoder(object):
+    '''
+    City coordinates from a CSV table, read the first time they are needed.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.places = None
+
+    def load(self):
+        places = {}
+        if os.path.exists(self.path):
+            with open(self.path, newline='') as table:
+                for row in csv.DictReader(table):
+                    places[self.key(row['city'], row['state'])] = (
+                        float(row['latitude']), float(row['longitude']))
+        self.places = places
+
+    @staticmethod
+    def key(city, state):
+        return (' '.join((city or '').lower().split()), (state or '').upper())
+
+    def locate(self, city, state):
+        # (latitude, longitude) of the city, or None
+        if self.places is None:
+            self.load()
+        return self.places.get(self.key(city, state))
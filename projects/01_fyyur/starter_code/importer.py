@@ -0,0 +1,142 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#
+# Rows are streamed from CSV or JSON Lines files, validated one by one and
+# written in batches, one transaction per batch. After every batch the number
+# of consumed rows is saved to a checkpoint file, so an interrupted import
+# started again with the same checkpoint skips what was already written.
+#----------------------------------------------------------------------------#
+
+def read_rows(path):
+    # yields (line number, row dict)
+    if path.endswith('.csv'):
+        with open(path, newline='') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+    elif path.endswith('.jsonl') or path.endswith('.ndjson'):
+        with open(path) as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError as e:
+                    # reported like any other invalid row
+                    yield line_number, ValueError('malformed JSON: {}'.format(e))
+    else:
+        raise ValueError('expected a .csv, .jsonl or .ndjson file: {}'.format(path))
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+class Checkpoint(object):
+    def __init__(self, path):
+        self.path = path
+        self.rows_done = 0
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.rows_done = json.load(f)['rows_done']
+
+    def save(self, rows_done):
+        self.rows_done = rows_done
+        if self.path:
+            # write then rename, so a crash never leaves a torn checkpoint
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump({'rows_done': rows_done}, f)
+            os.replace(self.path + '.tmp', self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class ImportReport(object):
+    '''
+    JSON Lines report: one {"line", "errors"} object per rejected row and a
+    final {"summary"} object with the counts and throughput.
+    '''
+    def __init__(self, path):
+        self.file = open(path, 'a') if path else None
+        self.rows = 0
+        self.inserted = 0
+        self.rejected = 0
+        self.started = time.monotonic()
+
+    def reject(self, line_number, errors):
+        self.rejected += 1
+        if self.file:
+            self.file.write(json.dumps({'line': line_number, 'errors': errors}) + '\n')
+
+    def summary(self):
+        seconds = time.monotonic() - self.started
+        return {
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'rejected': self.rejected,
+            'seconds': round(seconds, 3),
+            'rows_per_sec': round(self.rows / seconds, 1) if seconds > 0 else None,
+        }
+
+    def close(self):
+        summary = self.summary()
+        if self.file:
+            self.file.write(json.dumps({'summary': summary}) + '\n')
+            self.file.close()
+        return summary
+
+
+def run_import(rows, validate, write, session, batch_size, checkpoint, report):
+    '''
+    Validates `rows` with `validate(row) -> (record, errors)` and hands every
+    batch of valid records to `write(records)`, committing once per batch.
+    `write` returns {index in records: errors} for records it skipped. A
+    batch the database rejects is rolled back and reported row by row.
+    '''
+    rows = islice(rows, checkpoint.rows_done, None)
+    rows_done = checkpoint.rows_done
+
+    for batch in batched(rows, batch_size):
+        records = []
+        lines = []
+        for line_number, row in batch:
+            if isinstance(row, Exception):
+                report.reject(line_number, {'row': [str(row)]})
+                continue
+            record, errors = validate(row)
+            if errors:
+                report.reject(line_number, errors)
+            else:
+                records.append(record)
+                lines.append(line_number)
+
+        if records:
+            try:
+                skipped = write(records) or {}
+                session.commit()
+                for index, errors in sorted(skipped.items()):
+                    report.reject(lines[index], errors)
+                report.inserted += len(records) - len(skipped)
+            except Exception as e:
+                session.rollback()
+                for line_number in lines:
+                    report.reject(line_number, {'batch': [str(e).splitlines()[0]]})
+
+        report.rows += len(batch)
+        rows_done += len(batch)
+        checkpoint.save(rows_done)
+
+    checkpoint.clear()
+    return report.close()
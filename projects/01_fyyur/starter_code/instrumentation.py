@@ -0,0 +1,137 @@
+import json
+import logging
+import time
+from collections import Counter
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#----------------------------------------------------------------------------#
+# SQL instrumentation.
+#
+# Every statement run while a request is handled is timed through the
+# SQLAlchemy engine events. After the request the totals go out in a
+# Server-Timing header and one JSON log line on the `fyyur.sql` logger.
+#
+# Config:
+#   SQL_QUERY_BUDGET      default max queries per request (None: no limit),
+#                         views can set their own with @query_budget(n)
+#   SQL_REPEAT_THRESHOLD  same statement this many times is flagged as N+1
+#   SQL_STRICT            raise QueryBudgetExceeded instead of logging, for
+#                         tests
+#   SQL_SLOWEST           how many of the slowest statements to log
+#----------------------------------------------------------------------------#
+
+logger = logging.getLogger('fyyur.sql')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestQueries(object):
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        # (seconds, statement)
+        self.timings = []
+        self.statements = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.timings.append((seconds, statement))
+        self.statements[statement] += 1
+
+    def slowest(self, n):
+        return sorted(self.timings, key=lambda timing: timing[0], reverse=True)[:n]
+
+    def repeated(self, threshold):
+        return [(statement, count) for statement, count in self.statements.most_common()
+            if count >= threshold]
+
+
+def query_budget(max_queries):
+    # per view query budget, checked after every request to that view
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def current_queries():
+    if has_app_context():
+        return g.get('sql_queries')
+    return None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    queries = current_queries()
+    if queries is not None:
+        queries.record(statement, time.perf_counter() - started)
+
+
+@event.listens_for(Engine, 'handle_error')
+def drop_query_timer(context):
+    started = context.connection.info.get('query_started') if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+class SQLInstrumentation(object):
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQL_QUERY_BUDGET', None)
+        app.config.setdefault('SQL_REPEAT_THRESHOLD', 5)
+        app.config.setdefault('SQL_STRICT', False)
+        app.config.setdefault('SQL_SLOWEST', 3)
+        self.app = app
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+
+    def before_request(self):
+        g.sql_queries = RequestQueries()
+
+    def after_request(self, response):
+        queries = g.pop('sql_queries', None)
+        if queries is None:
+            return response
+        config = self.app.config
+
+        response.headers.add('Server-Timing', 'db;dur={:.2f};desc="{} queries"'.format(
+            queries.seconds * 1000, queries.count))
+
+        view = self.app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', config['SQL_QUERY_BUDGET'])
+        repeated = queries.repeated(config['SQL_REPEAT_THRESHOLD'])
+        problems = []
+        if budget is not None and queries.count > budget:
+            problems.append('{} queries, budget is {}'.format(queries.count, budget))
+        for statement, count in repeated:
+            problems.append('possible N+1, {} times: {}'.format(count, statement))
+
+        logger.log(logging.WARNING if problems else logging.INFO, json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'queries': queries.count,
+            'db_ms': round(queries.seconds * 1000, 2),
+            'slowest': [{'ms': round(seconds * 1000, 2), 'statement': statement}
+                for seconds, statement in queries.slowest(config['SQL_SLOWEST'])],
+            'problems': problems,
+        }))
+
+        if problems and config['SQL_STRICT']:
+            raise QueryBudgetExceeded('{} {}: {}'.format(request.method, request.path, '; '.join(problems)))
+        return response
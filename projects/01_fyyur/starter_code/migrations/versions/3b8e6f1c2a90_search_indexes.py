@@ -0,0 +1,56 @@
+"""venue and artist search indexes
+
+Revision ID: 3b8e6f1c2a90
+Revises: f55fa3d7bbc0
+Create Date: 2020-10-02 18:12:31.204117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b8e6f1c2a90'
+down_revision = 'f55fa3d7bbc0'
+branch_labels = None
+depends_on = None
+
+
+# name weighs more than the location and genres when ranking
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(city, '') || ' ' || coalesce(state, '')), 'B') || "
+    "setweight(to_tsvector('simple', replace(coalesce(genres, ''), ',', ' ')), 'C')"
+)
+
+
+def upgrade():
+    # full-text search only exists on PostgreSQL, other backends use the
+    # in-process index from search.py
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in ('venue', 'artist'):
+        op.execute(
+            'ALTER TABLE {0} ADD COLUMN search_vector tsvector '
+            'GENERATED ALWAYS AS ({1}) STORED'.format(table, SEARCH_VECTOR)
+        )
+        op.create_index(
+            'ix_{0}_search_vector'.format(table), table, ['search_vector'],
+            postgresql_using='gin'
+        )
+        op.create_index(
+            'ix_{0}_name_trgm'.format(table), table, ['name'],
+            postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    for table in ('artist', 'venue'):
+        op.drop_index('ix_{0}_name_trgm'.format(table), table_name=table)
+        op.drop_index('ix_{0}_search_vector'.format(table), table_name=table)
+        op.drop_column(table, 'search_vector')
@@ -0,0 +1,32 @@
+"""venue locations
+
+Revision ID: 4d8a1f6b3e27
+Revises: 7c5e2b9d4f31
+Create Date: 2020-10-13 10:21:47.530871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d8a1f6b3e27'
+down_revision = '7c5e2b9d4f31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('venue', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('venue', sa.Column('geohash', sa.BigInteger(), nullable=True))
+    op.create_index('ix_venue_geohash', 'venue', ['geohash', 'latitude', 'longitude', 'id'], unique=False)
+    # existing venues are located with `flask geo backfill`
+
+
+def downgrade():
+    op.drop_index('ix_venue_geohash', table_name='venue')
+    with op.batch_alter_table('venue') as batch_op:
+        batch_op.drop_column('geohash')
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
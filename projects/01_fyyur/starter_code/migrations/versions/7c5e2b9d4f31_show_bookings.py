@@ -0,0 +1,44 @@
+"""show end time and booking constraints
+
+Revision ID: 7c5e2b9d4f31
+Revises: e93b0d5c7a18
+Create Date: 2020-10-12 18:44:09.530127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c5e2b9d4f31'
+down_revision = 'e93b0d5c7a18'
+branch_labels = None
+depends_on = None
+
+# SHOW_DURATION_MINUTES when this was written
+DURATION_MINUTES = 180
+
+
+def upgrade():
+    op.add_column('show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("UPDATE show SET end_time = start_time + interval '{} minutes'".format(DURATION_MINUTES))
+    else:
+        op.execute("UPDATE show SET end_time = datetime(start_time, '+{} minutes')".format(DURATION_MINUTES))
+    with op.batch_alter_table('show') as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=False)
+
+    if op.get_bind().dialect.name == 'postgresql':
+        # fails on shows booked over each other, `flask bookings check` lists them
+        op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+        for booked_fk in ('venue_id', 'artist_id'):
+            op.execute('ALTER TABLE show ADD CONSTRAINT ex_show_{0}_booking '
+                'EXCLUDE USING gist ({0} WITH =, tsrange(start_time, end_time) WITH &&)'.format(booked_fk))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for booked_fk in ('venue_id', 'artist_id'):
+            op.drop_constraint('ex_show_{}_booking'.format(booked_fk), 'show')
+    with op.batch_alter_table('show') as batch_op:
+        batch_op.drop_column('end_time')
@@ -0,0 +1,109 @@
+"""genre tables and show/venue/artist indexes
+
+Revision ID: a7d2c4e9f013
+Revises: 3b8e6f1c2a90
+Create Date: 2020-10-06 21:40:08.517342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d2c4e9f013'
+down_revision = '3b8e6f1c2a90'
+branch_labels = None
+depends_on = None
+
+
+OWNERS = (('venue', 'venue_genre', 'venue_id'), ('artist', 'artist_genre', 'artist_id'))
+
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(city, '') || ' ' || coalesce(state, '')), 'B')"
+)
+SEARCH_VECTOR_WITH_GENRES = SEARCH_VECTOR + (
+    " || setweight(to_tsvector('simple', replace(coalesce(genres, ''), ',', ' ')), 'C')"
+)
+
+
+def add_search_vector(table, expression):
+    op.execute(
+        'ALTER TABLE {0} ADD COLUMN search_vector tsvector '
+        'GENERATED ALWAYS AS ({1}) STORED'.format(table, expression)
+    )
+    op.create_index(
+        'ix_{0}_search_vector'.format(table), table, ['search_vector'],
+        postgresql_using='gin'
+    )
+
+
+def upgrade():
+    bind = op.get_bind()
+    postgresql = bind.dialect.name == 'postgresql'
+
+    for owner, genre_table, owner_id in OWNERS:
+        op.create_table(genre_table,
+        sa.Column(owner_id, sa.Integer(), nullable=False),
+        sa.Column('genre', sa.String(length=120), nullable=False),
+        sa.ForeignKeyConstraint([owner_id], [owner + '.id'], ),
+        sa.PrimaryKeyConstraint(owner_id, 'genre')
+        )
+        op.create_index('ix_{0}_genre'.format(genre_table), genre_table, ['genre'])
+
+        # move the comma joined genres into the new table
+        rows = bind.execute(sa.text(
+            'SELECT id, genres FROM {0} WHERE genres IS NOT NULL'.format(owner)
+        )).fetchall()
+        genres = [
+            {owner_id: id, 'genre': genre}
+            for id, joined in rows
+            for genre in sorted(set(joined.split(','))) if genre
+        ]
+        if genres:
+            op.bulk_insert(sa.table(genre_table, sa.column(owner_id), sa.column('genre')), genres)
+
+        # the generated search vector reads `genres`, and can not be altered
+        if postgresql:
+            op.execute('ALTER TABLE {0} DROP COLUMN search_vector'.format(owner))
+        with op.batch_alter_table(owner) as batch_op:
+            batch_op.drop_column('genres')
+        if postgresql:
+            add_search_vector(owner, SEARCH_VECTOR)
+
+    op.create_index('ix_show_venue_id_start_time', 'show', ['venue_id', 'start_time'])
+    op.create_index('ix_show_artist_id_start_time', 'show', ['artist_id', 'start_time'])
+    op.create_index('ix_show_start_time_id', 'show', ['start_time', 'id'])
+    op.create_index('ix_venue_city_state', 'venue', ['city', 'state'])
+    op.create_index('ix_artist_name_id', 'artist', ['name', 'id'])
+
+
+def downgrade():
+    bind = op.get_bind()
+    postgresql = bind.dialect.name == 'postgresql'
+
+    op.drop_index('ix_artist_name_id', table_name='artist')
+    op.drop_index('ix_venue_city_state', table_name='venue')
+    op.drop_index('ix_show_start_time_id', table_name='show')
+    op.drop_index('ix_show_artist_id_start_time', table_name='show')
+    op.drop_index('ix_show_venue_id_start_time', table_name='show')
+
+    for owner, genre_table, owner_id in OWNERS:
+        op.add_column(owner, sa.Column('genres', sa.String(length=120), nullable=True))
+
+        rows = bind.execute(sa.text(
+            'SELECT {0}, genre FROM {1} ORDER BY {0}, genre'.format(owner_id, genre_table)
+        )).fetchall()
+        joined = {}
+        for id, genre in rows:
+            joined.setdefault(id, []).append(genre)
+        owner_table = sa.table(owner, sa.column('id'), sa.column('genres'))
+        for id, genres in joined.items():
+            op.execute(owner_table.update().where(owner_table.c.id == id).values(genres=','.join(genres)))
+
+        if postgresql:
+            op.execute('ALTER TABLE {0} DROP COLUMN search_vector'.format(owner))
+            add_search_vector(owner, SEARCH_VECTOR_WITH_GENRES)
+
+        op.drop_index('ix_{0}_genre'.format(genre_table), table_name=genre_table)
+        op.drop_table(genre_table)
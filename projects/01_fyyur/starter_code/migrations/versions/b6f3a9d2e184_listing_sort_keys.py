@@ -0,0 +1,30 @@
+"""listing sort key indexes
+
+Revision ID: b6f3a9d2e184
+Revises: 4d8a1f6b3e27
+Create Date: 2020-10-15 18:02:11.204316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6f3a9d2e184'
+down_revision = '4d8a1f6b3e27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the listings sort NULL names and areas as '', see pagination.sort_key
+    op.create_index('ix_venue_area_key', 'venue', [
+        sa.text("coalesce(city, '')"), sa.text("coalesce(state, '')"), sa.text("coalesce(name, '')"), sa.text('id')])
+    op.drop_index('ix_artist_name_id', table_name='artist')
+    op.create_index('ix_artist_name_key', 'artist', [sa.text("coalesce(name, '')"), sa.text('id')])
+
+
+def downgrade():
+    op.drop_index('ix_artist_name_key', table_name='artist')
+    op.create_index('ix_artist_name_id', 'artist', ['name', 'id'])
+    op.drop_index('ix_venue_area_key', table_name='venue')
@@ -0,0 +1,49 @@
+"""upcoming show counters
+
+Revision ID: c41f8a7e2d65
+Revises: a7d2c4e9f013
+Create Date: 2020-10-09 16:27:53.881406
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41f8a7e2d65'
+down_revision = 'a7d2c4e9f013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('venue', sa.Column('num_upcoming_shows', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('artist', sa.Column('num_upcoming_shows', sa.Integer(), nullable=False, server_default='0'))
+    op.create_table('show_rollover',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rolled_until', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    # start counting from now
+    now = datetime.now()
+    rollover = sa.table('show_rollover', sa.column('id'), sa.column('rolled_until'))
+    op.bulk_insert(rollover, [{'id': 1, 'rolled_until': now}])
+
+    show = sa.table('show', sa.column('id'), sa.column('venue_id'), sa.column('artist_id'), sa.column('start_time'))
+    for owner, show_fk in (('venue', show.c.venue_id), ('artist', show.c.artist_id)):
+        table = sa.table(owner, sa.column('id'), sa.column('num_upcoming_shows'))
+        upcoming = sa.select([sa.func.count(show.c.id)]).where(sa.and_(
+            show_fk == table.c.id,
+            show.c.start_time > now
+        )).as_scalar()
+        op.execute(table.update().values(num_upcoming_shows=upcoming))
+
+
+def downgrade():
+    op.drop_table('show_rollover')
+    with op.batch_alter_table('artist') as batch_op:
+        batch_op.drop_column('num_upcoming_shows')
+    with op.batch_alter_table('venue') as batch_op:
+        batch_op.drop_column('num_upcoming_shows')
@@ -0,0 +1,29 @@
+"""data version for writes that bypass the mapper events
+
+Revision ID: d2c7e5a91f46
+Revises: b6f3a9d2e184
+Create Date: 2020-10-16 20:41:37.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2c7e5a91f46'
+down_revision = 'b6f3a9d2e184'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # bumped by imports and counter rebuilds, see sync_data_version in app.py
+    op.create_table('data_version',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('data_version')
@@ -0,0 +1,31 @@
+"""show is_upcoming flag
+
+Revision ID: e93b0d5c7a18
+Revises: c41f8a7e2d65
+Create Date: 2020-10-11 11:02:37.204519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e93b0d5c7a18'
+down_revision = 'c41f8a7e2d65'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('show', sa.Column('is_upcoming', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+    # upcoming means after the watermark the counters count from
+    show = sa.table('show', sa.column('start_time'), sa.column('is_upcoming'))
+    rollover = sa.table('show_rollover', sa.column('rolled_until'))
+    watermark = sa.select([rollover.c.rolled_until]).limit(1).as_scalar()
+    op.execute(show.update().values(is_upcoming=show.c.start_time > watermark))
+
+
+def downgrade():
+    with op.batch_alter_table('show') as batch_op:
+        batch_op.drop_column('is_upcoming')
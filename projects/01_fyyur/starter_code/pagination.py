@@ -0,0 +1,127 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy.sql import and_, or_, func, literal_column
+
+#----------------------------------------------------------------------------#
+# Keyset pagination.
+#
+# Pages are addressed by the sort key of their first/last row instead of an
+# offset, so fetching page N costs an index seek rather than scanning the
+# N - 1 pages before it. The key must be unique, which is why every sort key
+# ends with the primary key. Nullable text columns sort as '' (coalesced in
+# the ORDER BY and on both sides of the seek, see sort_key), so that every
+# row has a key a cursor can hold.
+#----------------------------------------------------------------------------#
+
+class Page(object):
+    def __init__(self, items, next_cursor=None, prev_cursor=None, args=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        # query string arguments to carry over to the next/prev links
+        self.args = args or {}
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(values):
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor, columns):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, TypeError):
+        raise ValueError('malformed cursor')
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError('malformed cursor')
+
+    # the values are bound in the seek, so each has to be of its column's type
+    decoded = []
+    for column, value in zip(columns, values):
+        python_type = column.type.python_type
+        if python_type is datetime:
+            if not isinstance(value, str):
+                raise ValueError('malformed cursor')
+            value = datetime.fromisoformat(value)
+        elif type(value) is not python_type:
+            raise ValueError('malformed cursor')
+        decoded.append(value)
+    return decoded
+
+
+def null_key(column):
+    # what NULLs of `column` sort as, None when it can not be NULL
+    if column.nullable and column.type.python_type is str:
+        return ''
+    return None
+
+
+def sort_key(column):
+    if null_key(column) is None:
+        return column
+    # a literal, the expression has to be the indexed one
+    return func.coalesce(column, literal_column("''"))
+
+
+def seek(columns, values, descending=False):
+    # (a, b, c) > (x, y, z) spelled out, so it works without row value support
+    keys = [sort_key(column) for column in columns]
+    clauses = []
+    for i, key in enumerate(keys):
+        equal = [keys[j] == values[j] for j in range(i)]
+        beyond = key < values[i] if descending else key > values[i]
+        clauses.append(and_(*(equal + [beyond])))
+    return or_(*clauses)
+
+
+def row_key(row, columns):
+    keys = []
+    for column in columns:
+        value = getattr(row, column.key)
+        keys.append(null_key(column) if value is None else value)
+    return keys
+
+
+def keyset_page(query, columns, page_size, after=None, before=None, args=None):
+    '''
+    Returns the Page of `query` following the `after` cursor, or preceding
+    the `before` cursor, ordered by `columns`. Raises ValueError when a
+    cursor can not be decoded.
+    '''
+    backwards = before is not None
+    cursor = before if backwards else after
+
+    if cursor is not None:
+        query = query.filter(seek(columns, decode_cursor(cursor, columns), descending=backwards))
+    if backwards:
+        query = query.order_by(*[sort_key(column).desc() for column in columns])
+    else:
+        query = query.order_by(*[sort_key(column) for column in columns])
+
+    rows = query.limit(page_size + 1).all()
+    has_more = len(rows) > page_size
+    items = rows[:page_size]
+    if backwards:
+        items.reverse()
+
+    # paging backwards always comes from a later page, and paging forwards
+    # from an earlier one as soon as a cursor was given
+    if backwards:
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, cursor is not None
+
+    next_cursor = prev_cursor = None
+    if items and has_next:
+        next_cursor = encode_cursor(row_key(items[-1], columns))
+    if items and has_prev:
+        prev_cursor = encode_cursor(row_key(items[0], columns))
+
+    return Page(items, next_cursor, prev_cursor, args)
@@ -0,0 +1,34 @@
+from collections import namedtuple
+
+#----------------------------------------------------------------------------#
+# Read models.
+#
+# Read-only pages render from named tuples filled by column queries instead
+# of ORM instances: nothing to hydrate or to track in the session, and no
+# attribute a view could set on a mapped object and flush by accident.
+#----------------------------------------------------------------------------#
+
+VENUE_COLUMNS = ('id', 'name', 'city', 'state', 'address', 'phone', 'image_link',
+    'facebook_link', 'website', 'seeking_talent', 'seeking_description')
+ARTIST_COLUMNS = ('id', 'name', 'city', 'state', 'phone', 'image_link',
+    'facebook_link', 'website', 'seeking_venue', 'seeking_description')
+SHOW_FIELDS = ('past_shows', 'upcoming_shows', 'past_shows_count', 'upcoming_shows_count')
+
+# detail pages
+VenueDetail = namedtuple('VenueDetail', VENUE_COLUMNS + ('genres',) + SHOW_FIELDS)
+ArtistDetail = namedtuple('ArtistDetail', ARTIST_COLUMNS + ('genres',) + SHOW_FIELDS)
+
+# edit forms, read by the form through getattr like a model would be
+VenueFormData = namedtuple('VenueFormData', VENUE_COLUMNS + ('genres',))
+ArtistFormData = namedtuple('ArtistFormData', ARTIST_COLUMNS + ('genres',))
+
+
+def model_columns(model, names):
+    return [getattr(model, name) for name in names]
+
+
+def read_model(cls, row, **fields):
+    # `cls` from the same named columns of a query row, plus `fields`
+    values = {name: getattr(row, name) for name in cls._fields if name not in fields}
+    values.update(fields)
+    return cls(**values)
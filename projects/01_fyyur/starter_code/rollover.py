@@ -0,0 +1,89 @@
+import logging
+import threading
+import time
+
+#----------------------------------------------------------------------------#
+# Show rollover.
+#
+# Shows carry an is_upcoming flag, kept in step with the upcoming show
+# counters: both count from the `show_rollover` watermark. Rolling forward
+# clears the flag of the shows that started since, a batch per transaction,
+# from the worker thread below that every process serving requests starts,
+# or from `flask counters roll --every` when ROLLOVER_INTERVAL is None.
+# Rollers take turns on the watermark row, one batch at a time.
+#
+# Config:
+#   ROLLOVER_INTERVAL    seconds between rolls of the worker thread, None for none
+#   ROLLOVER_BATCH_SIZE  shows per transaction
+#----------------------------------------------------------------------------#
+
+logger = logging.getLogger('fyyur.rollover')
+
+
+class RolloverMetrics(object):
+    def __init__(self):
+        self.runs = 0
+        self.failures = 0
+        self.rolled = 0
+        self.batches = 0
+        self.last_run = None
+        self.last_rolled = 0
+        self.last_seconds = None
+        # how long the first show waiting to roll had started when the last
+        # run started
+        self.last_lag_seconds = None
+        self.lock = threading.Lock()
+
+    def record(self, rolled, batches, seconds, lag_seconds):
+        with self.lock:
+            self.runs += 1
+            self.rolled += rolled
+            self.batches += batches
+            self.last_run = time.time()
+            self.last_rolled = rolled
+            self.last_seconds = round(seconds, 6)
+            self.last_lag_seconds = round(lag_seconds, 3)
+
+    def failed(self):
+        with self.lock:
+            self.failures += 1
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                'runs': self.runs,
+                'failures': self.failures,
+                'rolled': self.rolled,
+                'batches': self.batches,
+                'last_run': self.last_run,
+                'last_rolled': self.last_rolled,
+                'last_seconds': self.last_seconds,
+                'last_lag_seconds': self.last_lag_seconds,
+            }
+
+
+class RolloverWorker(threading.Thread):
+    '''
+    Calls `roll()` inside an app context every `interval` seconds until
+    stopped. A failed roll is logged and retried on the next tick.
+    '''
+    def __init__(self, app, roll, interval, metrics):
+        threading.Thread.__init__(self, name='fyyur-rollover', daemon=True)
+        self.app = app
+        self.roll = roll
+        self.interval = interval
+        self.metrics = metrics
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            with self.app.app_context():
+                try:
+                    self.roll()
+                except Exception:
+                    self.metrics.failed()
+                    logger.exception('show rollover failed')
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,130 @@
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+
+#----------------------------------------------------------------------------#
+# Connection pools and read replica routing.
+#
+# Views marked @read_only read from the 'replica' bind when one is set in
+# SQLALCHEMY_BINDS, everything else goes to the primary. A browser that just
+# wrote something is pinned to the primary for a few seconds, so it reads its
+# own writes while the replica catches up.
+#
+# Config:
+#   DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+#   DB_POOL_PRE_PING           pool settings for server databases, SQLite
+#                              keeps Flask-SQLAlchemy's own pools
+#   DB_REPLICA_STICKY_SECONDS  how long a writer stays on the primary
+#----------------------------------------------------------------------------#
+
+REPLICA = 'replica'
+
+POOL_OPTIONS = (
+    ('DB_POOL_SIZE', 'pool_size'),
+    ('DB_MAX_OVERFLOW', 'max_overflow'),
+    ('DB_POOL_TIMEOUT', 'pool_timeout'),
+    ('DB_POOL_RECYCLE', 'pool_recycle'),
+    ('DB_POOL_PRE_PING', 'pool_pre_ping'),
+)
+
+
+def read_only(view):
+    # the view never writes, its queries may go to the replica
+    view.read_only = True
+    return view
+
+
+def reading_from_replica():
+    return has_request_context() and g.get('db_replica', False)
+
+
+@contextmanager
+def primary():
+    # reads in this block go to the primary, for state that outlives the request
+    replica = g.pop('db_replica', False) if has_request_context() else False
+    try:
+        yield
+    finally:
+        if replica:
+            g.db_replica = replica
+
+
+class RoutingSession(SignallingSession):
+    def __init__(self, db, **options):
+        self.db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        # flushes are writes, they always go to the primary
+        if not self._flushing and reading_from_replica():
+            return self.db.get_engine(self.app, bind=REPLICA)
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def remember_write(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def note_write(session):
+    if session.info.pop('wrote', False):
+        session.db.last_write = time.monotonic()
+        if has_request_context():
+            g.db_wrote = True
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def forget_write(session):
+    session.info.pop('wrote', None)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def __init__(self, *args, **kwargs):
+        # monotonic time of the last commit that wrote anything in this process
+        self.last_write = None
+        SQLAlchemy.__init__(self, *args, **kwargs)
+
+    def init_app(self, app):
+        app.config.setdefault('DB_POOL_SIZE', 5)
+        app.config.setdefault('DB_MAX_OVERFLOW', 10)
+        app.config.setdefault('DB_POOL_TIMEOUT', 30)
+        app.config.setdefault('DB_POOL_RECYCLE', 1800)
+        app.config.setdefault('DB_POOL_PRE_PING', True)
+        app.config.setdefault('DB_REPLICA_STICKY_SECONDS', 10)
+        SQLAlchemy.init_app(self, app)
+        app.before_request(self.route_request)
+        app.after_request(self.pin_writer)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        sa_url, options = SQLAlchemy.apply_driver_hacks(self, app, sa_url, options)
+        if sa_url.drivername != 'sqlite':
+            for key, option in POOL_OPTIONS:
+                if app.config[key] is not None:
+                    options.setdefault(option, app.config[key])
+        return sa_url, options
+
+    def has_replica(self, app):
+        return REPLICA in (app.config['SQLALCHEMY_BINDS'] or ())
+
+    def route_request(self):
+        app = self.get_app()
+        view = app.view_functions.get(request.endpoint)
+        g.db_replica = (getattr(view, 'read_only', False) and self.has_replica(app)
+            and session.get('db_primary_until', 0) < time.time())
+
+    def pin_writer(self, response):
+        if g.pop('db_wrote', False):
+            session['db_primary_until'] = time.time() + self.get_app().config['DB_REPLICA_STICKY_SECONDS']
+        return response
+
+    def replica_may_lag(self):
+        # a page read from the replica right after a write may predate it
+        sticky = self.get_app().config['DB_REPLICA_STICKY_SECONDS']
+        return (reading_from_replica() and self.last_write is not None
+            and time.monotonic() - self.last_write < sticky)
@@ -0,0 +1,141 @@
+import re
+import threading
+from bisect import bisect_left, insort
+
+#----------------------------------------------------------------------------#
+# Search.
+#
+# PostgreSQL answers searches from the `search_vector` tsvector columns, the
+# trigram index on `name` (created by the search migrations, or with the
+# tables by db.create_all, see app.py) and the indexed genre tables. Other backends (SQLite in tests, offline development) use the
+# in-process inverted index below, which is built lazily from the database
+# and kept up to date by the model events registered in app.py.
+#----------------------------------------------------------------------------#
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# weight of a hit per document field, and per kind of token match
+FIELD_WEIGHTS = {'name': 3.0, 'city': 1.0, 'state': 1.0, 'genres': 1.0}
+EXACT, PREFIX, INFIX = 1.0, 0.75, 0.5
+
+
+def tokenize(text):
+    if not text:
+        return []
+    return TOKEN_RE.findall(text.lower())
+
+
+def to_tsquery_text(term, operator='&'):
+    # every term token as a prefix: "wild sa" -> "wild:* & sa:*"
+    return (' ' + operator + ' ').join(token + ':*' for token in tokenize(term))
+
+
+def document_fields(name, city, state, genres):
+    return {
+        'name': name,
+        'city': city,
+        'state': state,
+        'genres': ' '.join(genres or ()),
+    }
+
+
+class SearchIndex(object):
+    '''
+    An inverted index of venue or artist documents. Query tokens find the
+    indexed tokens they start with a binary search over the sorted suffixes
+    of the vocabulary, so a token is looked up rather than compared with
+    every indexed one. The index is shared by the threads serving requests,
+    every method holds its lock.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        # token -> {doc_id: weight}
+        self.postings = {}
+        # doc_id -> tokens, so documents can be removed or replaced
+        self.documents = {}
+        # sorted (suffix, token) of every suffix of every indexed token
+        self.suffixes = []
+        self.ready = False
+
+    def build(self, rows):
+        index = SearchIndex()
+        for row in rows:
+            index._add(row.id, document_fields(row.name, row.city, row.state, row.genres))
+        with self.lock:
+            self.postings, self.documents, self.suffixes = index.postings, index.documents, index.suffixes
+            self.ready = True
+
+    def invalidate(self):
+        self.ready = False
+
+    def add(self, doc_id, fields):
+        with self.lock:
+            self._add(doc_id, fields)
+
+    def remove(self, doc_id):
+        with self.lock:
+            self._remove(doc_id)
+
+    def _add(self, doc_id, fields):
+        self._remove(doc_id)
+        tokens = {}
+        for field, text in fields.items():
+            weight = FIELD_WEIGHTS.get(field, 1.0)
+            for token in tokenize(text):
+                tokens[token] = max(tokens.get(token, 0.0), weight)
+        for token, weight in tokens.items():
+            if token not in self.postings:
+                self.postings[token] = {}
+                for start in range(len(token)):
+                    insort(self.suffixes, (token[start:], token))
+            self.postings[token][doc_id] = weight
+        self.documents[doc_id] = tokens
+
+    def _remove(self, doc_id):
+        for token in self.documents.pop(doc_id, ()):
+            posting = self.postings[token]
+            posting.pop(doc_id, None)
+            if not posting:
+                del self.postings[token]
+                for start in range(len(token)):
+                    del self.suffixes[bisect_left(self.suffixes, (token[start:], token))]
+
+    def matches(self, query_token):
+        # {token: quality} of the indexed tokens holding `query_token`
+        matches = {}
+        position = bisect_left(self.suffixes, (query_token,))
+        while position < len(self.suffixes) and self.suffixes[position][0].startswith(query_token):
+            suffix, token = self.suffixes[position]
+            if len(suffix) == len(token):
+                quality = EXACT if token == query_token else PREFIX
+            else:
+                quality = INFIX
+            matches[token] = max(matches.get(token, 0.0), quality)
+            position += 1
+        return matches
+
+    def search(self, term):
+        '''
+        Returns the ids of the documents matching every token of `term`,
+        best match first. A token matches exactly, as a prefix or as a
+        substring of an indexed token, like the `ilike('%term%')` it replaces.
+        '''
+        scores = None
+        with self.lock:
+            for query_token in tokenize(term):
+                token_scores = {}
+                for token, quality in self.matches(query_token).items():
+                    for doc_id, weight in self.postings[token].items():
+                        token_scores[doc_id] = max(token_scores.get(doc_id, 0.0), weight * quality)
+
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {doc_id: score + token_scores[doc_id]
+                        for doc_id, score in scores.items() if doc_id in token_scores}
+                if not scores:
+                    return []
+
+        if not scores:
+            return []
+        return sorted(scores, key=lambda doc_id: (-scores[doc_id], doc_id))
@@ -0,0 +1,1022 @@
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+from unittest import mock
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.engine.url import make_url
+
+from app import app, db, Venue, Artist, Show, VenueGenre, ShowRollover, venue_index, artist_index, \
+    roll_forward_upcoming, check_upcoming_counters, response_cache, venue_detail, rollover_metrics, \
+    venue_bookings, artist_bookings, sync_data_version, bump_data_version
+from search import SearchIndex, document_fields
+from cache import LRUCache
+from formatting import DateFormatter
+from instrumentation import QueryBudgetExceeded, RequestQueries
+from rollover import RolloverMetrics, RolloverWorker
+from booking import BookingIndex, validate_schedule
+from geo import encode, distance_km, search_ranges
+import babel.dates
+import base64
+import threading
+
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the fyyur test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        app.config['WTF_CSRF_ENABLED'] = False
+        app.config['TESTING'] = True
+        app.config['SQL_STRICT'] = True
+        app.config['SQL_QUERY_BUDGET'] = None
+        app.config['SQLALCHEMY_BINDS'] = None
+        app.config['DB_REPLICA_STICKY_SECONDS'] = 10
+        app.config['COMPRESS_MIN_SIZE'] = 1024
+        self.app = app
+        self.client = self.app.test_client
+        db.create_all()
+        # the new database's version, not the one of the previous test's
+        sync_data_version()
+        venue_index.invalidate()
+        artist_index.invalidate()
+        venue_bookings.invalidate()
+        artist_bookings.invalidate()
+        response_cache.clear()
+
+    def tearDown(self):
+        """Executed after reach test"""
+        db.session.remove()
+        db.drop_all()
+
+    # Helpers
+    def count_queries(self, func):
+        statements = []
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            func()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return len(statements)
+
+    def follow(self, body, rel):
+        match = re.search(r'<li class="{}"><a href="([^"]+)"'.format(rel), body)
+        return match.group(1).replace('&amp;', '&') if match else None
+
+    def add_area(self, city, state, venues=2):
+        artist = Artist(name='artist_' + city, city=city, state=state)
+        db.session.add(artist)
+        for i in range(venues):
+            venue = Venue(name='venue_{}_{}'.format(city, i), city=city, state=state)
+            venue.shows.append(Show(artist=artist, start_time=datetime.now() + timedelta(days=1)))
+            db.session.add(venue)
+        db.session.commit()
+
+    def use_replica(self):
+        # a second in-memory database standing in for a replica that never catches up
+        app.config['SQLALCHEMY_BINDS'] = {'replica': 'sqlite://'}
+        replica = db.get_engine(app, 'replica')
+        db.Model.metadata.create_all(replica)
+        self.addCleanup(db.Model.metadata.drop_all, replica)
+        return replica
+
+    def venue_form(self, name):
+        return {
+            'name': name,
+            'city': 'San Francisco',
+            'state': 'CA',
+            'address': '1 Main Street',
+            'image_link': 'https://example.com/venue.png',
+            'genres': ['Jazz'],
+        }
+
+    # Venues - GET
+    def test_get_venues(self):
+        self.add_area('San Francisco', 'CA')
+        self.add_area('New York', 'NY', venues=1)
+
+        res = self.client().get('/venues')
+        body = res.data.decode()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('San Francisco, CA', body)
+        self.assertIn('New York, NY', body)
+        self.assertEqual(body.count('1 upcoming'), 3)
+
+    def test_get_venues_query_count_constant(self):
+        self.add_area('San Francisco', 'CA')
+        few_areas = self.count_queries(lambda: self.client().get('/venues'))
+
+        for i in range(10):
+            self.add_area('city_{}'.format(i), 'NY')
+        many_areas = self.count_queries(lambda: self.client().get('/venues'))
+
+        self.assertEqual(few_areas, many_areas)
+
+    # Search
+    def test_search_index_ranks_name_before_location(self):
+        index = SearchIndex()
+        index.add(1, document_fields('Park Square Live', 'San Francisco', 'CA', ['Jazz']))
+        index.add(2, document_fields('The Dueling Pianos Bar', 'Park City', 'UT', ['Classical', 'Jazz']))
+        index.add(3, document_fields('The Musical Hop', 'San Francisco', 'CA', ['Reggae']))
+
+        self.assertEqual(index.search('park'), [1, 2])
+        self.assertEqual(index.search('jazz san'), [1])
+        self.assertEqual(index.search('usic'), [3])
+        self.assertEqual(index.search('blues'), [])
+
+        index.remove(1)
+        self.assertEqual(index.search('park'), [2])
+        self.assertEqual(index.search('squ'), [])
+
+    def test_rollback_invalidates_only_written_indexes(self):
+        db.session.add(Venue(name='The Musical Hop', city='San Francisco', state='CA'))
+        db.session.commit()
+        self.client().post('/venues/search', data={'search_term': 'hop'})
+        self.client().post('/artists/search', data={'search_term': 'hop'})
+
+        db.session.query(Venue).count()
+        db.session.rollback()
+        self.assertTrue(venue_index.ready and artist_index.ready)
+
+        db.session.add(Venue(name='The Dueling Pianos Bar'))
+        db.session.flush()
+        db.session.rollback()
+        self.assertFalse(venue_index.ready)
+        self.assertTrue(artist_index.ready)
+        self.assertEqual(self.client().post('/venues/search', data={'search_term': 'pianos'}).data.decode().count(
+            'Dueling'), 0)
+
+    def test_search_index_shared_between_threads(self):
+        index = SearchIndex()
+        index.build([])
+        def add_venues():
+            for doc_id in range(2000):
+                index.add(doc_id, document_fields('Hall {}'.format(doc_id), 'San Francisco', 'CA', ['Jazz']))
+        writer = threading.Thread(target=add_venues)
+        writer.start()
+        while writer.is_alive():
+            index.search('hall 1')
+        writer.join()
+        self.assertEqual(len(index.search('fran')), 2000)
+
+    def test_search_venues(self):
+        db.session.add(Venue(name='The Musical Hop', city='San Francisco', state='CA', genres=['Jazz', 'Reggae']))
+        db.session.add(Venue(name='The Dueling Pianos Bar', city='New York', state='NY', genres=['Classical']))
+        db.session.commit()
+
+        res = self.client().post('/venues/search', data={'search_term': 'musical'})
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('The Musical Hop', res.data.decode())
+        self.assertNotIn('The Dueling Pianos Bar', res.data.decode())
+
+        res = self.client().post('/venues/search', data={'search_term': 'classical new york'})
+        self.assertIn('The Dueling Pianos Bar', res.data.decode())
+        self.assertIn(': 1</h3>', res.data.decode())
+
+    def test_search_artists_sees_new_rows(self):
+        db.session.add(Artist(name='Guns N Petals', city='San Francisco', state='CA', genres=['Rock n Roll']))
+        db.session.commit()
+        res = self.client().post('/artists/search', data={'search_term': 'sax'})
+        self.assertIn(': 0</h3>', res.data.decode())
+
+        db.session.add(Artist(name='The Wild Sax Band', city='San Francisco', state='CA', genres=['Jazz']))
+        db.session.commit()
+        res = self.client().post('/artists/search', data={'search_term': 'sax'})
+        self.assertIn('The Wild Sax Band', res.data.decode())
+        self.assertIn(': 1</h3>', res.data.decode())
+
+    # Venue / Artist - detail
+    def test_show_venue_single_query(self):
+        artist = Artist(name='Guns N Petals')
+        venue = Venue(name='The Musical Hop', genres=['Jazz', 'Reggae'])
+        venue.shows.append(Show(artist=artist, start_time=datetime.now() - timedelta(days=3)))
+        venue.shows.append(Show(artist=artist, start_time=datetime.now() + timedelta(days=1)))
+        venue.shows.append(Show(artist=artist, start_time=datetime.now() + timedelta(days=2)))
+        db.session.add(venue)
+        db.session.commit()
+        venue_id = venue.id
+        db.session.remove()
+
+        responses = []
+        queries = self.count_queries(lambda: responses.append(self.client().get('/venues/' + str(venue_id))))
+        body = responses[0].data.decode()
+
+        self.assertEqual(responses[0].status_code, 200)
+        # the venue with its genres and its shows
+        self.assertEqual(queries, 1)
+        self.assertIn('2 Upcoming Shows', body)
+        self.assertIn('1 Past Show', body)
+        self.assertIn('Reggae', body)
+
+    def test_venue_detail_loads_no_instances(self):
+        artist = Artist(name='Guns N Petals')
+        venue = Venue(name='The Musical Hop', genres=['Jazz'])
+        venue.shows.append(Show(artist=artist, start_time=datetime.now() + timedelta(days=1)))
+        db.session.add(venue)
+        db.session.commit()
+        venue_id = venue.id
+        db.session.remove()
+
+        data = venue_detail(venue_id)
+        self.assertEqual(data.name, 'The Musical Hop')
+        self.assertEqual(data.genres, ['Jazz'])
+        self.assertEqual(data.upcoming_shows[0].artist_name, 'Guns N Petals')
+        self.assertEqual(len(db.session.identity_map), 0)
+        self.assertIsNone(venue_detail(venue_id + 1))
+
+    def test_show_artist_without_shows(self):
+        artist = Artist(name='The Wild Sax Band')
+        db.session.add(artist)
+        db.session.commit()
+
+        res = self.client().get('/artists/' + str(artist.id))
+        body = res.data.decode()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('0 Upcoming Shows', body)
+        self.assertIn('0 Past Shows', body)
+
+    def test_show_artist_not_found(self):
+        res = self.client().get('/artists/1000')
+        self.assertEqual(res.status_code, 404)
+
+    # Listings - pagination
+    def test_get_artists_paginated(self):
+        for i in range(5):
+            db.session.add(Artist(name='artist_{}'.format(i)))
+        db.session.commit()
+
+        res = self.client().get('/artists?page_size=2')
+        body = res.data.decode()
+        self.assertIn('artist_0', body)
+        self.assertIn('artist_1', body)
+        self.assertNotIn('artist_2', body)
+        self.assertIsNone(self.follow(body, 'previous'))
+
+        body = self.client().get(self.follow(body, 'next')).data.decode()
+        self.assertIn('artist_2', body)
+        self.assertIn('artist_3', body)
+        self.assertNotIn('artist_1', body)
+
+        body = self.client().get(self.follow(body, 'next')).data.decode()
+        self.assertIn('artist_4', body)
+        self.assertIsNone(self.follow(body, 'next'))
+
+        body = self.client().get(self.follow(body, 'previous')).data.decode()
+        self.assertIn('artist_2', body)
+        self.assertIn('artist_3', body)
+        self.assertNotIn('artist_4', body)
+
+    def test_get_venues_paginated_by_area(self):
+        self.add_area('Austin', 'TX', venues=3)
+        self.add_area('Boston', 'MA', venues=3)
+
+        body = self.client().get('/venues?page_size=4').data.decode()
+        self.assertIn('Austin, TX', body)
+        self.assertIn('Boston, MA', body)
+        self.assertNotIn('venue_Boston_1', body)
+
+        body = self.client().get(self.follow(body, 'next')).data.decode()
+        self.assertNotIn('Austin, TX', body)
+        self.assertIn('venue_Boston_1', body)
+        self.assertIn('venue_Boston_2', body)
+
+    def test_get_shows_date_range(self):
+        artist = Artist(name='Guns N Petals', image_link='http://example.com/petals.png')
+        venue = Venue(name='The Musical Hop')
+        for day in (1, 2, 3, 10):
+            venue.shows.append(Show(artist=artist, start_time=datetime(2035, 4, day, 20)))
+        db.session.add(venue)
+        db.session.commit()
+
+        body = self.client().get('/shows?from_date=2035-04-02&to_date=2035-04-03').data.decode()
+        self.assertEqual(body.count('tile-show'), 2)
+
+        body = self.client().get('/shows?from_date=2035-04-02&page_size=2').data.decode()
+        self.assertEqual(body.count('tile-show'), 2)
+        next_page = self.follow(body, 'next')
+        self.assertIn('from_date=2035-04-02', next_page)
+        body = self.client().get(next_page).data.decode()
+        self.assertEqual(body.count('tile-show'), 1)
+
+    def test_get_shows_bad_cursor(self):
+        res = self.client().get('/shows?after=not-a-cursor')
+        self.assertEqual(res.status_code, 400)
+
+    def cursor(self, values):
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def test_get_shows_wrong_typed_cursor(self):
+        for values in ([1, 2], [None, 1], ['2035-04-01T20:00:00', '1'], ['2035-04-01T20:00:00', True]):
+            res = self.client().get('/shows?after=' + self.cursor(values))
+            self.assertEqual(res.status_code, 400)
+
+    def test_get_venues_null_cursor(self):
+        res = self.client().get('/venues?after=' + self.cursor([None, 'CA', 'A', 1]))
+        self.assertEqual(res.status_code, 400)
+
+    def test_get_venues_paginated_null_sort_keys(self):
+        db.session.add(Venue(name='A', city=None, state='CA'))
+        db.session.add(Venue(name=None, city=None, state=None))
+        db.session.add(Venue(name='B', city='Austin', state='TX'))
+        db.session.commit()
+
+        seen = []
+        url = '/venues?page_size=1'
+        while url:
+            res = self.client().get(url)
+            self.assertEqual(res.status_code, 200)
+            body = res.data.decode()
+            seen.extend(name for name in ('>A<', '>B<') if name in body)
+            url = self.follow(body, 'next')
+        self.assertEqual(len(seen), 2)
+
+        db.session.add(Artist(name=None))
+        db.session.add(Artist(name='artist_1'))
+        db.session.commit()
+        pages = 0
+        url = '/artists?page_size=1'
+        while url:
+            res = self.client().get(url)
+            self.assertEqual(res.status_code, 200)
+            pages += 1
+            url = self.follow(res.data.decode(), 'next')
+        self.assertEqual(pages, 2)
+
+    # Genres
+    def test_get_artists_by_genre(self):
+        db.session.add(Artist(name='Guns N Petals', genres=['Rock n Roll']))
+        db.session.add(Artist(name='The Wild Sax Band', genres=['Jazz', 'Classical']))
+        db.session.commit()
+
+        body = self.client().get('/artists?genre=Jazz').data.decode()
+        self.assertIn('The Wild Sax Band', body)
+        self.assertNotIn('Guns N Petals', body)
+
+    def test_edit_artist_form_prefilled(self):
+        artist = Artist(name='The Wild Sax Band', city='San Francisco', state='CA', genres=['Jazz', 'Classical'])
+        db.session.add(artist)
+        db.session.commit()
+        artist_id = artist.id
+
+        res = []
+        queries = self.count_queries(lambda: res.append(self.client().get('/artists/{}/edit'.format(artist_id))))
+        body = res[0].data.decode()
+        self.assertEqual(queries, 1)
+        self.assertIn('value="The Wild Sax Band"', body)
+        self.assertIn('<option selected value="Jazz">', body)
+        self.assertIn('<option selected value="Classical">', body)
+
+    def test_edit_venue_genres(self):
+        venue = Venue(name='The Musical Hop', city='San Francisco', state='CA', address='1015 Folsom Street',
+            image_link='http://example.com/hop.png', genres=['Jazz', 'Reggae'])
+        db.session.add(venue)
+        db.session.commit()
+        venue_id = venue.id
+
+        res = self.client().post('/venues/' + str(venue_id) + '/edit', data={
+            'name': 'The Musical Hop',
+            'city': 'San Francisco',
+            'state': 'CA',
+            'address': '1015 Folsom Street',
+            'image_link': 'http://example.com/hop.png',
+            'genres': ['Jazz', 'Soul', 'Folk']
+        })
+        db.session.remove()
+
+        self.assertEqual(res.status_code, 302)
+        self.assertEqual(sorted(Venue.query.get(venue_id).genres), ['Folk', 'Jazz', 'Soul'])
+        self.assertEqual(VenueGenre.query.filter_by(genre='Reggae').count(), 0)
+
+    # Upcoming show counters
+    def test_upcoming_counters_follow_shows(self):
+        artist = Artist(name='Guns N Petals')
+        venue = Venue(name='The Musical Hop')
+        venue.shows.append(Show(artist=artist, start_time=datetime.now() + timedelta(days=1)))
+        venue.shows.append(Show(artist=artist, start_time=datetime.now() + timedelta(days=2)))
+        venue.shows.append(Show(artist=artist, start_time=datetime.now() - timedelta(days=1)))
+        db.session.add(venue)
+        db.session.commit()
+        self.assertEqual((venue.num_upcoming_shows, artist.num_upcoming_shows), (2, 2))
+
+        db.session.delete(Show.query.order_by(Show.start_time.desc()).first())
+        db.session.commit()
+        self.assertEqual((venue.num_upcoming_shows, artist.num_upcoming_shows), (1, 1))
+
+        db.session.delete(venue)
+        db.session.commit()
+        self.assertEqual(artist.num_upcoming_shows, 0)
+        self.assertEqual(check_upcoming_counters(), [])
+
+    def test_upcoming_counters_roll_forward(self):
+        artist = Artist(name='Guns N Petals')
+        venue = Venue(name='The Musical Hop')
+        venue.shows.append(Show(artist=artist, start_time=datetime.now() + timedelta(hours=1)))
+        venue.shows.append(Show(artist=artist, start_time=datetime.now() + timedelta(days=2)))
+        db.session.add(venue)
+        db.session.commit()
+
+        self.assertEqual(roll_forward_upcoming(datetime.now() + timedelta(hours=2)), 1)
+        self.assertEqual((venue.num_upcoming_shows, artist.num_upcoming_shows), (1, 1))
+        self.assertEqual(roll_forward_upcoming(datetime.now() + timedelta(hours=2)), 0)
+        self.assertEqual(check_upcoming_counters(), [])
+
+    def test_empty_rollover_keeps_caches_and_indexes(self):
+        venue = Venue(name='The Musical Hop', city='San Francisco', state='CA')
+        venue.shows.append(Show(artist=Artist(name='Guns N Petals'), start_time=datetime.now() + timedelta(days=2)))
+        db.session.add(venue)
+        db.session.commit()
+        roll_forward_upcoming()
+        self.client().post('/shows/create', data={'venue_id': venue.id, 'artist_id': venue.shows[0].artist_id,
+            'start_time': '2099-01-01 08:00PM'})
+        self.client().get('/venues')
+        self.client().post('/venues/search', data={'search_term': 'hop'})
+        rolled_until = ShowRollover.query.one().rolled_until
+
+        self.assertEqual(roll_forward_upcoming(), 0)
+        self.assertEqual(ShowRollover.query.one().rolled_until, rolled_until)
+        self.assertIsNotNone(response_cache.get('page:/venues?'))
+        self.assertTrue(venue_index.ready)
+        self.assertTrue(all(index.ready for index in (venue_bookings, artist_bookings)))
+
+    def test_rollover_in_batches_and_dry_run(self):
+        artist = Artist(name='Guns N Petals')
+        venue = Venue(name='The Musical Hop')
+        for hours in (1, 2, 2, 3, 4, 48):
+            venue.shows.append(Show(artist=artist, start_time=datetime.now() + timedelta(hours=hours)))
+        db.session.add(venue)
+        db.session.commit()
+        later = datetime.now() + timedelta(hours=5)
+
+        self.assertEqual(roll_forward_upcoming(later, batch_size=2, dry_run=True), 5)
+        self.assertEqual(Show.query.filter_by(is_upcoming=True).count(), 6)
+        self.assertEqual(venue.num_upcoming_shows, 6)
+
+        # the two shows at 2 hours stay in one batch
+        self.assertEqual(roll_forward_upcoming(later, batch_size=2), 5)
+        self.assertEqual(rollover_metrics.last_rolled, 5)
+        self.assertEqual(Show.query.filter_by(is_upcoming=True).count(), 1)
+        self.assertEqual((venue.num_upcoming_shows, artist.num_upcoming_shows), (1, 1))
+        self.assertEqual(check_upcoming_counters(), [])
+
+    def test_rollover_refreshes_cached_detail_page(self):
+        artist = Artist(name='Guns N Petals')
+        venue = Venue(name='The Musical Hop')
+        venue.shows.append(Show(artist=artist, start_time=datetime.now() + timedelta(hours=1)))
+        db.session.add(venue)
+        db.session.commit()
+        venue_id = venue.id
+
+        self.assertIn('1 Upcoming Show', self.client().get('/venues/{}'.format(venue_id)).data.decode())
+        roll_forward_upcoming(datetime.now() + timedelta(hours=2))
+        body = self.client().get('/venues/{}'.format(venue_id)).data.decode()
+        self.assertIn('0 Upcoming Shows', body)
+        self.assertIn('1 Past Show', body)
+
+    def test_detail_page_with_watermark_behind_clock(self):
+        # no rollover ran for a month
+        db.session.add(ShowRollover(id=1, rolled_until=datetime.now() - timedelta(days=30)))
+        artist = Artist(name='Guns N Petals')
+        venue = Venue(name='The Musical Hop')
+        db.session.add_all([artist, venue])
+        db.session.commit()
+        ids = artist.id, venue.id
+        db.session.remove()
+
+        res = self.client().post('/shows/create', data={
+            'artist_id': ids[0],
+            'venue_id': ids[1],
+            'start_time': (datetime.now() - timedelta(days=2)).strftime('%Y-%m-%d %I:%M%p')
+        })
+        self.assertEqual(res.status_code, 302)
+
+        for url in ('/venues/{}'.format(ids[1]), '/artists/{}'.format(ids[0])):
+            body = self.client().get(url).data.decode()
+            self.assertIn('0 Upcoming Shows', body)
+            self.assertIn('1 Past Show', body)
+
+    def test_listing_counts_with_watermark_behind_clock(self):
+        db.session.add(ShowRollover(id=1, rolled_until=datetime.now() - timedelta(days=30)))
+        artist = Artist(name='Guns N Petals')
+        venue = Venue(name='The Musical Hop', city='San Francisco', state='CA')
+        venue.shows.append(Show(artist=artist, start_time=datetime.now() - timedelta(days=2)))
+        db.session.add(venue)
+        db.session.commit()
+
+        # counted from the watermark until the worker's first tick
+        self.assertIn('1 upcoming', self.client().get('/venues').data.decode())
+        self.assertEqual(roll_forward_upcoming(), 1)
+        self.assertIn('No upcoming', self.client().get('/venues').data.decode())
+        self.assertEqual(check_upcoming_counters(), [])
+
+    def test_rollover_worker_started_by_default(self):
+        import config
+        self.assertTrue(config.ROLLOVER_INTERVAL)
+        app.config['TESTING'] = False
+        try:
+            with mock.patch('app.start_rollover_worker') as start, mock.patch('app.rollover_worker', None):
+                self.client().get('/')
+                self.client().get('/')
+        finally:
+            app.config['TESTING'] = True
+        start.assert_called_once_with()
+
+    def test_rollover_worker_keeps_running_after_failure(self):
+        calls = []
+        def roll():
+            calls.append(datetime.now())
+            if len(calls) == 1:
+                raise RuntimeError('database went away')
+            if len(calls) == 3:
+                worker.stop()
+        metrics = RolloverMetrics()
+        worker = RolloverWorker(app, roll, 0.01, metrics)
+        worker.start()
+        worker.join(5)
+
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(metrics.failures, 1)
+
+    def test_upcoming_counters_check_and_rebuild(self):
+        self.add_area('San Francisco', 'CA')
+        venue = Venue.query.first()
+        db.session.execute(Venue.__table__.update().where(Venue.id == venue.id).values(num_upcoming_shows=7))
+        db.session.commit()
+
+        show = Show.query.first()
+        db.session.execute(Show.__table__.update().where(Show.id == show.id).values(is_upcoming=False))
+        db.session.commit()
+
+        self.assertEqual(check_upcoming_counters(), [('Venue', venue.id, 7, 1), ('Show', show.id, False, True)])
+        self.assertEqual(len(check_upcoming_counters(rebuild=True)), 2)
+        self.assertTrue(show.is_upcoming)
+        self.assertEqual(check_upcoming_counters(), [])
+        self.assertEqual(venue.num_upcoming_shows, 1)
+
+    # Response cache
+    def test_lru_cache_evicts_and_expires(self):
+        now = [0]
+        cache = LRUCache(maxsize=2, ttl=10, clock=lambda: now[0])
+        cache.set('a', 'A', tags=['venue:1'])
+        cache.set('b', 'B', tags=['venue:2'])
+        self.assertEqual(cache.get('a'), 'A')
+        cache.set('c', 'C')
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 'C')
+        now[0] = 11
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats.as_dict(), {'hits': 2, 'misses': 2, 'evictions': 2, 'invalidations': 0})
+
+        cache.set('d', 'D', tags=['venue:1', 'venues'])
+        cache.invalidate('venue:1')
+        self.assertIsNone(cache.get('d'))
+        self.assertEqual(cache.stats.invalidations, 1)
+
+    def test_cached_page_served_without_queries(self):
+        self.add_area('San Francisco', 'CA')
+        first = self.client().get('/venues').data
+
+        responses = []
+        queries = self.count_queries(lambda: responses.append(self.client().get('/venues')))
+        self.assertEqual(queries, 0)
+        self.assertEqual(responses[0].data, first)
+
+        stats = self.client().get('/cache/stats').get_json()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_conditional_get_skips_templates(self):
+        self.add_area('San Francisco', 'CA')
+        first = self.client().get('/venues')
+        etag = first.headers['ETag']
+
+        responses = []
+        with mock.patch('app.render_template') as render_template:
+            queries = self.count_queries(lambda: responses.append(
+                self.client().get('/venues', headers={'If-None-Match': etag})))
+        self.assertEqual(responses[0].status_code, 304)
+        self.assertEqual(responses[0].data, b'')
+        self.assertEqual(responses[0].headers['ETag'], etag)
+        self.assertEqual(queries, 0)
+        render_template.assert_not_called()
+
+        # a write to one of the page's rows gives it a new ETag
+        venue = Venue.query.first()
+        venue.name = 'The Musical Hop'
+        db.session.commit()
+        res = self.client().get('/venues', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_compressed_pages(self):
+        self.add_area('San Francisco', 'CA')
+        plain = self.client().get('/venues')
+        app.config['COMPRESS_MIN_SIZE'] = len(plain.data) + 1
+        self.assertNotIn('Content-Encoding', self.client().get('/venues', headers={'Accept-Encoding': 'gzip'}).headers)
+
+        app.config['COMPRESS_MIN_SIZE'] = 100
+        res = self.client().get('/venues', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', res.headers['Vary'])
+        self.assertEqual(gzip.decompress(res.data), plain.data)
+        self.assertEqual(res.headers['ETag'], plain.headers['ETag'][:-1] + '-gzip"')
+
+        before = self.client().get('/responses/stats').get_json()
+        res = self.client().get('/venues', headers={'Accept-Encoding': 'gzip', 'If-None-Match': res.headers['ETag']})
+        self.assertEqual(res.status_code, 304)
+        stats = self.client().get('/responses/stats').get_json()
+        self.assertEqual(stats['not_modified'], before['not_modified'] + 1)
+        self.assertGreater(stats['bytes_saved'], 0)
+
+    def test_create_show_invalidates_only_affected_pages(self):
+        artist = Artist(name='Guns N Petals')
+        hop = Venue(name='The Musical Hop')
+        bar = Venue(name='The Dueling Pianos Bar')
+        db.session.add_all([artist, hop, bar])
+        db.session.commit()
+        ids = artist.id, hop.id, bar.id
+        db.session.remove()
+
+        self.client().get('/venues/{}'.format(ids[1]))
+        self.client().get('/venues/{}'.format(ids[2]))
+        res = self.client().post('/shows/create', data={
+            'artist_id': ids[0],
+            'venue_id': ids[1],
+            'start_time': (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d %I:%M%p')
+        })
+        self.assertEqual(res.status_code, 302)
+
+        self.assertEqual(self.count_queries(lambda: self.client().get('/venues/{}'.format(ids[2]))), 0)
+        body = self.client().get('/venues/{}'.format(ids[1])).data.decode()
+        self.assertIn('1 Upcoming Show', body)
+
+    # Bulk import
+    def write_file(self, name, content):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def read_report(self, path):
+        with open(path + '.errors.jsonl') as f:
+            return [json.loads(line) for line in f]
+
+    def test_import_venues_csv(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        path = self.write_file('venues.csv',
+            'id,name,city,state,address,image_link,genres,seeking_talent\n'
+            '10,The Musical Hop,San Francisco,CA,1015 Folsom Street,http://example.com/hop.png,"Jazz,Reggae",y\n'
+            ',Park Square Live,San Francisco,XX,34 Whiskey Moore Ave,http://example.com/park.png,Jazz,\n'
+            ',The Dueling Pianos Bar,New York,NY,335 Delancey Street,http://example.com/bar.png,Classical,\n')
+
+        res = self.app.test_cli_runner().invoke(args=['import', 'venues', path, '--batch-size', '2'])
+
+        self.assertEqual(res.exit_code, 0, res.output)
+        self.assertIn('3 rows: 2 inserted, 1 rejected', res.output)
+        self.assertIn('rows/sec', res.output)
+        self.assertEqual(sorted(Venue.query.get(10).genres), ['Jazz', 'Reggae'])
+        self.assertTrue(Venue.query.get(10).seeking_talent)
+        self.assertEqual(Venue.query.filter_by(name='The Dueling Pianos Bar').one().id, 11)
+
+        report = self.read_report(path)
+        self.assertEqual(report[0]['line'], 3)
+        self.assertIn('state', report[0]['errors'])
+        self.assertEqual(report[-1]['summary']['inserted'], 2)
+        self.assertFalse(os.path.exists(path + '.checkpoint'))
+
+    def test_import_shows_resumes_from_checkpoint(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.add_area('San Francisco', 'CA', venues=1)
+        venue_id, artist_id = Venue.query.one().id, Artist.query.one().id
+        path = self.write_file('shows.jsonl', '\n'.join([
+            json.dumps({'venue_id': venue_id, 'artist_id': artist_id, 'start_time': '2019-05-21T21:30:00'}),
+            json.dumps({'venue_id': venue_id, 'artist_id': artist_id, 'start_time': '2099-05-21T21:30:00'}),
+            json.dumps({'venue_id': 1000, 'artist_id': artist_id, 'start_time': '2099-05-22T21:30:00'}),
+            '{not json',
+        ]))
+        # the first row was written by an earlier, interrupted run
+        self.write_file('shows.jsonl.checkpoint', json.dumps({'rows_done': 1}))
+
+        res = self.app.test_cli_runner().invoke(args=['import', 'shows', path])
+
+        self.assertEqual(res.exit_code, 0, res.output)
+        self.assertIn('Resuming after 1 rows.', res.output)
+        self.assertIn('3 rows: 1 inserted, 2 rejected', res.output)
+        self.assertEqual(Show.query.count(), 2)
+        self.assertEqual(check_upcoming_counters(), [])
+        self.assertEqual(Venue.query.get(venue_id).num_upcoming_shows, 2)
+        report = self.read_report(path)
+        self.assertEqual(sorted(row['line'] for row in report[:-1]), [3, 4])
+        self.assertIn('venue_id', [row for row in report if row.get('line') == 3][0]['errors'])
+
+    # Bookings
+    def test_booking_index_conflicts(self):
+        index = BookingIndex()
+        # shows 1 and 2 overlap, from before bookings were checked
+        index.build([(1, 1, 10, 20), (1, 2, 15, 25), (1, 3, 30, 40), (2, 4, 10, 20)])
+
+        self.assertEqual(list(index.overlaps()), [(1, [1, 2])])
+        self.assertEqual(index.conflicts(1, 24, 30), [2])
+        self.assertEqual(index.conflicts(1, 25, 30), [])
+        self.assertEqual(index.conflicts(1, 0, 100), [1, 2, 3])
+        self.assertEqual(index.conflicts(3, 0, 100), [])
+
+        index.add(1, 5, 25, 30)
+        self.assertEqual(index.conflicts(1, 26, 27), [5])
+        index.remove(1, 2, 15)
+        self.assertEqual(index.conflicts(1, 20, 25), [])
+        self.assertEqual(list(index.overlaps()), [])
+
+    def test_booking_index_across_chunks(self):
+        index = BookingIndex()
+        index.build([(1, show_id, 10 * show_id, 10 * show_id + 5) for show_id in range(1, 1001)])
+        self.assertEqual(index.conflicts(1, 2564, 2606), [256, 257, 258, 259, 260])
+
+        # one show over the blocks of several chunks
+        index.add(1, 2000, 2502, 5208)
+        self.assertEqual(index.conflicts(1, 2606, 2607), [2000])
+        self.assertEqual(list(index.overlaps()), [(1, list(range(250, 521)) + [2000])])
+        index.remove(1, 2000, 2502)
+        self.assertEqual(index.conflicts(1, 2506, 2510), [])
+        self.assertEqual(index.conflicts(1, 2500, 5210), list(range(250, 521)))
+        self.assertEqual(list(index.overlaps()), [])
+
+    def test_validate_schedule_within_and_against_bookings(self):
+        index = BookingIndex()
+        index.build([(1, 7, datetime(2035, 1, 1, 20), datetime(2035, 1, 1, 23))])
+        schedule = [
+            {'venue_id': 1, 'start_time': datetime(2035, 1, 1, 22), 'end_time': datetime(2035, 1, 2, 1)},
+            {'venue_id': 2, 'start_time': datetime(2035, 1, 1, 22), 'end_time': datetime(2035, 1, 2, 1)},
+            {'venue_id': 2, 'start_time': datetime(2035, 1, 2, 0), 'end_time': datetime(2035, 1, 2, 2)},
+            {'venue_id': 1, 'start_time': datetime(2035, 1, 1, 23), 'end_time': datetime(2035, 1, 2, 2)},
+        ]
+
+        rejected = validate_schedule(schedule, [('venue_id', index)])
+        self.assertEqual(sorted(rejected), [0, 2])
+        self.assertIn('show 7', rejected[0]['venue_id'][0])
+        self.assertIn('booking 2', rejected[2]['venue_id'][0])
+
+    def test_create_show_rejects_double_booking(self):
+        self.add_area('San Francisco', 'CA', venues=1)
+        venue = Venue(name='The Dueling Pianos Bar', city='New York', state='NY')
+        artist = Artist(name='The Wild Sax Band')
+        db.session.add_all([venue, artist])
+        db.session.commit()
+        ids = {'venue': Venue.query.first().id, 'artist': Artist.query.first().id,
+            'other_venue': venue.id, 'other_artist': artist.id}
+        booked_at = Show.query.one().start_time
+
+        def book(venue_id, artist_id, start_time):
+            return self.client().post('/shows/create', data={
+                'venue_id': venue_id,
+                'artist_id': artist_id,
+                'start_time': start_time.strftime('%Y-%m-%d %I:%M%p')
+            }, follow_redirects=True).data.decode()
+
+        self.assertIn('The venue is already booked', book(ids['venue'], ids['other_artist'], booked_at + timedelta(hours=1)))
+        self.assertIn('The artist is already booked', book(ids['other_venue'], ids['artist'], booked_at - timedelta(hours=1)))
+        self.assertIn('successfully listed', book(ids['other_venue'], ids['other_artist'], booked_at))
+        self.assertIn('The venue is already booked', book(ids['other_venue'], ids['artist'], booked_at + timedelta(hours=2)))
+        self.assertIn('successfully listed', book(ids['venue'], ids['other_artist'], booked_at + timedelta(hours=4)))
+        self.assertEqual(Show.query.count(), 3)
+
+    def test_booking_sees_other_process_import(self):
+        self.add_area('San Francisco', 'CA', venues=1)
+        venue_id, artist_id = Venue.query.one().id, Artist.query.one().id
+        start_time = datetime(2099, 5, 21, 21, 30)
+        self.client().post('/shows/create', data={'venue_id': venue_id, 'artist_id': artist_id,
+            'start_time': '2099-01-01 08:00PM'})
+        self.assertTrue(venue_bookings.ready)
+
+        # what another process's import writes, behind this one's mapper events
+        db.session.execute(Show.__table__.insert().values(venue_id=venue_id, artist_id=artist_id,
+            start_time=start_time, end_time=start_time + timedelta(hours=3)))
+        db.session.commit()
+        bump_data_version()
+
+        body = self.client().post('/shows/create', data={'venue_id': venue_id, 'artist_id': artist_id,
+            'start_time': '2099-05-21 10:30PM'}, follow_redirects=True).data.decode()
+        self.assertIn('already booked', body)
+
+    def test_import_shows_skips_overlapping_rows(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.add_area('San Francisco', 'CA', venues=1)
+        venue_id, artist_id = Venue.query.one().id, Artist.query.one().id
+        path = self.write_file('shows.jsonl', '\n'.join([
+            json.dumps({'venue_id': venue_id, 'artist_id': artist_id, 'start_time': '2099-05-21T21:30:00'}),
+            json.dumps({'venue_id': venue_id, 'artist_id': artist_id, 'start_time': '2099-05-21T23:30:00'}),
+            json.dumps({'venue_id': venue_id, 'artist_id': artist_id, 'start_time': '2099-05-22T21:30:00'}),
+        ]))
+
+        res = self.app.test_cli_runner().invoke(args=['import', 'shows', path, '--batch-size', '2'])
+
+        self.assertIn('3 rows: 2 inserted, 1 rejected', res.output)
+        self.assertEqual([row['line'] for row in self.read_report(path)[:-1]], [2])
+        res = self.app.test_cli_runner().invoke(args=['bookings', 'check'])
+        self.assertEqual(res.exit_code, 0, res.output)
+
+    # Locations
+    def test_search_ranges_cover_the_circle(self):
+        rng = random.Random(0)
+        for latitude, longitude, radius in [(40.7, -74.0, 10), (0, 179.99, 50), (-89.9, 10, 30), (64, -20, 400)]:
+            ranges = search_ranges(latitude, longitude, radius)
+            for _ in range(500):
+                point = (latitude + rng.uniform(-5, 5), (longitude + rng.uniform(-10, 10) + 180) % 360 - 180)
+                point = (max(-90, min(90, point[0])), point[1])
+                if distance_km(latitude, longitude, *point) <= radius:
+                    geohash = encode(*point)
+                    self.assertTrue(any(low <= geohash < high for low, high in ranges), (latitude, longitude, point))
+
+    def test_venues_geocoded_from_city(self):
+        venue = Venue(name='The Musical Hop', city='San Francisco', state='CA')
+        elsewhere = Venue(name='Nowhere Hall', city='Atlantis', state='CA')
+        db.session.add_all([venue, elsewhere])
+        db.session.commit()
+        self.assertAlmostEqual(venue.latitude, 37.7749)
+        self.assertEqual(venue.geohash, encode(venue.latitude, venue.longitude))
+        self.assertIsNone(elsewhere.geohash)
+
+        venue.city, venue.state = 'New York', 'NY'
+        db.session.commit()
+        self.assertAlmostEqual(venue.longitude, -74.0060)
+        venue.latitude, venue.longitude = 40.75, -73.99
+        db.session.commit()
+        self.assertEqual(venue.geohash, encode(40.75, -73.99))
+
+    def test_nearby_venues_closest_first(self):
+        for name, latitude, longitude in [('far', 37.70, -122.45), ('near', 37.776, -122.42),
+                ('nearest', 37.775, -122.419), ('other city', 40.71, -74.0)]:
+            db.session.add(Venue(name=name, city='San Francisco', state='CA', latitude=latitude, longitude=longitude))
+        db.session.commit()
+
+        body = self.client().get('/venues/nearby?lat=37.7749&lng=-122.4194&radius=5').data.decode()
+        self.assertLess(body.index('nearest'), body.index('>near<'))
+        self.assertNotIn('far', body)
+        body = self.client().get('/venues/nearby?lat=37.7749&lng=-122.4194&radius=20').data.decode()
+        self.assertIn('far', body)
+        self.assertNotIn('other city', body)
+        self.assertEqual(self.client().get('/venues/nearby?lat=95&lng=0').status_code, 400)
+        self.assertEqual(self.client().get('/venues/nearby?lat=nan&lng=0').status_code, 400)
+
+    def test_geo_backfill(self):
+        db.session.add(Venue(name='The Musical Hop', city='San Francisco', state='CA'))
+        db.session.commit()
+        db.session.execute(Venue.__table__.update().values(latitude=None, longitude=None, geohash=None))
+        db.session.commit()
+
+        res = self.app.test_cli_runner().invoke(args=['geo', 'backfill'])
+        self.assertIn('1 venues located', res.output)
+        self.assertIn('The Musical Hop', self.client().get('/venues/nearby?lat=37.77&lng=-122.42').data.decode())
+
+    # Export
+    def test_export_entities_and_shows(self):
+        self.add_area('San Francisco', 'CA', venues=1)
+        venue = Venue(name='The Dueling Pianos Bar, NY', city='New York', state='NY', genres=['Classical', 'R&B'])
+        db.session.add(venue)
+        db.session.commit()
+
+        res = self.client().get('/export/venues')
+        rows = list(csv.DictReader(io.StringIO(res.data.decode())))
+        self.assertEqual(res.mimetype, 'text/csv')
+        self.assertEqual([row['name'] for row in rows], ['venue_San Francisco_0', 'The Dueling Pianos Bar, NY'])
+        self.assertEqual(rows[1]['genres'], 'Classical,R&B')
+
+        tomorrow = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+        res = self.client().get('/export/venues?format=jsonl&from_date=' + tomorrow)
+        self.assertEqual([json.loads(line)['name'] for line in res.data.decode().splitlines()], ['venue_San Francisco_0'])
+
+        res = self.client().get('/export/shows', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        rows = list(csv.DictReader(io.StringIO(gzip.decompress(res.data).decode())))
+        self.assertEqual([(row['venue_name'], row['artist_name']) for row in rows],
+            [('venue_San Francisco_0', 'artist_San Francisco')])
+        self.assertEqual(self.client().get('/export/shows?to_date=someday').status_code, 400)
+
+    def test_export_memory_stays_flat(self):
+        db.session.add_all([Venue(name='The Musical Hop'), Artist(name='Guns N Petals')])
+        db.session.commit()
+        start = datetime(2035, 1, 1)
+
+        def export_peak(shows):
+            db.session.execute(Show.__table__.insert(), [{
+                'venue_id': 1, 'artist_id': 1, 'is_upcoming': True,
+                'start_time': start + timedelta(hours=4 * i),
+                'end_time': start + timedelta(hours=4 * i + 3)
+                } for i in range(Show.query.count(), shows)])
+            db.session.commit()
+            res = self.client().get('/export/shows', buffered=False)
+            tracemalloc.start()
+            try:
+                lines = sum(chunk.count(b'\n') for chunk in res.response)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+                res.close()
+            self.assertEqual(lines, shows + 1)
+            return peak
+
+        # small fetches and chunks, so a small table already fills them
+        with mock.patch.dict(app.config, {'EXPORT_FETCH_SIZE': 100, 'EXPORT_CHUNK_ROWS': 50}):
+            export_peak(100)
+            small, large = export_peak(1000), export_peak(10000)
+        self.assertLess(large, small * 1.2)
+
+    # Date formatting
+    def test_date_formatter_matches_babel(self):
+        formatter = DateFormatter()
+        values = [datetime(2019, 5, 21, 21, 30), datetime(2035, 4, 1, 8, 5), datetime(2035, 4, 1, 8, 5)]
+
+        self.assertEqual(formatter.format_many(values, 'full'),
+            [babel.dates.format_datetime(value, "EEEE MMMM, d, y 'at' h:mma") for value in values])
+        self.assertEqual(formatter.format(values[0]), babel.dates.format_datetime(values[0], "EE MM, dd, y h:mma"))
+        self.assertEqual(formatter.format(values[0], 'short'), babel.dates.format_datetime(values[0], 'short'))
+        self.assertEqual(len(formatter.formatted), 3)
+
+    # SQL instrumentation
+    def test_server_timing_header(self):
+        self.add_area('San Francisco', 'CA')
+        res = self.client().get('/venues')
+        self.assertRegex(res.headers['Server-Timing'], r'^db;dur=[0-9.]+;desc="1 queries"$')
+
+        res = self.client().get('/venues')
+        self.assertIn('desc="0 queries"', res.headers['Server-Timing'])
+
+    def test_strict_mode_fails_over_budget(self):
+        self.add_area('San Francisco', 'CA')
+        app.config['SQL_QUERY_BUDGET'] = 0
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client().post('/venues/search', data={'search_term': 'venue'})
+
+    def test_repeated_statements_flagged(self):
+        queries = RequestQueries()
+        for i in range(5):
+            queries.record('SELECT count(show.id) FROM show WHERE show.venue_id = ?', 0.001 * i)
+        queries.record('SELECT venue.city, venue.state FROM venue GROUP BY venue.city, venue.state', 0.01)
+
+        self.assertEqual(queries.count, 6)
+        self.assertEqual(queries.repeated(5), [('SELECT count(show.id) FROM show WHERE show.venue_id = ?', 5)])
+        self.assertEqual(queries.slowest(1)[0][0], 0.01)
+
+    # Read replica routing
+    def test_read_only_pages_use_replica(self):
+        self.add_area('San Francisco', 'CA')
+        self.use_replica()
+        venue_id = db.session.query(Venue.id).first().id
+
+        self.assertNotIn('San Francisco', self.client().get('/venues').data.decode())
+        self.assertEqual(self.client().get('/venues/{}'.format(venue_id)).status_code, 404)
+        # forms read what they are about to overwrite from the primary
+        self.assertEqual(self.client().get('/venues/{}/edit'.format(venue_id)).status_code, 200)
+
+    def test_writer_reads_own_writes(self):
+        replica = self.use_replica()
+        writer = self.client()
+        res = writer.post('/venues/create', data=self.venue_form('The Primary'))
+        self.assertEqual(res.status_code, 302)
+        self.assertEqual(db.session.query(Venue).count(), 1)
+        self.assertEqual(replica.execute('SELECT count(*) FROM venue').scalar(), 0)
+
+        # others read the lagging replica, and that page is not cached
+        self.assertNotIn('The Primary', self.client().get('/venues').data.decode())
+        self.assertIsNone(response_cache.get('page:/venues?'))
+        self.assertIn('The Primary', writer.get('/venues').data.decode())
+        self.assertEqual(writer.get(res.headers['Location']).status_code, 200)
+
+    def test_writer_goes_back_to_replica(self):
+        self.use_replica()
+        app.config['DB_REPLICA_STICKY_SECONDS'] = 0
+        writer = self.client()
+        res = writer.post('/venues/create', data=self.venue_form('The Primary'))
+        self.assertEqual(writer.get(res.headers['Location']).status_code, 404)
+
+    def test_pool_options_for_server_databases(self):
+        url, options = db.apply_driver_hacks(app, make_url('postgresql://localhost/fyyur'), {})
+        self.assertEqual(options['pool_size'], app.config['DB_POOL_SIZE'])
+        self.assertEqual(options['max_overflow'], app.config['DB_MAX_OVERFLOW'])
+        self.assertEqual(options['pool_recycle'], app.config['DB_POOL_RECYCLE'])
+        self.assertTrue(options['pool_pre_ping'])
+
+        url, options = db.apply_driver_hacks(app, make_url('sqlite://'), {})
+        self.assertNotIn('pool_size', options)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
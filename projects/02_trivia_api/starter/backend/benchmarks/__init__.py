@@ -0,0 +1,4 @@
+# Trivia backend benchmarks, run from the backend directory:
+#   python -m benchmarks.quiz --questions 100000
+#   python -m benchmarks.search --questions 100000
+#   python -m benchmarks.batch
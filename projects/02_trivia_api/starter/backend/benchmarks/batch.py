@@ -0,0 +1,55 @@
+import argparse
+import json
+import time
+
+#----------------------------------------------------------------------------#
+# Seeding a quiz pack: one POST /questions per question against batches of
+# POST /questions/batch, as JSON arrays and NDJSON, on SQLite.
+#----------------------------------------------------------------------------#
+
+
+def synthetic_pack(count):
+    return [{'question': 'Question {}?'.format(i + 1), 'answer': 'Answer {}'.format(i + 1), 'category': None,
+        'difficulty': i % 5 + 1} for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rows per second of single and batch question writes.')
+    parser.add_argument('--database', default='sqlite:///trivia_batch.db')
+    parser.add_argument('--questions', type=int, default=10000)
+    parser.add_argument('--single', type=int, default=1000, help='questions posted one at a time')
+    args = parser.parse_args()
+
+    from flaskr import create_app
+    from models import db, Question
+    app = create_app({'SQLALCHEMY_DATABASE_URI': args.database})
+    with app.app_context():
+        db.session.query(Question).delete()
+        db.session.commit()
+        client = app.test_client()
+        pack = synthetic_pack(args.questions)
+
+        print('{:>14} {:>10} {:>12}'.format('write', 'rows', 'rows/s'))
+        started = time.perf_counter()
+        for question in pack[:args.single]:
+            client.post('/questions', json=question)
+        print('{:>14} {:>10} {:>12.0f}'.format('single', args.single, args.single / (time.perf_counter() - started)))
+
+        for name, body, content_type in (
+                ('batch json', json.dumps(pack), 'application/json'),
+                ('batch ndjson', '\n'.join(json.dumps(question) for question in pack), 'application/x-ndjson')):
+            started = time.perf_counter()
+            report = client.post('/questions/batch', data=body, content_type=content_type).get_json()
+            print('{:>14} {:>10} {:>12.0f}   (server side {})'.format(name, report['created'],
+                report['created'] / (time.perf_counter() - started), report['rows_per_second']))
+
+        ids = [id for id, in db.session.query(Question.id).limit(args.questions)]
+        db.session.commit()
+        started = time.perf_counter()
+        report = client.delete('/questions/batch', json=ids).get_json()
+        print('{:>14} {:>10} {:>12.0f}   (server side {})'.format('batch delete', report['deleted'],
+            report['deleted'] / (time.perf_counter() - started), report['rows_per_second']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import argparse
+import random
+import time
+
+#----------------------------------------------------------------------------#
+# Latency of /quizzes as the question table grows: whole quizzes are played
+# against a SQLite copy of the table, with the query that loaded every question
+# left to play for comparison. The pool should not slow down with the table.
+#----------------------------------------------------------------------------#
+
+
+def synthetic_questions(count, categories):
+    for i in range(count):
+        yield {'id': i + 1, 'question': 'Question {}?'.format(i + 1), 'answer': 'Answer {}'.format(i + 1),
+            'category': i % categories + 1, 'difficulty': i % 5 + 1}
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def loaded_pick(category, previous_questions):
+    # the query /quizzes ran before the pool
+    from sqlalchemy.sql import and_, or_
+    from models import db, Question
+    questions = db.session.query(Question).filter(and_(or_(Question.category == category, category == 0),
+        ~Question.id.in_(previous_questions))).all()
+    return random.choice(questions).format() if questions else None
+
+
+def play(pick, category, rounds):
+    # seconds per question of one quiz
+    previous_questions = []
+    samples = []
+    for i in range(rounds):
+        started = time.perf_counter()
+        question = pick(category, previous_questions)
+        samples.append(time.perf_counter() - started)
+        if question is None:
+            break
+        previous_questions.append(question['id'])
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Quiz question latency against the size of the question table.')
+    parser.add_argument('--database', default='sqlite:///trivia_quiz.db')
+    parser.add_argument('--questions', type=int, default=100000)
+    parser.add_argument('--categories', type=int, default=6)
+    parser.add_argument('--quizzes', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=5, help='questions per quiz, the frontend plays 5')
+    parser.add_argument('--skip-loaded', action='store_true', help='only time the pool')
+    args = parser.parse_args()
+
+    from flaskr import create_app
+    from models import db, Question
+    app = create_app({'SQLALCHEMY_DATABASE_URI': args.database})
+    with app.app_context():
+        db.session.query(Question).delete()
+        questions = list(synthetic_questions(args.questions, args.categories))
+        for start in range(0, len(questions), 10000):
+            db.session.execute(Question.__table__.insert(), questions[start:start + 10000])
+        db.session.commit()
+        client = app.test_client()
+
+        def pool_pick(category, previous_questions):
+            response = client.post('/quizzes', json={'previous_questions': previous_questions,
+                'quiz_category': {'id': category, 'type': 'click'}})
+            return response.get_json()['question']
+
+        picks = [('pool', pool_pick)]
+        if not args.skip_loaded:
+            picks.append(('loaded', loaded_pick))
+        # the first quiz loads the pool
+        play(pool_pick, 0, 1)
+
+        print('{:>8} {:>10} {:>10} {:>10}'.format('pick', 'category', 'p50 ms', 'p95 ms'))
+        for name, pick in picks:
+            for category in (0, 1):
+                samples = []
+                for quiz in range(args.quizzes):
+                    samples.extend(play(pick, category, args.rounds))
+                print('{:>8} {:>10} {:>10.2f} {:>10.2f}'.format(name, category,
+                    percentile(samples, 0.5) * 1000, percentile(samples, 0.95) * 1000))
+
+
+if __name__ == '__main__':
+    main()
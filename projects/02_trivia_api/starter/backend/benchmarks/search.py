@@ -0,0 +1,75 @@
+import argparse
+import random
+import time
+from itertools import accumulate
+
+from benchmarks.quiz import percentile
+
+#----------------------------------------------------------------------------#
+# Latency of searchTerm on POST /questions against a SQLite copy of a question
+# table of made up sentences, with the substring scan it replaced for
+# comparison, and the time to build the index at startup.
+#----------------------------------------------------------------------------#
+
+WORDS = '''
+  painter river capital empire ocean planet novel composer battle mountain island king queen
+  language element desert temple bridge festival invention poet scientist symphony harbor volcano
+  dynasty treaty comet glacier cathedral opera canal forest republic galaxy pharaoh sculptor
+'''.split()
+
+
+def vocabulary(size):
+    # the words above and made up ones after them, used with a Zipf-like skew
+    words = WORDS + ['{}{}'.format(WORDS[i % len(WORDS)], i) for i in range(size - len(WORDS))]
+    return words, list(accumulate(1.0 / rank for rank in range(1, size + 1)))
+
+
+def synthetic_questions(count, words, weights, rng):
+    for i in range(count):
+        yield {'id': i + 1, 'question': 'Which {} {} the {} {}?'.format(*rng.choices(words, cum_weights=weights, k=4)),
+            'answer': ' '.join(rng.choices(words, cum_weights=weights, k=2)).title(), 'category': i % 6 + 1, 'difficulty': i % 5 + 1}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Question search latency against the size of the question table.')
+    parser.add_argument('--database', default='sqlite:///trivia_search.db')
+    parser.add_argument('--questions', type=int, default=100000)
+    parser.add_argument('--searches', type=int, default=50)
+    parser.add_argument('--words', type=int, default=20000, help='size of the vocabulary')
+    args = parser.parse_args()
+
+    from flaskr import create_app, search_index, load_search_index
+    from models import db, Question
+    rng = random.Random(0)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': args.database})
+    with app.app_context():
+        db.session.query(Question).delete()
+        words, weights = vocabulary(args.words)
+        questions = list(synthetic_questions(args.questions, words, weights, rng))
+        for start in range(0, len(questions), 10000):
+            db.session.execute(Question.__table__.insert(), questions[start:start + 10000])
+        db.session.commit()
+        started = time.perf_counter()
+        load_search_index()
+        print('index built in {:.2f} s'.format(time.perf_counter() - started))
+
+        client = app.test_client()
+        terms = [' '.join(rng.choices(words, cum_weights=weights, k=2)) for i in range(args.searches)]
+        print('{:>10} {:>10} {:>10}'.format('search', 'p50 ms', 'p95 ms'))
+        for name, config in (('index', 'index'), ('substring', None)):
+            samples = []
+            for term in terms:
+                started = time.perf_counter()
+                if config is None:
+                    # the query searchTerm ran before the index, all the pages
+                    matches = Question.question.ilike('%{}%'.format(term.split()[0]))
+                    db.session.query(Question).filter(matches).order_by(Question.id).limit(10).all()
+                    db.session.query(Question.id).filter(matches).count()
+                else:
+                    client.post('/questions', json={'searchTerm': term})
+                samples.append(time.perf_counter() - started)
+            print('{:>10} {:>10.2f} {:>10.2f}'.format(name, percentile(samples, 0.5) * 1000, percentile(samples, 0.95) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,26 +1,212 @@
 import os
-from flask import Flask, request, abort, jsonify
+import threading
+import time
+from itertools import chain
+from flask import Flask, request, abort, jsonify, current_app
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 from sqlalchemy.sql import func, and_, or_
 from flask_cors import CORS
 import random
 
-from models import setup_db, Question, Category, db
+from models import setup_db, database_path, Question, Category, db
+from .quiz import QuestionPool, QuizSessions, ALL_CATEGORIES
+from .search import SearchIndex
+from .categories import CategoryRegistry
+from .batch import read_items, question_errors, question_id, BatchTooLarge
 
 # Pagination
 QUESTIONS_PER_PAGE = 10
-def paginate_questions(request, questions):
-  page = request.args.get('page', 1, type=int)
+def paginate_questions(request, query):
+  # one page of `query`, which is ordered by id, formatted: the page after
+  # the `after` question id when given (keyset), else the `page` number
+  after = request.args.get('after', None, type=int)
+  if after is not None:
+    query = query.filter(Question.id > after)
+  else:
+    page = request.args.get('page', 1, type=int)
+    if page < 1:
+      return []
+    query = query.offset((page - 1) * QUESTIONS_PER_PAGE)
+  return [question.format() for question in query.limit(QUESTIONS_PER_PAGE)]
+
+# Question counts
+QUESTION_COUNT_TTL = 60
+class CountCache(object):
+  '''
+  COUNT results by key. Writes to questions in this process drop them at
+  once, writes from other processes are picked up after `ttl` seconds.
+  '''
+  def __init__(self, ttl):
+    self.ttl = ttl
+    self.counts = {}
+    self.lock = threading.Lock()
+
+  def get(self, key, count):
+    # the cached count for `key`, or the result of calling `count()`
+    with self.lock:
+      cached = self.counts.get(key)
+    if cached is not None and time.monotonic() - cached[1] < self.ttl:
+      return cached[0]
+    value = count()
+    with self.lock:
+      self.counts[key] = (value, time.monotonic())
+    return value
+
+  def invalidate(self):
+    with self.lock:
+      self.counts.clear()
+
+question_counts = CountCache(QUESTION_COUNT_TTL)
+
+def count_questions(*criteria):
+  return db.session.query(func.count(Question.id)).filter(*criteria).scalar()
+
+# Quiz questions
+QUIZ_POOL_TTL = 300
+QUIZ_PICK_ATTEMPTS = 3
+question_pool = QuestionPool(QUIZ_POOL_TTL)
+
+# quizzes played through /quizzes/sessions
+QUIZ_SESSIONS = 10000
+QUIZ_SESSION_TTL = 1800
+QUIZ_SESSION_QUESTIONS = 50
+quiz_sessions = QuizSessions(QUIZ_SESSIONS, QUIZ_SESSION_TTL)
+
+def load_question_pool():
+  if not question_pool.ready():
+    question_pool.load(db.session.query(Question.id, Question.category))
+
+# Question search
+SEARCH_INDEX_TTL = 300
+search_index = SearchIndex(SEARCH_INDEX_TTL)
+
+def load_search_index():
+  if not search_index.ready():
+    search_index.load(db.session.query(Question.id, Question.question, Question.answer))
+
+def search_questions(term, page):
+  # (number of matches, formatted page of the questions matching `term`, best
+  # match first), from the in-memory index or PostgreSQL full-text search
   start = (page - 1) * QUESTIONS_PER_PAGE
-  end = start + QUESTIONS_PER_PAGE
-  formatted_questions = [question.format() for question in questions]
-  current_questions = formatted_questions[start:end]
-  return current_questions
+  if page < 1:
+    return 0, []
+  if current_app.config['QUESTION_SEARCH'] == 'tsvector':
+    document = func.to_tsvector('english', func.coalesce(Question.question, '') + ' ' + func.coalesce(Question.answer, ''))
+    query = func.plainto_tsquery('english', term)
+    matches = document.op('@@')(query)
+    questions = db.session.query(Question).filter(matches).order_by(func.ts_rank_cd(document, query).desc(), Question.id)
+    return count_questions(matches), [question.format() for question in questions.offset(start).limit(QUESTIONS_PER_PAGE)]
+
+  load_search_index()
+  total, ids = search_index.search(term, start, start + QUESTIONS_PER_PAGE)
+  questions = {}
+  if ids:
+    questions = { question.id: question for question in db.session.query(Question).filter(Question.id.in_(ids)) }
+  # questions deleted by another process are still in the index until it reloads
+  return total, [questions[id].format() for id in ids if id in questions]
+
+# Categories
+CATEGORIES_TTL = 300
+category_registry = CategoryRegistry(CATEGORIES_TTL)
+
+def get_category_map():
+  # (etag, {id: type} of every category)
+  version, etag, categories = category_registry.get(lambda: db.session.query(Category.id, Category.type))
+  return etag, categories
+
+@event.listens_for(Session, 'after_flush')
+def categories_flushed(session, flush_context):
+  if any(isinstance(instance, Category) for instance in chain(session.new, session.dirty, session.deleted)):
+    session.info['categories_written'] = True
+
+@event.listens_for(Session, 'after_commit')
+def categories_committed(session):
+  if session.info.pop('categories_written', False):
+    category_registry.invalidate()
+
+# Question writes
+@event.listens_for(Session, 'after_flush')
+def questions_flushed(session, flush_context):
+  # the pool and the index follow committed writes only
+  changes = [('add', instance) for instance in chain(session.new, session.dirty) if isinstance(instance, Question)]
+  changes.extend(('discard', instance) for instance in session.deleted if isinstance(instance, Question))
+  if changes:
+    question_counts.invalidate()
+    # categories posted as strings are only read back as integers
+    session.info.setdefault('question_writes', []).extend((action, question.id,
+      question.category if question.category is None else int(question.category), question.question, question.answer)
+      for action, question in changes)
+
+@event.listens_for(Session, 'after_commit')
+def questions_committed(session):
+  for action, id, category, text, answer in session.info.pop('question_writes', []):
+    if action == 'add':
+      question_pool.add(id, category)
+      search_index.add(id, text, answer)
+    else:
+      question_pool.discard(id)
+      search_index.discard(id)
 
-def create_app(test_config=None):
-  # create and configure the app
+def questions_replaced():
+  # writes too many or too blind to follow, everything reloads
+  question_counts.invalidate()
+  question_pool.invalidate()
+  search_index.invalidate()
+
+@event.listens_for(Session, 'after_bulk_delete')
+@event.listens_for(Session, 'after_bulk_update')
+def questions_bulk_written(context):
+  if context.mapper.class_ is Category:
+    category_registry.invalidate()
+  if context.mapper.class_ is Question:
+    questions_replaced()
+
+@event.listens_for(Session, 'after_rollback')
+def questions_rolled_back(session):
+  # counts read inside the rolled back transaction may have seen its writes
+  question_counts.invalidate()
+  session.info.pop('question_writes', None)
+  session.info.pop('categories_written', None)
+
+# Batches
+QUESTIONS_BATCH_LIMIT = 10000
+QUESTIONS_BATCH_CHUNK = 500
+
+def in_chunks(items):
+  for start in range(0, len(items), QUESTIONS_BATCH_CHUNK):
+    yield items[start:start + QUESTIONS_BATCH_CHUNK]
+
+def batch_failed(failures):
+  # nothing of the batch was written, why for each item that failed
+  return jsonify({
+    'success': False,
+    'error': 422,
+    'message': 'unprocessable',
+    'failures': failures
+  }), 422
+
+def batch_done(action, rows, started):
+  seconds = time.perf_counter() - started
+  return jsonify({
+    'success': True,
+    action: rows,
+    'seconds': round(seconds, 3),
+    'rows_per_second': round(rows / seconds) if seconds else None
+  })
+
+def create_app(test_config=None, engine=None):
+  # create and configure the app, on `engine` when given (see setup_db)
   app = Flask(__name__)
-  setup_db(app)
+  if test_config is not None:
+    app.config.from_mapping(test_config)
+  setup_db(app, app.config.get('SQLALCHEMY_DATABASE_URI', database_path), engine=engine)
+  # PostgreSQL searches itself, other databases through the in-memory index
+  app.config.setdefault('QUESTION_SEARCH', 'tsvector' if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgres') else 'index')
+  if app.config['QUESTION_SEARCH'] == 'index':
+    with app.app_context():
+      load_search_index()
 
   # CORS settings
   CORS(app)
@@ -33,32 +219,32 @@ def create_app(test_config=None):
   # Categories - GET
   @app.route('/categories')
   def get_categories():
-    categories = db.session.query(Category).order_by(Category.id).all()
-    formatted_categories = { category.id: category.type for category in categories }
+    etag, formatted_categories = get_category_map()
 
-    if len(categories) == 0:
+    if len(formatted_categories) == 0:
       abort(404)
 
-    return jsonify({
+    # clients polling with the ETag they have get a 304 until categories change
+    response = jsonify({
       'success': True,
       'categories': formatted_categories
     })
+    response.set_etag(etag)
+    return response.make_conditional(request)
 
   # Questions - GET
   @app.route('/questions')
   def get_questions():
-    questions = db.session.query(Question).order_by(Question.id).all()
-    current_questions = paginate_questions(request, questions)
+    current_questions = paginate_questions(request, db.session.query(Question).order_by(Question.id))
     if len(current_questions) == 0:
       abort(404)
 
-    categories = db.session.query(Category).order_by(Category.id).all()
-    formatted_categories = { category.id: category.type for category in categories }
+    etag, formatted_categories = get_category_map()
 
     return jsonify({
       'success': True,
       'questions': current_questions,
-      'total_questions': len(questions),
+      'total_questions': question_counts.get('all', count_questions),
       'categories': formatted_categories
     })
 
@@ -75,8 +261,12 @@ def create_app(test_config=None):
 
     try:
       if search is not None:
-        questions = db.session.query(Question).filter(Question.question.ilike('%{}%'.format(search))).order_by(Question.id).all()
-        current_questions = paginate_questions(request, questions)
+        total_questions, current_questions = search_questions(search, request.args.get('page', 1, type=int))
+        if total_questions == 0:
+          # no whole word matches, as a substring then
+          matches = Question.question.ilike('%{}%'.format(search))
+          current_questions = paginate_questions(request, db.session.query(Question).filter(matches).order_by(Question.id))
+          total_questions = count_questions(matches)
 
         if len(current_questions) == 0:
           abort(404)
@@ -84,10 +274,14 @@ def create_app(test_config=None):
         return jsonify({
           'success': True,
           'questions': current_questions,
-          'total_questions': len(questions)
+          'total_questions': total_questions
         })
 
       else:
+        # the form posts numbers as strings, other strings are refused like
+        # PostgreSQL does, whatever the database
+        category = None if category is None else int(category)
+        difficulty = None if difficulty is None else int(difficulty)
         new_question = Question(question=question, answer=answer, category=category, difficulty=difficulty)
         new_question.insert()
         return jsonify({
@@ -98,6 +292,74 @@ def create_app(test_config=None):
     except:
       abort(422)
 
+  # Questions - batches
+  @app.route('/questions/batch', methods=['POST'])
+  def create_questions():
+    started = time.perf_counter()
+    try:
+      items = read_items(request, QUESTIONS_BATCH_LIMIT)
+    except BatchTooLarge:
+      abort(413)
+    except ValueError:
+      abort(400)
+
+    # every item is checked before anything is written
+    etag, categories = get_category_map()
+    failures = []
+    for index, (item, error) in enumerate(items):
+      errors = [error] if error else question_errors(item, categories)
+      if errors:
+        failures.append({ 'index': index, 'errors': errors })
+    if failures:
+      return batch_failed(failures)
+
+    rows = [{ 'question': item['question'], 'answer': item['answer'], 'category': item.get('category'),
+      'difficulty': item.get('difficulty') } for item, error in items]
+    try:
+      for chunk in in_chunks(rows):
+        db.session.execute(Question.__table__.insert(), chunk)
+      db.session.commit()
+    except:
+      db.session.rollback()
+      abort(422)
+    questions_replaced()
+
+    return batch_done('created', len(rows), started)
+
+  @app.route('/questions/batch', methods=['DELETE'])
+  def delete_questions():
+    started = time.perf_counter()
+    try:
+      items = read_items(request, QUESTIONS_BATCH_LIMIT)
+    except BatchTooLarge:
+      abort(413)
+    except ValueError:
+      abort(400)
+
+    ids = [None if error else question_id(item) for item, error in items]
+    found = set()
+    for chunk in in_chunks(list(set(id for id in ids if id is not None))):
+      found.update(id for id, in db.session.query(Question.id).filter(Question.id.in_(chunk)))
+    failures = []
+    for index, ((item, error), id) in enumerate(zip(items, ids)):
+      if error or id is None:
+        failures.append({ 'index': index, 'errors': [error or 'expected a question id'] })
+      elif id not in found:
+        failures.append({ 'index': index, 'errors': ['no question {}'.format(id)] })
+    if failures:
+      return batch_failed(failures)
+
+    try:
+      for chunk in in_chunks(list(found)):
+        db.session.query(Question).filter(Question.id.in_(chunk)).delete(synchronize_session=False)
+      db.session.commit()
+    except:
+      db.session.rollback()
+      abort(422)
+    questions_replaced()
+
+    return batch_done('deleted', len(found), started)
+
   # Questions - DELETE
   @app.route('/questions/<int:question_id>', methods=['DELETE'])
   def delete_question(question_id):
@@ -118,8 +380,8 @@ def create_app(test_config=None):
   # Catgories -> Questions - GET
   @app.route('/categories/<int:category_id>/questions')
   def get_questions_by_category(category_id):
-    questions = db.session.query(Question).filter(Question.category == category_id).order_by(Question.id).all()
-    current_questions = paginate_questions(request, questions)
+    in_category = Question.category == category_id
+    current_questions = paginate_questions(request, db.session.query(Question).filter(in_category).order_by(Question.id))
 
     if len(current_questions) == 0:
       abort(404)
@@ -127,7 +389,7 @@ def create_app(test_config=None):
     return jsonify({
       'success': True,
       'questions': current_questions,
-      'total_questions': len(questions),
+      'total_questions': question_counts.get(('category', category_id), lambda: count_questions(in_category)),
       'current_category': category_id
     })
 
@@ -139,12 +401,23 @@ def create_app(test_config=None):
     quiz_category = data.get('quiz_category', None)
 
     try:
-      questions = db.session.query(Question).filter(and_(or_(Question.category == quiz_category['id'], int(quiz_category['id']) == 0), ~Question.id.in_(previous_questions))).all()
+      category = int(quiz_category['id'])
+      previous_questions = set(int(id) for id in previous_questions)
 
-      if len(questions) == 0:
-        random_question = None
-      else:
-        random_question = random.choice(questions).format()
+      # the pool picks an id, only that question is loaded
+      load_question_pool()
+      random_question = None
+      for attempt in range(QUIZ_PICK_ATTEMPTS):
+        question_id = question_pool.pick(category, previous_questions)
+        if question_id is None:
+          break
+        question = db.session.query(Question).get(question_id)
+        if question is not None and category in (ALL_CATEGORIES, question.category):
+          random_question = question.format()
+          break
+        # deleted or moved by another process, reload
+        question_pool.invalidate()
+        load_question_pool()
 
       return jsonify({
         'success': True,
@@ -154,6 +427,59 @@ def create_app(test_config=None):
     except:
       abort(422)
 
+  # Quiz sessions
+  @app.route('/quizzes/sessions', methods=['POST'])
+  def start_quiz():
+    data = request.get_json()
+    quiz_category = data.get('quiz_category', None)
+
+    try:
+      category = int(quiz_category['id'])
+      load_question_pool()
+      ids = question_pool.shuffled(category, QUIZ_SESSION_QUESTIONS)
+      token = quiz_sessions.start(category, ids)
+
+      return jsonify({
+        'success': True,
+        'token': token,
+        'total_questions': len(ids)
+      })
+
+    except:
+      abort(422)
+
+  @app.route('/quizzes/sessions/<token>/next', methods=['POST'])
+  def next_quiz_question(token):
+    # questions deleted or moved since the quiz started are skipped
+    while True:
+      try:
+        category, question_id = quiz_sessions.next(token)
+      except KeyError:
+        abort(404)
+      if question_id is None:
+        next_question = None
+        break
+      question = db.session.query(Question).get(question_id)
+      if question is not None and category in (ALL_CATEGORIES, question.category):
+        next_question = question.format()
+        break
+
+    return jsonify({
+      'success': True,
+      'question': next_question
+    })
+
+  @app.route('/quizzes/sessions/<token>', methods=['DELETE'])
+  def end_quiz(token):
+    try:
+      quiz_sessions.end(token)
+    except KeyError:
+      abort(404)
+
+    return jsonify({
+      'success': True
+    })
+
   # Error handling
   @app.errorhandler(400)
   def bad_request(error):
@@ -171,6 +497,14 @@ def create_app(test_config=None):
       'message': 'not found'
     }), 404
 
+  @app.errorhandler(413)
+  def too_large(error):
+    return jsonify({
+      'success': False,
+      'error': 413,
+      'message': 'too many items, at most {} per batch'.format(QUESTIONS_BATCH_LIMIT)
+    }), 413
+
   @app.errorhandler(422)
   def unprocessable(error):
     return jsonify({
@@ -0,0 +1,84 @@
+import json
+
+# request bodies that hold one JSON item per line
+NDJSON_TYPES = ('application/x-ndjson', 'application/jsonl')
+# RFC 7464 JSON text sequences: each item starts with a record separator
+JSON_SEQ_TYPE = 'application/json-seq'
+RECORD_SEPARATOR = b'\x1e'
+
+
+class BatchTooLarge(Exception):
+  pass
+
+
+def json_seq_records(stream, chunk_size=64 * 1024):
+  # the records of a JSON text sequence, split on the separators as it streams in
+  pending = b''
+  for chunk in iter(lambda: stream.read(chunk_size), b''):
+    records = (pending + chunk).split(RECORD_SEPARATOR)
+    pending = records.pop()
+    for record in records:
+      yield record
+  yield pending
+
+
+def read_items(request, limit):
+  '''
+  The items of a batch request, a JSON array, NDJSON lines or JSON text
+  sequence records read as they stream in, as a list of (item, error): a
+  line or record that is not JSON is an item with an error. Raises
+  ValueError when the body is not a batch and BatchTooLarge past `limit`
+  items.
+  '''
+  if request.mimetype in NDJSON_TYPES or request.mimetype == JSON_SEQ_TYPE:
+    records = json_seq_records(request.stream) if request.mimetype == JSON_SEQ_TYPE else request.stream
+    items = []
+    for line in records:
+      if not line.strip():
+        continue
+      if len(items) == limit:
+        raise BatchTooLarge()
+      try:
+        items.append((json.loads(line), None))
+      except ValueError:
+        items.append((None, 'not valid JSON'))
+    return items
+
+  data = request.get_json(silent=True)
+  if not isinstance(data, list):
+    raise ValueError('expected a JSON array or NDJSON')
+  if len(data) > limit:
+    raise BatchTooLarge()
+  return [(item, None) for item in data]
+
+
+def is_integer(value):
+  return isinstance(value, int) and not isinstance(value, bool)
+
+
+def question_errors(item, categories):
+  # what is wrong with `item` as a new question, given the category ids
+  if not isinstance(item, dict):
+    return ['expected an object']
+  errors = []
+  for field in ('question', 'answer'):
+    value = item.get(field)
+    if not isinstance(value, str) or not value.strip():
+      errors.append('{} is required'.format(field))
+  category = item.get('category')
+  if category is not None and (not is_integer(category) or category not in categories):
+    errors.append('no category {}'.format(json.dumps(category)))
+  difficulty = item.get('difficulty')
+  if difficulty is not None and not is_integer(difficulty):
+    errors.append('difficulty must be an integer')
+  unknown = set(item) - {'question', 'answer', 'category', 'difficulty'}
+  if unknown:
+    errors.append('unknown fields: {}'.format(', '.join(sorted(unknown))))
+  return errors
+
+
+def question_id(item):
+  # the question id of a delete item, an id or {"id": id}, or None
+  if isinstance(item, dict):
+    item = item.get('id')
+  return item if is_integer(item) else None
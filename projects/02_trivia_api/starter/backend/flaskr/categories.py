@@ -0,0 +1,39 @@
+import hashlib
+import json
+import threading
+import time
+
+
+class CategoryRegistry(object):
+  '''
+  The {id: type} map of categories, loaded once and reloaded after `ttl`
+  seconds or once invalidated. `version` counts the loads that changed the
+  map; `etag` is a digest of it, the same in every process serving it.
+  '''
+  def __init__(self, ttl):
+    self.ttl = ttl
+    self.lock = threading.Lock()
+    self.loaded_at = None
+    self.categories = {}
+    self.version = 0
+    self.etag = None
+
+  def ready(self):
+    return self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl
+
+  def invalidate(self):
+    self.loaded_at = None
+
+  def get(self, load):
+    # (version, etag, categories), calling `load()` for (id, type) rows when
+    # not ready; the map returned is shared and must not be changed
+    if not self.ready():
+      categories = dict(load())
+      with self.lock:
+        if categories != self.categories or self.etag is None:
+          self.categories = categories
+          self.version += 1
+          self.etag = hashlib.sha1(json.dumps(sorted(categories.items())).encode()).hexdigest()
+        self.loaded_at = time.monotonic()
+    with self.lock:
+      return self.version, self.etag, self.categories
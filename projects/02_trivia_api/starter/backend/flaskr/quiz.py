@@ -0,0 +1,182 @@
+import random
+import secrets
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+# quiz_category id the frontend sends for "all categories"
+ALL_CATEGORIES = 0
+
+
+class IdSet(object):
+  '''
+  Ids in a list for O(1) random choice, with their positions in it for O(1)
+  removal: the last id takes the place of the removed one.
+  '''
+  def __init__(self):
+    self.ids = []
+    self.positions = {}
+
+  def __len__(self):
+    return len(self.ids)
+
+  def __contains__(self, id):
+    return id in self.positions
+
+  def add(self, id):
+    if id not in self.positions:
+      self.positions[id] = len(self.ids)
+      self.ids.append(id)
+
+  def discard(self, id):
+    position = self.positions.pop(id, None)
+    if position is None:
+      return
+    last = self.ids.pop()
+    if position < len(self.ids):
+      self.ids[position] = last
+      self.positions[last] = position
+
+  def sample(self, exclude, rng):
+    # a random id not in the set `exclude`, or None
+    left = len(self.ids) - sum(1 for id in exclude if id in self.positions)
+    if left <= 0:
+      return None
+    if left * 2 >= len(self.ids):
+      # at least half are left, so fewer than two draws are expected
+      while True:
+        id = rng.choice(self.ids)
+        if id not in exclude:
+          return id
+    return rng.choice([id for id in self.ids if id not in exclude])
+
+
+class QuestionPool(object):
+  '''
+  The question ids of every category, for picking quiz questions without
+  loading the questions left to play. Loaded from (id, category) rows, kept
+  in step with the question writes of this process and reloaded after
+  `ttl` seconds for the writes of other processes.
+  '''
+  def __init__(self, ttl, rng=None):
+    self.ttl = ttl
+    self.rng = rng or random.Random()
+    self.lock = threading.Lock()
+    self.loaded_at = None
+    self.all = IdSet()
+    self.categories = {}
+    self.category_of = {}
+
+  def ready(self):
+    return self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl
+
+  def invalidate(self):
+    self.loaded_at = None
+
+  def load(self, rows):
+    pool = QuestionPool(self.ttl)
+    for id, category in rows:
+      pool._add(id, category)
+    with self.lock:
+      self.all, self.categories, self.category_of = pool.all, pool.categories, pool.category_of
+      self.loaded_at = time.monotonic()
+
+  def _add(self, id, category):
+    self._discard(id)
+    self.all.add(id)
+    self.categories.setdefault(category, IdSet()).add(id)
+    self.category_of[id] = category
+
+  def _discard(self, id):
+    if id in self.category_of:
+      self.all.discard(id)
+      self.categories[self.category_of.pop(id)].discard(id)
+
+  def add(self, id, category):
+    with self.lock:
+      self._add(id, category)
+
+  def discard(self, id):
+    with self.lock:
+      self._discard(id)
+
+  def shuffled(self, category, count):
+    # up to `count` question ids of `category` in a random order
+    with self.lock:
+      ids = self.all if category == ALL_CATEGORIES else self.categories.get(category)
+      if ids is None:
+        return []
+      return self.rng.sample(ids.ids, min(count, len(ids)))
+
+  def pick(self, category, exclude):
+    # a random question id of `category` that is not in `exclude`, or None
+    with self.lock:
+      ids = self.all if category == ALL_CATEGORIES else self.categories.get(category)
+      if ids is None:
+        return None
+      return ids.sample(exclude, self.rng)
+
+
+class QuizSession(object):
+  __slots__ = ('category', 'order', 'position', 'played_at')
+
+  def __init__(self, category, ids, played_at):
+    self.category = category
+    self.order = array('q', ids)
+    self.position = 0
+    self.played_at = played_at
+
+
+class QuizSessions(object):
+  '''
+  Quizzes being played by token, each the question ids it will play in the
+  order they were shuffled in when it started, and how far it got. At most
+  `capacity` are kept, the least recently played dropped first, and a quiz
+  not played for `ttl` seconds expires.
+  '''
+  def __init__(self, capacity, ttl, clock=time.monotonic):
+    self.capacity = capacity
+    self.ttl = ttl
+    self.clock = clock
+    self.lock = threading.Lock()
+    self.sessions = OrderedDict()
+
+  def __len__(self):
+    return len(self.sessions)
+
+  def _expire(self, now):
+    # least recently played first, so the expired ones are in front
+    while self.sessions:
+      token, session = next(iter(self.sessions.items()))
+      if now - session.played_at < self.ttl:
+        break
+      del self.sessions[token]
+
+  def start(self, category, ids):
+    token = secrets.token_urlsafe(16)
+    with self.lock:
+      now = self.clock()
+      self._expire(now)
+      self.sessions[token] = QuizSession(category, ids, now)
+      while len(self.sessions) > self.capacity:
+        self.sessions.popitem(last=False)
+    return token
+
+  def next(self, token):
+    # (category, next question id or None once all were played) of quiz
+    # `token`, KeyError when there is no such quiz or it expired
+    with self.lock:
+      now = self.clock()
+      self._expire(now)
+      session = self.sessions[token]
+      session.played_at = now
+      self.sessions.move_to_end(token)
+      if session.position == len(session.order):
+        return session.category, None
+      session.position += 1
+      return session.category, session.order[session.position - 1]
+
+  def end(self, token):
+    with self.lock:
+      del self.sessions[token]
@@ -0,0 +1,122 @@
+import heapq
+import math
+import re
+import threading
+import time
+from collections import Counter
+
+WORD = re.compile(r'[a-z0-9]+')
+STOP_WORDS = frozenset('''
+  a an and are as at be by did do does for from has have how in is it its of on or s t that the this to was
+  were what when where which who whom whose why with
+'''.split())
+
+
+def stem(word):
+  '''
+  A light suffix stripper, so that "paintings" finds "painting" and
+  "painted" finds "paints". Queries go through it too, it only has to be
+  consistent, not correct English.
+  '''
+  if len(word) <= 3 or word.isdigit():
+    return word
+  if word.endswith('ies') and len(word) > 4:
+    return word[:-3] + 'y'
+  if word.endswith(('sses', 'xes', 'zes', 'ches', 'shes')):
+    return word[:-2]
+  if word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+    word = word[:-1]
+  for suffix in ('ing', 'ed'):
+    if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+      word = word[:-len(suffix)]
+      if len(word) > 3 and word[-1] == word[-2] and word[-1] not in 'lsz':
+        word = word[:-1]
+      break
+  if word.endswith('ly') and len(word) > 5:
+    word = word[:-2]
+  return word
+
+
+def tokenize(text):
+  # the stemmed terms of `text`, stop words left out
+  return [stem(word) for word in WORD.findall((text or '').lower()) if word not in STOP_WORDS]
+
+
+class SearchIndex(object):
+  '''
+  An inverted index of question texts ranked with BM25. Loaded from rows of
+  (id, text, ...), kept in step with the question writes of this process
+  and reloaded after `ttl` seconds for the writes of other processes.
+  '''
+  def __init__(self, ttl, k1=1.2, b=0.75):
+    self.ttl = ttl
+    self.k1 = k1
+    self.b = b
+    self.lock = threading.Lock()
+    self.loaded_at = None
+    self.postings = {}
+    self.lengths = {}
+    self.total_length = 0
+
+  def ready(self):
+    return self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl
+
+  def invalidate(self):
+    self.loaded_at = None
+
+  def load(self, rows):
+    index = SearchIndex(self.ttl, self.k1, self.b)
+    for row in rows:
+      index._add(row[0], row[1:])
+    with self.lock:
+      self.postings, self.lengths, self.total_length = index.postings, index.lengths, index.total_length
+      self.loaded_at = time.monotonic()
+
+  def _add(self, id, texts):
+    self._discard(id)
+    terms = Counter(term for text in texts for term in tokenize(text))
+    for term, frequency in terms.items():
+      self.postings.setdefault(term, {})[id] = frequency
+    # the terms are kept to find the postings again on discard
+    self.lengths[id] = (sum(terms.values()), tuple(terms))
+    self.total_length += self.lengths[id][0]
+
+  def _discard(self, id):
+    length, terms = self.lengths.pop(id, (0, ()))
+    self.total_length -= length
+    for term in terms:
+      postings = self.postings[term]
+      del postings[id]
+      if not postings:
+        del self.postings[term]
+
+  def add(self, id, *texts):
+    with self.lock:
+      self._add(id, texts)
+
+  def discard(self, id):
+    with self.lock:
+      self._discard(id)
+
+  def scores(self, query):
+    # BM25 score of every question matching a term of `query`
+    scores = {}
+    k1, b = self.k1, self.b
+    with self.lock:
+      if not self.lengths:
+        return scores
+      average_length = self.total_length / float(len(self.lengths))
+      for term in set(tokenize(query)):
+        postings = self.postings.get(term, {})
+        idf = math.log(1 + (len(self.lengths) - len(postings) + 0.5) / (len(postings) + 0.5))
+        for id, frequency in postings.items():
+          length = self.lengths[id][0]
+          scores[id] = scores.get(id, 0.0) + idf * frequency * (k1 + 1) / (
+            frequency + k1 * (1 - b + b * length / average_length))
+    return scores
+
+  def search(self, query, start, stop):
+    # (number of matches, ids of matches start..stop by rank), ties by id
+    scores = self.scores(query)
+    ranked = heapq.nsmallest(stop, scores, key=lambda id: (-scores[id], id))
+    return len(scores), ranked[start:stop]
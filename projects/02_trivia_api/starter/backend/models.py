@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, create_engine, event, DDL
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -11,13 +11,22 @@ db = SQLAlchemy()
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+setup_db(app, engine=engine)
+    binds it to an engine or connection made elsewhere instead, like an
+    in-memory SQLite database or a connection in a test's transaction
 '''
-def setup_db(app, database_path=database_path):
-    app.config["SQLALCHEMY_DATABASE_URI"] = database_path
+def setup_db(app, database_path=database_path, engine=None):
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_path if engine is None else str(engine.engine.url)
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.app = app
     db.init_app(app)
-    db.create_all()
+    db.session.remove()
+    if engine is None:
+        db.session = db.create_scoped_session()
+        db.create_all()
+    else:
+        db.session = db.create_scoped_session({'bind': engine, 'binds': {}})
+        db.Model.metadata.create_all(bind=engine)
 
 '''
 Question
@@ -58,6 +67,12 @@ class Question(db.Model):
       'difficulty': self.difficulty
     }
 
+# for the PostgreSQL full-text search of questions, the same expression as
+# the search queries so that it is used
+event.listen(Question.__table__, 'after_create', DDL(
+  "CREATE INDEX ix_questions_search ON questions USING gin "
+  "(to_tsvector('english', coalesce(question, '') || ' ' || coalesce(answer, '')))").execute_if(dialect='postgresql'))
+
 '''
 Category
 
@@ -10,6 +10,7 @@ class QuizView extends Component {
     super();
     this.state = {
         quizCategory: null,
+        quizToken: null,
         previousQuestions: [], 
         showAnswer: false,
         categories: {},
@@ -36,7 +37,27 @@ class QuizView extends Component {
   }
 
   selectCategory = ({type, id=0}) => {
-    this.setState({quizCategory: {type, id}}, this.getNextQuestion)
+    $.ajax({
+      url: '/quizzes/sessions', 
+      type: "POST",
+      dataType: 'json',
+      contentType: 'application/json',
+      data: JSON.stringify({
+        quiz_category: {type, id}
+      }),
+      xhrFields: {
+        withCredentials: true
+      },
+      crossDomain: true,
+      success: (result) => {
+        this.setState({quizCategory: {type, id}, quizToken: result.token}, this.getNextQuestion)
+        return;
+      },
+      error: (error) => {
+        alert('Unable to start the quiz. Please try your request again')
+        return;
+      }
+    })
   }
 
   handleChange = (event) => {
@@ -48,14 +69,9 @@ class QuizView extends Component {
     if(this.state.currentQuestion.id) { previousQuestions.push(this.state.currentQuestion.id) }
 
     $.ajax({
-      url: '/quizzes', 
+      url: `/quizzes/sessions/${this.state.quizToken}/next`, 
       type: "POST",
       dataType: 'json',
-      contentType: 'application/json',
-      data: JSON.stringify({
-        previous_questions: previousQuestions,
-        quiz_category: this.state.quizCategory
-      }),
       xhrFields: {
         withCredentials: true
       },
@@ -90,6 +106,7 @@ class QuizView extends Component {
   restartGame = () => {
     this.setState({
       quizCategory: null,
+      quizToken: null,
       previousQuestions: [], 
       showAnswer: false,
       numCorrect: 0,